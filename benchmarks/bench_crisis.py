@@ -0,0 +1,96 @@
+"""Micro-benchmark for the crisis matcher as the lexicon grows.
+
+    python benchmarks/bench_crisis.py --messages 20000 --sizes 12 100 1000 5000
+
+For each lexicon size it reports the build time and the mean / p99 time per
+message of `CrisisMatcher.matches`, next to the old approach (one lowercased
+substring scan per keyword) for reference.
+"""
+import argparse
+import os
+import random
+import statistics
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crisis import DEFAULT_KEYWORDS, CrisisMatcher  # noqa: E402
+
+FILLER = (
+    "i feel so tired today and my exams are next week but i am trying to stay calm "
+    "my friends say i should take a break and go for a walk maybe listen to music "
+    "sometimes everything feels heavy and i do not know who to talk to about it"
+).split()
+
+
+def random_word(rng):
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 9)))
+
+
+def synthetic_lexicon(size, rng):
+    """The real keywords padded with random one- to four-word phrases."""
+    phrases = list(DEFAULT_KEYWORDS)
+    while len(phrases) < size:
+        phrases.append(" ".join(random_word(rng) for _ in range(rng.randint(1, 4))))
+    return phrases[:max(size, 1)]
+
+
+def synthetic_corpus(count, rng):
+    """Chat-sized messages; roughly one in fifty contains a crisis phrase."""
+    corpus = []
+    for _ in range(count):
+        words = [rng.choice(FILLER) for _ in range(rng.randint(5, 60))]
+        if rng.random() < 0.02:
+            words.insert(rng.randrange(len(words)), rng.choice(DEFAULT_KEYWORDS))
+        corpus.append(" ".join(words).capitalize() + rng.choice([".", "!", "?", "..."]))
+    return corpus
+
+
+def naive_check(keywords, text):
+    for keyword in keywords:
+        if keyword in text.lower():
+            return True
+    return False
+
+
+def time_per_message(check, corpus):
+    samples = []
+    for text in corpus:
+        start = time.perf_counter()
+        check(text)
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return statistics.mean(samples), samples[int(len(samples) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[12, 100, 1000, 5000])
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--skip-naive", action="store_true", help="Only time the compiled matcher")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    corpus = synthetic_corpus(args.messages, rng)
+    print(f"{args.messages} messages, mean length {statistics.mean(len(t) for t in corpus):.0f} chars\n")
+    print(f"{'phrases':>8} {'build ms':>9} {'mean µs':>9} {'p99 µs':>9} {'naive mean µs':>14}")
+
+    for size in args.sizes:
+        lexicon = synthetic_lexicon(size, rng)
+        start = time.perf_counter()
+        matcher = CrisisMatcher(lexicon)
+        build_ms = (time.perf_counter() - start) * 1000
+        mean, p99 = time_per_message(matcher.matches, corpus)
+
+        naive = ""
+        if not args.skip_naive:
+            naive_mean, _ = time_per_message(lambda text: naive_check(lexicon, text), corpus)
+            naive = f"{naive_mean * 1e6:.1f}"
+        print(f"{len(matcher):>8} {build_ms:>9.1f} {mean * 1e6:>9.1f} {p99 * 1e6:>9.1f} {naive:>14}")
+
+
+if __name__ == "__main__":
+    main()
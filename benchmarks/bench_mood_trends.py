@@ -0,0 +1,87 @@
+"""Benchmark the mood trend engine on a large synthetic log.
+
+    python benchmarks/bench_mood_trends.py --rows 1000000
+
+Fills a throwaway mood database, then times the one-off cold aggregation,
+an incremental refresh after new rows arrive, a restart from the cached
+aggregates, and building the sidebar trend chart.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mood_analytics import VALENCE, MoodAnalytics  # noqa: E402
+from mood_store import MoodStore  # noqa: E402
+
+
+def fill(store, rows, days, users, rng):
+    moods = list(VALENCE)
+    start = datetime.now() - timedelta(days=days)
+    batch = []
+    for _ in range(rows):
+        ts = start + timedelta(seconds=rng.randrange(days * 86400))
+        batch.append((ts.strftime("%Y-%m-%d %H:%M:%S"), rng.choice(moods), None, f"user{rng.randrange(users)}"))
+        if len(batch) == 50_000:
+            with store._conn:
+                store._write_rows(batch)
+            batch = []
+    if batch:
+        with store._conn:
+            store._write_rows(batch)
+
+
+def timed(label, func):
+    start = time.perf_counter()
+    result = func()
+    print(f"{label:<34} {(time.perf_counter() - start) * 1000:>9.1f} ms")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--days", type=int, default=730)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "mood_log.db")
+        cache_path = os.path.join(tmp, "mood_daily.json")
+        store = MoodStore(db_path)
+        timed(f"fill {args.rows} rows", lambda: fill(store, args.rows, args.days, args.users, rng))
+
+        analytics = MoodAnalytics(db_path, cache_path)
+        timed("cold aggregation (one-off)", analytics.refresh)
+
+        fill(store, 1000, 2, args.users, rng)
+        timed("incremental refresh (+1000 rows)", analytics.refresh)
+        timed("refresh with nothing new", analytics.refresh)
+        timed("write aggregate cache", analytics.save)
+
+        restarted = timed("restart from cached aggregates", lambda: MoodAnalytics(db_path, cache_path))
+        timed("  ... then refresh", restarted.refresh)
+
+        trend = timed("trend, all users", lambda: restarted.trend())
+        timed("trend, one user", lambda: restarted.trend(user_id="user0"))
+        timed("trend, cached", lambda: restarted.trend(user_id="user0"))
+        print(f"{'points plotted':<34} {len(trend):>9}")
+
+        try:
+            import plotly.express as px
+        except ImportError:
+            print("plotly not installed; skipping chart build")
+        else:
+            timed("build plotly figure", lambda: px.line(x=trend.index, y=trend["rolling_valence"]).to_json())
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
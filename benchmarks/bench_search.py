@@ -0,0 +1,92 @@
+"""Benchmark the full-text search index on a large synthetic history.
+
+    python benchmarks/bench_search.py --sessions 5000 --messages 30
+
+Writes the sessions with chat_store into a throwaway directory, then times
+the one-off rebuild, the incremental update done after each chat save
+(two new messages), and ranked searches for common, rare and prefix terms.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chat_store  # noqa: E402
+from search_index import SearchIndex  # noqa: E402
+
+WORDS = (
+    "exam stress sleep roommate family friend lonely tired anxious happy project deadline "
+    "grades teacher class walk music breathe panic calm weekend home mother father sister "
+    "internship interview money rent job future worried excited proud sad angry confused"
+).split()
+FILLER = "i feel like today was the really just so and but it that my with about".split()
+
+
+def sentence(rng):
+    return " ".join(rng.choice(FILLER if rng.random() < 0.6 else WORDS) for _ in range(rng.randint(8, 25)))
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, round(q / 100 * len(ordered)) - 1))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=5000)
+    parser.add_argument("--messages", type=int, default=30)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        history_dir = os.path.join(tmp, "chat_history")
+        start = time.perf_counter()
+        for i in range(args.sessions):
+            messages = [
+                {"role": "user" if j % 2 == 0 else "assistant", "content": sentence(rng), "timestamp": "10:00 AM"}
+                for j in range(args.messages)
+            ]
+            chat_store.save_session(history_dir, f"{i:014d}", f"Chat {i}", "2024-01-01 10:00", messages)
+        print(f"wrote {args.sessions} sessions x {args.messages} messages in {time.perf_counter() - start:.1f}s")
+
+        index = SearchIndex(os.path.join(tmp, "search_index.db"))
+        start = time.perf_counter()
+        index.rebuild(history_dir)
+        print(f"rebuild                         {time.perf_counter() - start:8.2f} s")
+
+        session_id = f"{args.sessions - 1:014d}"
+        messages = chat_store.read_session(chat_store.log_path(history_dir, session_id))["messages"]
+        updates = []
+        for _ in range(50):
+            messages = messages + [
+                {"role": "user", "content": sentence(rng), "timestamp": "10:01 AM"},
+                {"role": "assistant", "content": sentence(rng), "timestamp": "10:01 AM"},
+            ]
+            start = time.perf_counter()
+            index.index_session(session_id, "Chat", "2024-01-01 10:00", messages)
+            updates.append(time.perf_counter() - start)
+        print(f"update after a save, p50/p95    {percentile(updates, 50) * 1e3:8.2f} / {percentile(updates, 95) * 1e3:.2f} ms")
+
+        for label, make_query in (
+            ("common word", lambda: rng.choice(WORDS)),
+            ("two words", lambda: f"{rng.choice(WORDS)} {rng.choice(WORDS)}"),
+            ("prefix", lambda: rng.choice(WORDS)[:3]),
+        ):
+            timings, hits = [], 0
+            for _ in range(args.queries):
+                query = make_query()
+                start = time.perf_counter()
+                hits += len(index.search(query, limit=10))
+                timings.append(time.perf_counter() - start)
+            print(f"search, {label:<13} p50/p95    {percentile(timings, 50) * 1e3:8.2f} / "
+                  f"{percentile(timings, 95) * 1e3:.2f} ms  ({hits / args.queries:.1f} hits)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""Measure cold start and rerun cost of the app.
+
+    python benchmarks/bench_startup.py --cold-runs 5 --reruns 50 --output bench_startup.json
+
+Cold start: each run is a fresh Python process that loads main.py with
+Streamlit's AppTest and renders the first page, so it includes every
+import and the cached-resource setup. The report also lists which heavy
+modules (pandas, plotly.express) a first visit ended up importing.
+
+Reruns: in one process, a session opens the Stress Relief tab and pops
+bubbles, the cheapest interaction the app has. Each pop is timed twice
+over: as a full script rerun (what AppTest does for every click) and, when
+the app has a `bubble_wrap` fragment, as a rerun of just that fragment,
+which is what a browser sends for a click inside it. `--populated` starts
+the session with a chat and a mood history, so a full rerun also draws the
+mood chart and the message list. Both are reported as p50/p95 in
+milliseconds. Point `--app` at an older checkout's main.py to
+compare.
+"""
+import argparse
+import contextlib
+import functools
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Streamlit itself imports the plotly package; plotly.express is what pulls in pandas
+HEAVY_MODULES = ["pandas", "plotly.express"]
+MOODS = ["joy", "sadness", "fear", "love", "anger"]
+
+COLD_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(sys.argv[1], default_timeout=120)
+at.secrets["GEMINI_API_KEY"] = "bench"
+at.run()
+elapsed = time.perf_counter() - started
+print(json.dumps({
+    "seconds": elapsed,
+    "error": str(at.exception[0].value) if at.exception else None,
+    "loaded": [m for m in sys.argv[2:] if m in sys.modules],
+}))
+"""
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, round(q / 100 * len(ordered)) - 1))]
+
+
+def summarize(values):
+    return {
+        "n": len(values),
+        "p50_ms": round(percentile(values, 50) * 1000, 1),
+        "p95_ms": round(percentile(values, 95) * 1000, 1),
+        "mean_ms": round(statistics.mean(values) * 1000, 1),
+    }
+
+
+def cold_starts(app_path, runs, workdir):
+    results = []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", COLD_SCRIPT, app_path, *HEAVY_MODULES],
+            cwd=workdir, capture_output=True, text=True, check=True,
+        ).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        if result["error"]:
+            raise RuntimeError(f"app raised on first run: {result['error']}")
+        results.append(result)
+    return results
+
+
+@contextlib.contextmanager
+def fragment_scope(fragment_ids):
+    """Within the block, AppTest runs rerun only the given fragments instead of the whole script."""
+    from streamlit.testing.v1 import local_script_runner
+
+    rerun_data = local_script_runner.RerunData
+    local_script_runner.RerunData = functools.partial(rerun_data, fragment_id_queue=fragment_ids)
+    try:
+        yield
+    finally:
+        local_script_runner.RerunData = rerun_data
+
+
+def reruns(app_path, count, fragment=None, populated=False):
+    """Seconds per bubble pop; with `fragment`, each pop reruns only that fragment."""
+    from streamlit.errors import StreamlitAPIException
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(app_path, default_timeout=120)
+    at.secrets["GEMINI_API_KEY"] = "bench"
+    if populated:
+        at.session_state["mood_history"] = [MOODS[i % len(MOODS)] for i in range(20)]
+        at.session_state["messages"] = [
+            {"role": "user" if i % 2 == 0 else "assistant", "content": f"Message {i} " * 20, "timestamp": "09:00 AM"}
+            for i in range(40)
+        ]
+    at.run()
+    at.radio[0].set_value("🧼 Bubble Wrap").run()
+    scope = contextlib.nullcontext()
+    if fragment:
+        try:
+            scope = fragment_scope(at._fragment_storage.resolve_target(fragment))
+        except StreamlitAPIException:
+            # An older checkout without fragments
+            return None
+    timings = []
+    with scope:
+        for i in range(count):
+            if i % 20 == 0 and i:
+                _reset(at)
+            started = time.perf_counter()
+            at.button(key=f"bubble_{i % 20}").click().run()
+            timings.append(time.perf_counter() - started)
+            if at.exception:
+                raise RuntimeError(f"app raised on rerun {i}: {at.exception[0].value}")
+    return timings
+
+
+def _reset(at):
+    for button in at.button:
+        if button.label == "Reset Bubbles":
+            button.click().run()
+            return
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--app", default=os.path.join(ROOT, "main.py"))
+    parser.add_argument("--cold-runs", type=int, default=5)
+    parser.add_argument("--reruns", type=int, default=50)
+    parser.add_argument("--populated", action="store_true", help="Time reruns with a chat and mood history loaded")
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+    app_path = os.path.abspath(args.app)
+
+    with tempfile.TemporaryDirectory(prefix="serenity-startup-") as workdir:
+        cwd = os.getcwd()
+        os.environ["SERENITY_METRICS_DIR"] = ""
+        cold = cold_starts(app_path, args.cold_runs, workdir)
+        os.chdir(workdir)
+        try:
+            warm = reruns(app_path, args.reruns, populated=args.populated)
+            partial = reruns(app_path, args.reruns, fragment="bubble_wrap", populated=args.populated)
+        finally:
+            os.chdir(cwd)
+
+    report = {
+        "app": app_path,
+        "cold_start": summarize([r["seconds"] for r in cold]),
+        "heavy_modules_on_first_page": cold[0]["loaded"],
+        "populated": args.populated,
+        "rerun": summarize(warm),
+        "fragment_rerun": summarize(partial) if partial else None,
+    }
+    print(f"cold start  p50 {report['cold_start']['p50_ms']:>8.1f} ms  p95 {report['cold_start']['p95_ms']:>8.1f} ms")
+    print(f"rerun       p50 {report['rerun']['p50_ms']:>8.1f} ms  p95 {report['rerun']['p95_ms']:>8.1f} ms")
+    if partial:
+        print(f"fragment    p50 {report['fragment_rerun']['p50_ms']:>8.1f} ms  p95 {report['fragment_rerun']['p95_ms']:>8.1f} ms")
+    else:
+        print("fragment    n/a (no bubble_wrap fragment in this app)")
+    print(f"heavy modules imported by the first page: {', '.join(report['heavy_modules_on_first_page']) or 'none'}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""Benchmark whole chat turns against a local fake Gemini server.
+
+    python benchmarks/bench_turns.py --history-sizes 0 100 1000 --turns 20 --output bench_turns.json
+
+No API key is needed: the app is pointed at `fake_gemini.FakeGemini` via
+SERENITY_GEMINI_BASE_URL and driven through Streamlit's AppTest, so every
+turn runs the real code path (crisis check, emotion detection, prompt
+build, reply streaming, save_chat_session, save_mood) in a throwaway
+working directory. For each chat_history size, `--sessions` conversations
+of `--turns` turns are played, and the report gives p50/p95 of
+time-to-first-token, total turn time, save_chat_session time and the full
+rerun as seen by the browser, grouped by how far into the conversation the
+turn was, plus how many redraws (and bytes) each streamed reply took. The JSON output (with the settings and git commit) can be diffed
+across commits to catch regressions.
+"""
+import argparse
+import atexit
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import chat_store  # noqa: E402
+import identity  # noqa: E402
+from fake_gemini import FakeGemini  # noqa: E402
+
+MESSAGES = [
+    "I have three exams next week and I can't focus on anything",
+    "my roommate keeps ignoring me and it makes me feel invisible",
+    "today was actually a pretty good day, I finished my project",
+    "I keep worrying that I'm going to fail my semester",
+    "I miss my family a lot since I moved for college",
+    "I'm so tired of everyone expecting me to be perfect",
+    "I got into the internship I applied for!",
+    "sometimes I feel like nobody really understands me",
+]
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(values):
+    return {
+        "n": len(values),
+        "p50_ms": round(percentile(values, 50) * 1000, 2) if values else None,
+        "p95_ms": round(percentile(values, 95) * 1000, 2) if values else None,
+        "mean_ms": round(statistics.mean(values) * 1000, 2) if values else None,
+    }
+
+
+def fill_history(history_dir, sessions, messages_per_session):
+    """Write `sessions` finished conversations the way the app would."""
+    for i in range(sessions):
+        messages = [
+            {
+                "role": "user" if j % 2 == 0 else "assistant",
+                "content": MESSAGES[j % len(MESSAGES)],
+                "timestamp": "10:00 AM",
+            }
+            for j in range(messages_per_session)
+        ]
+        chat_store.save_session(
+            history_dir, f"2020{i:010d}", f"Past chat {i}",
+            datetime.now().isoformat(timespec="seconds"), messages,
+        )
+
+
+def play_conversation(app_path, turns, run_tag, rng, token):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(app_path, default_timeout=120)
+    at.secrets["GEMINI_API_KEY"] = "bench"
+    # Open the page as the user whose history was filled
+    at.query_params[identity.TOKEN_PARAM] = token
+    at.run()
+    results = []
+    for turn in range(turns):
+        text = f"{rng.choice(MESSAGES)} ({run_tag} turn {turn})"
+        started = time.perf_counter()
+        at.chat_input[0].set_value(text).run()
+        rerun = time.perf_counter() - started
+        if at.exception:
+            raise RuntimeError(f"app raised on turn {turn}: {at.exception[0].value}")
+        timing = at.session_state["turn_timings"][-1]
+        results.append({
+            "turn": turn + 1,
+            "ttft": timing["ttft"],
+            "total": timing["total"],
+            "save": timing.get("save", 0.0),
+            "rerun": rerun,
+            "stream_flushes": timing.get("stream_flushes", 0),
+            "stream_bytes": timing.get("stream_bytes", 0),
+        })
+    return results
+
+
+def bucket_label(turn, size):
+    start = (turn - 1) // size * size + 1
+    return f"{start}-{start + size - 1}"
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--history-sizes", type=int, nargs="+", default=[0, 100, 1000],
+                        help="Past sessions of the benchmark user before each run")
+    parser.add_argument("--history-messages", type=int, default=20, help="Messages per past session")
+    parser.add_argument("--sessions", type=int, default=2, help="Conversations played per history size")
+    parser.add_argument("--turns", type=int, default=20, help="Turns per conversation")
+    parser.add_argument("--bucket", type=int, default=5, help="Group turns into buckets of this many")
+    parser.add_argument("--first-token-ms", type=float, default=300)
+    parser.add_argument("--chunk-ms", type=float, default=40)
+    parser.add_argument("--chunks", type=int, default=12)
+    parser.add_argument("--emotion-ms", type=float, default=250)
+    parser.add_argument("--summary-ms", type=float, default=500)
+    parser.add_argument("--mode", choices=["parallel", "serial"], default="parallel")
+    parser.add_argument("--local-threshold", type=float, default=0.75,
+                        help="SERENITY_EMOTION_LOCAL_THRESHOLD (above 1 always asks the fake Gemini)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_turns.json")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    app_path = os.path.join(ROOT, "main.py")
+    output = os.path.abspath(args.output)
+    server = FakeGemini(
+        first_token_delay=args.first_token_ms / 1000,
+        chunk_interval=args.chunk_ms / 1000,
+        chunks=args.chunks,
+        emotion_delay=args.emotion_ms / 1000,
+        generate_delay=args.summary_ms / 1000,
+        seed=args.seed,
+    ).start()
+    os.environ.update({
+        "SERENITY_GEMINI_BASE_URL": server.url,
+        "SERENITY_TURN_MODE": args.mode,
+        "SERENITY_EMOTION_LOCAL_THRESHOLD": str(args.local_threshold),
+        # The benchmark measures the app, not the quota
+        "SERENITY_GEMINI_RPM": "1000000",
+        # Stage timings stay in memory; the working directories are deleted at exit
+        "SERENITY_METRICS_DIR": "",
+        # Known signing secret, so the benchmark can issue the browser token it fills history for
+        "SERENITY_SECRET": "serenity-bench",
+    })
+    secret = identity.load_secret(os.environ["SERENITY_SECRET"])
+
+    import streamlit as st
+
+    report = {
+        "commit": git_commit(),
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "settings": vars(args),
+        "runs": [],
+    }
+    cwd = os.getcwd()
+    try:
+        for history_size in args.history_sizes:
+            workdir = tempfile.mkdtemp(prefix="serenity-bench-")
+            # Registered before this run's stores exist, so it runs after their exit handlers save
+            # into it (atexit runs handlers last in, first out)
+            atexit.register(shutil.rmtree, workdir, ignore_errors=True)
+            os.chdir(workdir)
+            # Stores cached by the previous run point at the previous directory
+            st.cache_resource.clear()
+            try:
+                token = identity.issue_token(secret)
+                fill_started = time.perf_counter()
+                fill_history(chat_store.user_history_dir(identity.browser_key(secret, token)),
+                             history_size, args.history_messages)
+                fill_time = time.perf_counter() - fill_started
+
+                turns = []
+                for session in range(args.sessions):
+                    turns += play_conversation(app_path, args.turns, f"h{history_size}s{session}", rng, token)
+
+                buckets = {}
+                for row in turns:
+                    buckets.setdefault(bucket_label(row["turn"], args.bucket), []).append(row)
+                run = {
+                    "history_sessions": history_size,
+                    "history_fill_seconds": round(fill_time, 3),
+                    "overall": {key: summarize([r[key] for r in turns]) for key in ("ttft", "total", "save", "rerun")},
+                    "stream": {
+                        "flushes_per_reply": round(statistics.mean(r["stream_flushes"] for r in turns), 1),
+                        "bytes_per_reply": round(statistics.mean(r["stream_bytes"] for r in turns)),
+                    },
+                    "by_turn": {
+                        label: {key: summarize([r[key] for r in rows]) for key in ("ttft", "total", "save", "rerun")}
+                        for label, rows in buckets.items()
+                    },
+                }
+                report["runs"].append(run)
+                overall = run["overall"]
+                print(f"history={history_size:>6}  "
+                      f"ttft p50/p95 {overall['ttft']['p50_ms']:>7.1f}/{overall['ttft']['p95_ms']:>7.1f} ms  "
+                      f"total {overall['total']['p50_ms']:>7.1f}/{overall['total']['p95_ms']:>7.1f} ms  "
+                      f"save {overall['save']['p50_ms']:>6.2f}/{overall['save']['p95_ms']:>6.2f} ms  "
+                      f"rerun {overall['rerun']['p50_ms']:>7.1f}/{overall['rerun']['p95_ms']:>7.1f} ms  "
+                      f"reply redraws {run['stream']['flushes_per_reply']} ({run['stream']['bytes_per_reply']} bytes)")
+                for label, stats in run["by_turn"].items():
+                    print(f"    turns {label:>7}: ttft p95 {stats['ttft']['p95_ms']:>7.1f} ms  "
+                          f"total p95 {stats['total']['p95_ms']:>7.1f} ms  save p95 {stats['save']['p95_ms']:>6.2f} ms")
+            finally:
+                os.chdir(cwd)
+    finally:
+        server.stop()
+
+    report["fake_server_requests"] = dict(server.stats)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nresults written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Compare the local emotion classifier against Gemini labels.
+
+    # Score against texts already labelled by Gemini (JSONL with "text" and "label")
+    python benchmarks/compare_emotion.py --data labelled.jsonl
+
+    # Label plain texts (one per line) with Gemini first, and keep the labels
+    GEMINI_API_KEY=... python benchmarks/compare_emotion.py --texts texts.txt --gemini --save-labels labelled.jsonl
+
+Reports overall agreement, and for each confidence threshold the share of
+texts the local tier would answer on its own and how often it agrees with
+Gemini on that share. Latency is reported for single and batch local
+scoring, and for Gemini when it was called.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from local_emotion import LocalEmotionClassifier  # noqa: E402
+
+GEMINI_MODEL = "gemini-flash-latest"
+
+
+def gemini_label(client, text):
+    """Same prompt as get_ai_emotion in main.py."""
+    from google.genai import types
+
+    prompt = f"""
+    Analyze the emotion in this text: "{text}"
+    Choose ONE from: joy, sadness, anger, fear, surprise, love, disgust.
+    Return the result in JSON format: {{"label": "emotion", "score": 0.95}}
+    """
+    res = client.models.generate_content(
+        model=GEMINI_MODEL,
+        contents=prompt,
+        config=types.GenerateContentConfig(response_mime_type="application/json"),
+    )
+    return str(json.loads(res.text)["label"]).lower()
+
+
+def load_labelled(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def label_with_gemini(texts):
+    from google import genai
+
+    client = genai.Client(api_key=os.environ["GEMINI_API_KEY"])
+    rows, latencies = [], []
+    for text in texts:
+        start = time.perf_counter()
+        try:
+            label = gemini_label(client, text)
+        except Exception as e:
+            print(f"skipping {text[:40]!r}: {e}", file=sys.stderr)
+            continue
+        latencies.append(time.perf_counter() - start)
+        rows.append({"text": text, "label": label})
+    return rows, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--data", help="JSONL of {\"text\", \"label\"} with Gemini labels")
+    source.add_argument("--texts", help="Plain text file, one message per line (needs --gemini)")
+    parser.add_argument("--gemini", action="store_true", help="Label --texts with Gemini (GEMINI_API_KEY)")
+    parser.add_argument("--save-labels", help="Write the Gemini labels to this JSONL file")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.5, 0.6, 0.7, 0.75, 0.8, 0.9])
+    args = parser.parse_args()
+
+    gemini_latencies = []
+    if args.data:
+        rows = load_labelled(args.data)
+    else:
+        if not args.gemini:
+            parser.error("--texts needs --gemini to obtain reference labels")
+        with open(args.texts, "r", encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+        rows, gemini_latencies = label_with_gemini(texts)
+        if args.save_labels:
+            with open(args.save_labels, "w", encoding="utf-8") as f:
+                for row in rows:
+                    f.write(json.dumps(row, ensure_ascii=False) + "\n")
+    if not rows:
+        sys.exit("no labelled texts")
+
+    classifier = LocalEmotionClassifier()
+    texts = [row["text"] for row in rows]
+    reference = [row["label"] for row in rows]
+
+    single = []
+    for text in texts:
+        start = time.perf_counter()
+        classifier.classify(text)
+        single.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    predictions = classifier.classify_batch(texts)
+    batch_time = time.perf_counter() - start
+
+    agree = sum(p["label"] == r for p, r in zip(predictions, reference))
+    print(f"{len(rows)} texts, overall agreement with Gemini: {agree / len(rows):.1%}\n")
+    print(f"{'threshold':>9} {'local share':>12} {'agreement':>10}")
+    for threshold in args.thresholds:
+        kept = [(p, r) for p, r in zip(predictions, reference) if p["score"] >= threshold]
+        share = len(kept) / len(rows)
+        accuracy = sum(p["label"] == r for p, r in kept) / len(kept) if kept else float("nan")
+        print(f"{threshold:>9.2f} {share:>12.1%} {accuracy:>10.1%}")
+
+    print("\nlatency per text")
+    print(f"  local, one at a time: {statistics.mean(single) * 1e6:,.0f} µs")
+    print(f"  local, batched:       {batch_time / len(texts) * 1e6:,.0f} µs")
+    if gemini_latencies:
+        print(f"  gemini:               {statistics.mean(gemini_latencies) * 1e3:,.0f} ms "
+              f"(p95 {sorted(gemini_latencies)[int(len(gemini_latencies) * 0.95) - 1] * 1e3:,.0f} ms)")
+
+
+if __name__ == "__main__":
+    main()
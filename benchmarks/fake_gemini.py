@@ -0,0 +1,169 @@
+"""A local stand-in for the Gemini REST API, for benchmarks.
+
+    from fake_gemini import FakeGemini
+    with FakeGemini(first_token_delay=0.3, chunk_interval=0.04) as server:
+        os.environ["SERENITY_GEMINI_BASE_URL"] = server.url
+
+Serves the two endpoints the app uses:
+
+- `:streamGenerateContent?alt=sse` (replies): waits `first_token_delay`,
+  then sends `chunks` text chunks `chunk_interval` apart.
+- `:generateContent`: requests asking for `application/json` (emotion
+  detection) get `{"label", "score"}` after `emotion_delay`; anything else
+  (summaries) gets a short plain-text answer after `generate_delay`.
+
+`error_rate` answers that share of requests with a 429, to exercise retries.
+The server runs on a daemon thread; `stats` counts requests by kind.
+"""
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+EMOTIONS = ["joy", "sadness", "anger", "fear", "surprise", "love", "disgust"]
+
+REPLY_WORDS = (
+    "That sounds really hard, and it makes sense that you feel this way. "
+    "I'm here with you. Would it help to take one slow breath together and "
+    "then talk about what feels heaviest right now?"
+).split()
+
+
+def _candidate_response(text, finish=True, prompt_tokens=0):
+    candidate = {"content": {"role": "model", "parts": [{"text": text}]}, "index": 0}
+    if finish:
+        candidate["finishReason"] = "STOP"
+    return {
+        "candidates": [candidate],
+        "usageMetadata": {
+            "promptTokenCount": prompt_tokens,
+            "candidatesTokenCount": len(text) // 4,
+            "totalTokenCount": prompt_tokens + len(text) // 4,
+        },
+        "modelVersion": "fake-gemini",
+    }
+
+
+def _prompt_text(body):
+    parts = [
+        part.get("text", "")
+        for content in body.get("contents", [])
+        for part in content.get("parts", [])
+    ]
+    return "\n".join(parts)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        server = self.server.fake
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        prompt = _prompt_text(body)
+
+        if server.error_rate and server.rng.random() < server.error_rate:
+            server.count("rate_limited")
+            self._send_json(429, {"error": {
+                "code": 429, "message": "Resource has been exhausted (fake).", "status": "RESOURCE_EXHAUSTED",
+            }})
+            return
+
+        if ":streamGenerateContent" in self.path:
+            self._stream_reply(server, prompt)
+        elif ":generateContent" in self.path:
+            config = body.get("generationConfig") or body.get("generation_config") or {}
+            mime = config.get("responseMimeType") or config.get("response_mime_type")
+            if mime == "application/json":
+                server.count("emotion")
+                time.sleep(server.emotion_delay)
+                # Same text, same label, so repeated runs classify alike
+                digest = hashlib.sha1(prompt.encode("utf-8")).digest()
+                label = EMOTIONS[digest[0] % len(EMOTIONS)]
+                score = 0.6 + (digest[1] % 40) / 100
+                text = json.dumps({"label": label, "score": score})
+            else:
+                server.count("generate")
+                time.sleep(server.generate_delay)
+                text = "The student talked about feeling stressed and Serenity offered support."
+            self._send_json(200, _candidate_response(text, prompt_tokens=len(prompt) // 4))
+        else:
+            self._send_json(404, {"error": {"code": 404, "message": f"unknown path {self.path}", "status": "NOT_FOUND"}})
+
+    def _stream_reply(self, server, prompt):
+        server.count("stream")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        time.sleep(server.first_token_delay)
+        n = len(REPLY_WORDS)
+        for i in range(server.chunks):
+            if i:
+                time.sleep(server.chunk_interval)
+            words = REPLY_WORDS[i * n // server.chunks:(i + 1) * n // server.chunks] or REPLY_WORDS[-1:]
+            payload = _candidate_response(" ".join(words) + " ", finish=i == server.chunks - 1,
+                                          prompt_tokens=len(prompt) // 4)
+            self._write_chunk(f"data: {json.dumps(payload)}\r\n\r\n".encode("utf-8"))
+        self._write_chunk(b"")
+
+
+class FakeGemini:
+    """Fake Gemini endpoint on localhost with configurable timing."""
+
+    def __init__(self, first_token_delay=0.3, chunk_interval=0.04, chunks=12,
+                 emotion_delay=0.25, generate_delay=0.5, error_rate=0.0, port=0, seed=0):
+        self.first_token_delay = first_token_delay
+        self.chunk_interval = chunk_interval
+        self.chunks = chunks
+        self.emotion_delay = emotion_delay
+        self.generate_delay = generate_delay
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.stats = {"stream": 0, "emotion": 0, "generate": 0, "rate_limited": 0}
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.fake = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def count(self, kind):
+        with self._lock:
+            self.stats[kind] += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,393 @@
+"""Load test: many concurrent Serenity sessions in one server process.
+
+    python benchmarks/load_test.py --users 1 2 4 8 16 --actions 30 --output load_test.json
+
+Each simulated user is a Streamlit AppTest session driven from its own
+thread, so all of them share one process, its cached resources and its
+Gemini scheduler, just like browser sessions on one server. Gemini is the
+local `fake_gemini.FakeGemini` server; no API key is needed. A user sets a
+name and then runs `--actions` scripted actions with `--think-ms` pauses
+in between: chatting, saving journal entries, opening past chats and
+popping bubbles (weights set with `--mix`).
+
+For each concurrency level the report gives:
+
+- rerun latency (time until the page is back) per action type, as p50, p95
+  and p99;
+- throughput in actions per second;
+- resident memory per session: the RSS growth over the level divided by
+  the number of users (a warm-up session loads the shared caches first);
+- the peak number of open file descriptors;
+- disk reads, writes and bytes from /proc/self/io.
+
+The saturation point is the first level where p95 latency is worse than
+`--slo-ms` (by default twice the p95 of the first level), where throughput
+grows less than 10% over the previous level, or where a run fails. The highest level before it is the capacity figure to compare
+across releases. FD and I/O counters need Linux and are null elsewhere.
+"""
+import argparse
+import atexit
+import json
+import os
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_gemini import FakeGemini  # noqa: E402
+
+MESSAGES = [
+    "I have three exams next week and I can't focus on anything",
+    "my roommate keeps ignoring me and it makes me feel invisible",
+    "today was actually a pretty good day, I finished my project",
+    "I keep worrying that I'm going to fail my semester",
+    "I miss my family a lot since I moved for college",
+    "I got into the internship I applied for!",
+]
+
+ACTIONS = ["chat", "journal", "history", "bubbles"]
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, round(q / 100 * len(ordered)) - 1))]
+
+
+def summarize(values):
+    if not values:
+        return {"n": 0}
+    return {
+        "n": len(values),
+        "p50_ms": round(percentile(values, 50) * 1000, 1),
+        "p95_ms": round(percentile(values, 95) * 1000, 1),
+        "p99_ms": round(percentile(values, 99) * 1000, 1),
+        "mean_ms": round(statistics.mean(values) * 1000, 1),
+    }
+
+
+def rss_bytes():
+    """Current resident set size (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def open_fds():
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return None
+
+
+def io_counters():
+    """read/write syscalls and bytes that reached the storage layer, or None."""
+    try:
+        with open("/proc/self/io") as f:
+            fields = dict(line.split(": ") for line in f.read().splitlines())
+        return {key: int(fields[key]) for key in ("syscr", "syscw", "read_bytes", "write_bytes")}
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+class FdSampler:
+    """Samples the open file descriptor count on a thread and keeps the peak."""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = open_fds()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            count = open_fds()
+            if count is not None:
+                self.peak = max(self.peak or 0, count)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def allow_concurrent_apptests():
+    """Let several AppTest sessions run at once in this process.
+
+    Each AppTest run installs a mock Runtime in a class-level singleton and
+    sets it back to None when it finishes, which would pull the runtime out
+    from under any run still going in another thread. Lookups in that
+    window fall back to the first mock runtime seen instead. Likewise the
+    "global.appTest" option is patched in and out around each run, so it is
+    set for the whole process.
+    """
+    from streamlit import config
+    from streamlit.runtime import Runtime
+
+    config.set_option("global.appTest", True)
+
+    original = Runtime.instance.__func__
+    seen = []
+
+    def instance(cls):
+        if cls._instance is not None:
+            if not seen:
+                seen.append(cls._instance)
+            return cls._instance
+        return seen[0] if seen else original(cls)
+
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(lambda cls: cls._instance is not None or bool(seen))
+
+
+class SimulatedUser:
+    """One AppTest session running a scripted mix of actions."""
+
+    def __init__(self, app_path, name, rng, think, mix):
+        from streamlit.testing.v1 import AppTest
+
+        self.at = AppTest.from_file(app_path, default_timeout=120)
+        self.at.secrets["GEMINI_API_KEY"] = "load-test"
+        self.name = name
+        self.rng = rng
+        self.think = think
+        self.mix = mix
+        self.timings = []  # (action, seconds)
+        self.errors = []
+        self._bubble = 0
+
+    def _run(self, action, element):
+        started = time.perf_counter()
+        element.run()
+        elapsed = time.perf_counter() - started
+        if self.at.exception:
+            self.errors.append(f"{action}: {self.at.exception[0].value}")
+        else:
+            self.timings.append((action, elapsed))
+
+    def _button(self, label=None, key=None):
+        for button in self.at.button:
+            if (key is not None and button.key == key) or (label is not None and button.label == label):
+                return button
+        return None
+
+    def start(self):
+        self._run("open", self.at)
+        self.at.text_input(key="name_input").set_value(self.name)
+        self._run("open", self._button(label="Save Name").click())
+
+    def chat(self):
+        self._run("chat", self.at.chat_input[0].set_value(f"{self.rng.choice(MESSAGES)} ({self.name})"))
+
+    def journal(self):
+        self.at.text_area[0].set_value(f"Journal from {self.name}: {self.rng.choice(MESSAGES)}")
+        self._run("journal", self._button(label="Save Entry").click())
+
+    def history(self):
+        past = [b for b in self.at.button if b.key and b.key.startswith("chat_")]
+        if past:
+            self._run("history", self.rng.choice(past).click())
+        else:
+            self._run("history", self._button(label="➕ New Chat").click())
+
+    def bubbles(self):
+        radio = next(r for r in self.at.radio if r.label == "Choose a calm activity:")
+        if radio.value != "🧼 Bubble Wrap":
+            self._run("bubbles", radio.set_value("🧼 Bubble Wrap"))
+        if self._bubble == 20:
+            self._bubble = 0
+            self._run("bubbles", self._button(label="Reset Bubbles").click())
+        self._run("bubbles", self._button(key=f"bubble_{self._bubble}").click())
+        self._bubble += 1
+
+    def play(self, actions):
+        self.start()
+        names, weights = zip(*self.mix.items())
+        for _ in range(actions):
+            time.sleep(self.rng.uniform(0.5, 1.5) * self.think)
+            getattr(self, self.rng.choices(names, weights)[0])()
+
+
+def run_level(app_path, users, actions, think, mix, seed):
+    """Play `users` sessions at once; returns the measurements for this level."""
+    import gc
+
+    gc.collect()
+    rss_before, io_before = rss_bytes(), io_counters()
+    simulated = [
+        SimulatedUser(app_path, f"user{users}-{i}", random.Random(seed * 1000 + i), think, mix)
+        for i in range(users)
+    ]
+    threads = [threading.Thread(target=user.play, args=(actions,)) for user in simulated]
+    started = time.perf_counter()
+    with FdSampler() as fds:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    elapsed = time.perf_counter() - started
+    # Sessions are still alive here, so their state counts towards RSS
+    rss_after, io_after = rss_bytes(), io_counters()
+
+    timings = [t for user in simulated for t in user.timings]
+    errors = [e for user in simulated for e in user.errors]
+    level = {
+        "users": users,
+        "seconds": round(elapsed, 2),
+        "actions": len(timings),
+        "throughput_per_s": round(len(timings) / elapsed, 2),
+        "rerun": summarize([seconds for _, seconds in timings]),
+        "by_action": {
+            action: summarize([seconds for name, seconds in timings if name == action])
+            for action in ["open"] + ACTIONS
+        },
+        "rss_mb": round(rss_after / 2**20, 1),
+        "memory_per_session_mb": round((rss_after - rss_before) / 2**20 / users, 2),
+        "peak_open_fds": fds.peak,
+        "io": {key: io_after[key] - io_before[key] for key in io_after} if io_before and io_after else None,
+        "errors": len(errors),
+        "first_errors": errors[:3],
+    }
+    del simulated
+    return level
+
+
+def saturation(levels, slo_ms):
+    """First level that misses the SLO or stops scaling, and the last level before it."""
+    previous = None
+    for level in levels:
+        reasons = []
+        if level["rerun"].get("p95_ms", 0) > slo_ms:
+            reasons.append(f"p95 {level['rerun']['p95_ms']} ms > {slo_ms:g} ms")
+        if previous and level["throughput_per_s"] < previous["throughput_per_s"] * 1.1:
+            reasons.append(f"throughput {previous['throughput_per_s']} -> {level['throughput_per_s']}/s")
+        if level["errors"]:
+            reasons.append(f"{level['errors']} errors")
+        if reasons:
+            return {
+                "saturated_at_users": level["users"],
+                "capacity_users": previous["users"] if previous else 0,
+                "reasons": reasons,
+            }
+        previous = level
+    return {"saturated_at_users": None, "capacity_users": previous["users"] if previous else 0, "reasons": []}
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        action, _, weight = part.partition("=")
+        if action not in ACTIONS:
+            raise argparse.ArgumentTypeError(f"unknown action {action!r}; choose from {', '.join(ACTIONS)}")
+        mix[action] = float(weight or 1)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--app", default=os.path.join(ROOT, "main.py"))
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 2, 4, 8, 16],
+                        help="Concurrency levels, played one after another")
+    parser.add_argument("--actions", type=int, default=30, help="Actions per user per level")
+    parser.add_argument("--think-ms", type=float, default=500, help="Mean pause between a user's actions")
+    parser.add_argument("--mix", type=parse_mix, default="chat=4,journal=1,history=2,bubbles=3",
+                        help="Action weights, e.g. chat=4,journal=1,history=2,bubbles=3")
+    parser.add_argument("--slo-ms", type=float,
+                        help="p95 rerun latency a level must stay under (default: twice the first level's p95)")
+    parser.add_argument("--first-token-ms", type=float, default=300)
+    parser.add_argument("--chunk-ms", type=float, default=40)
+    parser.add_argument("--chunks", type=int, default=12)
+    parser.add_argument("--emotion-ms", type=float, default=250)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="load_test.json")
+    args = parser.parse_args()
+
+    app_path = os.path.abspath(args.app)
+    output = os.path.abspath(args.output)
+    server = FakeGemini(
+        first_token_delay=args.first_token_ms / 1000,
+        chunk_interval=args.chunk_ms / 1000,
+        chunks=args.chunks,
+        emotion_delay=args.emotion_ms / 1000,
+        seed=args.seed,
+    ).start()
+    os.environ.update({
+        "SERENITY_GEMINI_BASE_URL": server.url,
+        # The test measures the app, not the quota
+        "SERENITY_GEMINI_RPM": "1000000",
+        "SERENITY_METRICS_DIR": "",
+    })
+
+    report = {
+        "commit": git_commit(),
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "settings": {**vars(args), "app": app_path},
+        "levels": [],
+    }
+    allow_concurrent_apptests()
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="serenity-load-")
+    # Registered before the app creates its stores, so it runs after their exit handlers
+    atexit.register(shutil.rmtree, workdir, ignore_errors=True)
+    os.chdir(workdir)
+    try:
+        # One throwaway session runs every action first, so imports and shared caches are not charged to the first level
+        warmup = SimulatedUser(app_path, "warmup", random.Random(args.seed), 0, args.mix)
+        warmup.start()
+        for action in ACTIONS:
+            getattr(warmup, action)()
+        del warmup
+        report["baseline_rss_mb"] = round(rss_bytes() / 2**20, 1)
+        for users in args.users:
+            level = run_level(app_path, users, args.actions, args.think_ms / 1000, args.mix, args.seed)
+            report["levels"].append(level)
+            rerun = level["rerun"]
+            print(f"users={users:>4}  rerun p50/p95/p99 {rerun.get('p50_ms', 0):>7.1f}/{rerun.get('p95_ms', 0):>7.1f}/"
+                  f"{rerun.get('p99_ms', 0):>7.1f} ms  {level['throughput_per_s']:>6.2f} actions/s  "
+                  f"{level['memory_per_session_mb']:>6.2f} MB/session  fds {level['peak_open_fds']}  "
+                  f"errors {level['errors']}")
+    finally:
+        os.chdir(cwd)
+        server.stop()
+
+    slo_ms = args.slo_ms or 2 * report["levels"][0]["rerun"].get("p95_ms", 0)
+    report["saturation"] = dict(saturation(report["levels"], slo_ms), slo_ms=slo_ms)
+    report["fake_server_requests"] = dict(server.stats)
+    sat = report["saturation"]
+    if sat["saturated_at_users"] is None:
+        print(f"no saturation up to {sat['capacity_users']} users")
+    else:
+        print(f"saturated at {sat['saturated_at_users']} users ({'; '.join(sat['reasons'])}); "
+              f"capacity {sat['capacity_users']} users")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
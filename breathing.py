@@ -0,0 +1,84 @@
+"""Box breathing animation that runs entirely in the browser.
+
+`breathing_html` turns the phase durations into CSS keyframes: a circle
+that grows while inhaling and shrinks while exhaling, a progress bar, and
+one label per phase that is only visible during its slice of the cycle.
+The animation repeats `cycles` times and then shows a closing message, so
+the server renders it once per session start instead of driving every
+frame from the script thread.
+"""
+
+PHASES = (
+    ("inhale", "🌸", "Inhale"),
+    ("hold", "😐", "Hold"),
+    ("exhale", "🍃", "Exhale"),
+    ("pause", "⏸️", "Pause"),
+)
+
+# How full the lungs are at the end of each phase (a cycle starts empty)
+PHASE_END_FILL = {"inhale": 1.0, "hold": 1.0, "exhale": 0.0, "pause": 0.0}
+# The circle never shrinks below this fraction of its full size
+MIN_CIRCLE = 0.4
+
+
+def _percent(seconds, total):
+    return f"{seconds / total * 100:.3f}%"
+
+
+def breathing_html(inhale=4, hold=4, exhale=4, pause=4, cycles=3, nonce=0):
+    """Self-contained HTML/CSS for one session; a new `nonce` restarts the animation."""
+    durations = {"inhale": inhale, "hold": hold, "exhale": exhale, "pause": pause}
+    total = sum(durations.values())
+    if total <= 0 or cycles < 1:
+        return ""
+    name = f"breath{nonce}"
+
+    circle_frames = [f"0% {{ transform: scale({MIN_CIRCLE}); }}"]
+    bar_frames = ["0% { transform: scaleX(0); }"]
+    labels, label_css = [], []
+    elapsed = 0
+    for phase, emoji, title in PHASES:
+        seconds = durations[phase]
+        if seconds <= 0:
+            continue
+        start, end = _percent(elapsed, total), _percent(elapsed + seconds, total)
+        elapsed += seconds
+        fill = PHASE_END_FILL[phase]
+        circle_frames.append(f"{end} {{ transform: scale({MIN_CIRCLE + (1 - MIN_CIRCLE) * fill:g}); }}")
+        bar_frames.append(f"{end} {{ transform: scaleX({fill:g}); }}")
+        # Each label is shown only between its start and end (step-end holds the previous value)
+        label_css.append(
+            f"@keyframes {name}-{phase} {{ 0% {{ opacity: 0; }} {start} {{ opacity: 1; }} "
+            f"{end} {{ opacity: 0; }} 100% {{ opacity: 0; }} }}\n"
+            f".{name} .label-{phase} {{ animation: {name}-{phase} {total}s step-end {cycles} both; }}"
+        )
+        labels.append(f'<div class="label label-{phase}">{emoji} <b>{title}... ({seconds:g}s)</b></div>')
+
+    return f"""
+<style>
+@keyframes {name}-circle {{ {" ".join(circle_frames)} }}
+@keyframes {name}-bar {{ {" ".join(bar_frames)} }}
+@keyframes {name}-done {{ from {{ opacity: 0; }} to {{ opacity: 1; }} }}
+{chr(10).join(label_css)}
+.{name} {{ position: relative; text-align: center; padding: 10px 0; }}
+.{name} .ring {{ width: 180px; height: 180px; margin: 0 auto; border-radius: 50%;
+    display: flex; align-items: center; justify-content: center;
+    background: rgba(168, 213, 186, 0.25); }}
+.{name} .circle {{ width: 100%; height: 100%; border-radius: 50%;
+    background: radial-gradient(circle, #a8d5ba, #6fb98f);
+    animation: {name}-circle {total}s linear {cycles} both; }}
+.{name} .bar {{ height: 8px; margin: 18px auto 0; max-width: 420px; border-radius: 4px;
+    background: #6fb98f; transform-origin: left;
+    animation: {name}-bar {total}s linear {cycles} both; }}
+.{name} .labels {{ position: relative; height: 2.2em; margin-top: 14px; font-size: 1.4rem; }}
+.{name} .label {{ position: absolute; inset: 0; opacity: 0; }}
+.{name} .done {{ font-size: 1.4rem; opacity: 0;
+    animation: {name}-done 1s ease-in {total * cycles}s both; }}
+</style>
+<div class="{name}">
+  <div class="ring"><div class="circle"></div></div>
+  <div class="bar"></div>
+  <div class="labels">{"".join(labels)}</div>
+  <div class="done">✨ <b>You're doing great. Feel more centered?</b></div>
+</div>
+"""
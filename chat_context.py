@@ -0,0 +1,93 @@
+"""Token-budgeted conversation context for the reply model.
+
+`build_context` walks the history newest first and keeps messages until the
+token budget is spent. Stored HTML (crisis banners, bubbles) is reduced to
+plain text before it is measured or sent. Turns that fall out of the budget
+are folded into a rolling summary, which is updated a few messages at a time
+by `summarize` and kept with the session so it is never recomputed.
+"""
+import html
+import math
+import re
+
+_TAGS = re.compile(r"<[^>]+>")
+_BREAKS = re.compile(r"<\s*(br|/p|/div|hr|/h\d)\s*/?>", re.IGNORECASE)
+_SPACES = re.compile(r"[ \t]+")
+_BLANK_LINES = re.compile(r"\n\s*\n+")
+
+# Evicted messages are summarized in groups of at least this many
+SUMMARY_BATCH = 6
+SUMMARY_MAX_WORDS = 120
+
+
+def strip_html(text):
+    """Plain text of a stored message: tags removed, entities decoded, whitespace tidied."""
+    if "<" in text:
+        text = _BREAKS.sub("\n", text)
+        text = _TAGS.sub("", text)
+    text = html.unescape(text).replace("🌿 ", "")
+    text = _SPACES.sub(" ", text)
+    return _BLANK_LINES.sub("\n", text).strip()
+
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token) plus per-message overhead."""
+    return math.ceil(len(text) / 4) + 4
+
+
+def to_gemini(message):
+    role = "model" if message["role"] == "assistant" else "user"
+    return {"role": role, "parts": [{"text": strip_html(message["content"])}]}
+
+
+def build_context(messages, budget_tokens, summary=""):
+    """Pick the newest messages that fit in `budget_tokens`.
+
+    Returns `(history, first_index)`: the messages in Gemini format, oldest
+    first, and the index in `messages` of the oldest one kept. The summary
+    is charged against the budget first.
+    """
+    remaining = budget_tokens - (estimate_tokens(summary) if summary else 0)
+    kept = []
+    first_index = len(messages)
+    for index in range(len(messages) - 1, -1, -1):
+        entry = to_gemini(messages[index])
+        cost = estimate_tokens(entry["parts"][0]["text"])
+        # Always keep the latest message, even if it alone is over budget
+        if kept and cost > remaining:
+            break
+        kept.append(entry)
+        remaining -= cost
+        first_index = index
+    kept.reverse()
+    return kept, first_index
+
+
+def needs_summary(summary_upto, first_index):
+    """True once enough messages have dropped out of the window without being summarized."""
+    return first_index - summary_upto >= SUMMARY_BATCH
+
+
+def summary_prompt(previous_summary, messages):
+    lines = [
+        f"{'User' if m['role'] == 'user' else 'Serenity'}: {strip_html(m['content'])}"
+        for m in messages
+    ]
+    return f"""
+    You keep a running summary of a supportive conversation between a student and Serenity,
+    a mental health companion. Update the summary with the new messages below.
+    Keep names, feelings, events and anything Serenity promised to follow up on.
+    Write at most {SUMMARY_MAX_WORDS} words of plain text, no preamble.
+
+    Current summary:
+    {previous_summary or "(none yet)"}
+
+    New messages:
+    {chr(10).join(lines)}
+    """
+
+
+def summarize(client, model, previous_summary, messages):
+    """Fold `messages` into `previous_summary` with one model call; returns the new summary."""
+    res = client.models.generate_content(model=model, contents=summary_prompt(previous_summary, messages))
+    return (res.text or "").strip() or previous_summary
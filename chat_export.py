@@ -0,0 +1,137 @@
+"""On-demand chat export: TXT, Markdown and JSON, one session or all of them.
+
+Exports are generators of text chunks, so nothing is built until a download
+is actually requested, and `archive` streams every session under a history
+directory, including each user's directory below it, into a zip one
+message at a time (a .jsonl log is never loaded
+whole). Download buttons get the result as bytes or a `BytesIO`, the types
+Streamlit accepts from a deferred `data` callable; it holds the download in
+memory either way. `mailto_body` only looks at as many messages as fit in the share
+link.
+
+    python chat_export.py --format md all_chats.zip
+"""
+import argparse
+import io
+import json
+import os
+import urllib.parse
+import zipfile
+
+import chat_store
+from chat_context import strip_html
+
+# mailto links longer than a few KB are cut off or rejected by mail clients
+MAILTO_BODY_LIMIT = 1500
+
+
+def iter_txt(messages, title=None, created_at=None):
+    for msg in messages:
+        yield f"[{msg['role'].upper()}] {msg.get('timestamp', '')}: {msg['content']}\n"
+
+
+def iter_markdown(messages, title=None, created_at=None):
+    yield f"# {title or 'Chat with Serenity'}\n\n"
+    if created_at:
+        yield f"_{created_at}_\n\n"
+    for msg in messages:
+        speaker = "You" if msg["role"] == "user" else "Serenity"
+        yield f"**{speaker}** · {msg.get('timestamp', '')}\n\n{strip_html(msg['content'])}\n\n"
+
+
+def iter_json(messages, title=None, created_at=None):
+    yield '{"title": ' + json.dumps(title, ensure_ascii=False)
+    yield ', "created_at": ' + json.dumps(created_at, ensure_ascii=False) + ', "messages": ['
+    for i, msg in enumerate(messages):
+        yield ("," if i else "") + "\n  " + json.dumps(msg, ensure_ascii=False)
+    yield "\n]}\n"
+
+
+# format -> (chunk generator, mime type, file extension)
+FORMATS = {
+    "txt": (iter_txt, "text/plain", "txt"),
+    "md": (iter_markdown, "text/markdown", "md"),
+    "json": (iter_json, "application/json", "json"),
+}
+
+
+def export_session(messages, fmt="txt", title=None, created_at=None):
+    """One session as UTF-8 bytes in `fmt`, for a download button."""
+    return "".join(FORMATS[fmt][0](messages, title, created_at)).encode("utf-8")
+
+
+def mailto_body(messages, limit=MAILTO_BODY_LIMIT):
+    """URL-quoted TXT export of the first messages, at most `limit` characters.
+
+    Stops reading messages as soon as the limit is reached and never cuts a
+    %XX escape in half.
+    """
+    parts, length = [], 0
+    for line in iter_txt(messages):
+        quoted = urllib.parse.quote(line)
+        if length + len(quoted) > limit:
+            cut = limit - length
+            # Back up to the start of an escape rather than splitting it
+            percent = quoted.rfind("%", max(0, cut - 2), cut)
+            parts.append(quoted[:percent if percent != -1 else cut])
+            return "".join(parts) + "..."
+        parts.append(quoted)
+        length += len(quoted)
+    return "".join(parts)
+
+
+def _session_source(path):
+    """(title, created_at, messages iterable) for one session file, streaming .jsonl logs."""
+    if path.endswith(".jsonl"):
+        meta = chat_store.read_meta(os.path.dirname(path), chat_store.session_id_from_path(path))
+        return meta.get("title", "Past Chat"), meta.get("created_at", ""), chat_store.iter_messages(path)
+    data = chat_store.read_session(path)
+    return data["title"], data["created_at"], data["messages"]
+
+
+def archive(fileobj, history_dir=chat_store.HISTORY_DIR, fmt="json"):
+    """Write every session under `history_dir` into a zip on `fileobj`; returns the count.
+
+    One entry per session. Sessions in a user directory below `history_dir`
+    keep its relative path (`users/ab/<hash>/<id>.json`), so ids can't collide.
+    """
+    generate, _, extension = FORMATS[fmt]
+    count = 0
+    with zipfile.ZipFile(fileobj, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for directory in chat_store.history_dirs(history_dir):
+            prefix = os.path.relpath(directory, history_dir).replace(os.sep, "/")
+            prefix = "" if prefix == "." else prefix + "/"
+            for path in sorted(chat_store.session_files(directory)):
+                try:
+                    title, created_at, messages = _session_source(path)
+                    name = f"{prefix}{chat_store.session_id_from_path(path)}.{extension}"
+                    with zf.open(name, "w") as out:
+                        for chunk in generate(messages, title, created_at):
+                            out.write(chunk.encode("utf-8"))
+                except (OSError, ValueError):
+                    continue
+                count += 1
+    return count
+
+
+def archive_file(history_dir=chat_store.HISTORY_DIR, fmt="json"):
+    """The bulk zip as a rewound `BytesIO`, for a download button."""
+    f = io.BytesIO()
+    archive(f, history_dir, fmt)
+    f.seek(0)
+    return f
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export every user's saved Serenity chats into a zip.")
+    parser.add_argument("output", help="Zip file to write")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="json")
+    parser.add_argument("--history-dir", default=chat_store.HISTORY_DIR)
+    args = parser.parse_args()
+    with open(args.output, "wb") as f:
+        count = archive(f, args.history_dir, args.format)
+    print(f"exported {count} sessions to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
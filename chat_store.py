@@ -0,0 +1,481 @@
+"""Session storage and the manifest index for chat_history/.
+
+Each session is an append-only log, `<session_id>.jsonl`, with one message
+per line, plus a small `<session_id>.meta` sidecar holding the title and
+other metadata. Older `<session_id>_<title>.json` snapshots are still read.
+
+The manifest keeps one small record per session (id, file, title, created_at,
+mtime, message_count) so the sidebar can list and page through past chats
+without opening every session file on each rerun.
+
+Each user gets their own history directory with its own manifest,
+sharded as `users/<2 hex>/<hash of the user key>/`, so listing costs the
+same however many other users there are (the key comes from `identity`,
+never from the display name). The top level directory only holds chats
+from before per-user storage; the app no longer lists them, and
+`python chat_store.py --adopt-legacy USER_KEY` moves them into one user's
+directory. Session ids are a timestamp plus a random suffix. Writes
+take an exclusive `flock` on the directory's `.lock` file, so several
+server processes can share the same storage.
+"""
+import contextlib
+import glob
+import hashlib
+import json
+import os
+import secrets
+import threading
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows: the lock only covers threads of this process
+    fcntl = None
+
+HISTORY_DIR = "chat_history"
+MANIFEST_NAME = "manifest.json"
+USERS_DIR = "users"
+LOCK_NAME = ".lock"
+
+_lock = threading.Lock()
+# history_dir -> ((manifest inode, mtime_ns), sessions dict, ids sorted newest first).
+# Every write replaces the file, so the inode changes even within one mtime tick.
+_loaded = {}
+# absolute history_dir -> [thread lock, hold depth, open lock file]
+_dir_locks = {}
+
+
+def new_session_id():
+    """Timestamp plus 32 random bits, so sessions started in the same second never collide."""
+    return f"{datetime.now().strftime('%Y%m%d%H%M%S')}-{secrets.token_hex(4)}"
+
+
+def user_history_dir(user_id, root=HISTORY_DIR):
+    """History directory for one user key; `root` itself (legacy chats) without one."""
+    if not user_id:
+        return root
+    digest = hashlib.sha256(user_id.encode("utf-8")).hexdigest()[:24]
+    return os.path.join(root, USERS_DIR, digest[:2], digest)
+
+
+def history_dirs(root=HISTORY_DIR):
+    """`root` and every user directory under it."""
+    return [root] + sorted(glob.glob(os.path.join(root, USERS_DIR, "*", "*")))
+
+
+@contextlib.contextmanager
+def locked(history_dir):
+    """Exclusive lock on a history directory, across threads and processes.
+
+    Re-entrant within a thread, so locked helpers can call each other.
+    """
+    key = os.path.abspath(history_dir)
+    with _lock:
+        state = _dir_locks.setdefault(key, [threading.RLock(), 0, None])
+    with state[0]:
+        if state[1] == 0:
+            os.makedirs(history_dir, exist_ok=True)
+            lock_file = open(os.path.join(history_dir, LOCK_NAME), "a")
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            state[2] = lock_file
+        state[1] += 1
+        try:
+            yield
+        finally:
+            state[1] -= 1
+            if state[1] == 0:
+                # Closing the file releases the flock
+                state[2].close()
+                state[2] = None
+
+
+def manifest_path(history_dir=HISTORY_DIR):
+    return os.path.join(history_dir, MANIFEST_NAME)
+
+
+def session_id_from_path(path):
+    """Session ids are the leading timestamp of the file name."""
+    return os.path.basename(path).split("_")[0].split(".")[0]
+
+
+def log_path(history_dir, session_id):
+    return os.path.join(history_dir, f"{session_id}.jsonl")
+
+
+def meta_path(history_dir, session_id):
+    return os.path.join(history_dir, f"{session_id}.meta")
+
+
+def session_path(history_dir, session_id):
+    """The file holding a session: its log, else a legacy snapshot, else None."""
+    path = log_path(history_dir, session_id)
+    if os.path.exists(path):
+        return path
+    legacy = glob.glob(os.path.join(history_dir, f"{session_id}_*.json"))
+    return legacy[0] if legacy else None
+
+
+def message_fingerprint(message):
+    """Short hash used to check that the persisted log still matches memory."""
+    raw = json.dumps(message, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha1(raw).hexdigest()
+
+
+def write_json_atomic(path, data):
+    """Write JSON to a temp file and rename it over `path`, so readers never see a torn file."""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+        # The data must be on disk before the rename is, or a crash can leave an empty file at `path`;
+        # the directory entry is synced later, in the write-behind batch
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _drop_torn_tail(path):
+    """Cut a partial last line left behind by a crash mid-append."""
+    with open(path, "rb+") as f:
+        size = f.seek(0, os.SEEK_END)
+        if size == 0:
+            return
+        f.seek(size - 1)
+        if f.read(1) == b"\n":
+            return
+        # Walk back to the previous newline in small blocks
+        pos = size
+        while pos > 0:
+            step = min(4096, pos)
+            pos -= step
+            f.seek(pos)
+            block = f.read(step)
+            cut = block.rfind(b"\n")
+            if cut != -1:
+                f.truncate(pos + cut + 1)
+                return
+        f.truncate(0)
+
+
+def _encode_lines(messages):
+    return "".join(json.dumps(m, ensure_ascii=False) + "\n" for m in messages).encode("utf-8")
+
+
+def append_messages(history_dir, session_id, messages):
+    """Append messages to the session log with a single write."""
+    os.makedirs(history_dir, exist_ok=True)
+    path = log_path(history_dir, session_id)
+    if os.path.exists(path):
+        _drop_torn_tail(path)
+    with open(path, "ab") as f:
+        f.write(_encode_lines(messages))
+    return path
+
+
+def rewrite_messages(history_dir, session_id, messages):
+    """Atomically replace the whole log, for when memory no longer extends what is on disk."""
+    os.makedirs(history_dir, exist_ok=True)
+    path = log_path(history_dir, session_id)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_encode_lines(messages))
+        # As in write_json_atomic: data before rename, directory in the write-behind batch
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return path
+
+
+def write_meta(history_dir, session_id, meta):
+    write_json_atomic(meta_path(history_dir, session_id), meta)
+
+
+def read_meta(history_dir, session_id):
+    try:
+        with open(meta_path(history_dir, session_id), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def iter_messages(path):
+    """Messages from a .jsonl log, one at a time; a torn or corrupt line ends the log."""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.endswith("\n"):
+                return
+            try:
+                message = json.loads(line)
+            except ValueError:
+                return
+            yield message
+
+
+def read_messages(path):
+    """Messages from a .jsonl log; a torn or corrupt line ends the log."""
+    return list(iter_messages(path))
+
+
+def read_session(path):
+    """Load either format as {"title", "created_at", "messages", "format"}, plus any stored summary."""
+    if path.endswith(".jsonl"):
+        meta = read_meta(os.path.dirname(path), session_id_from_path(path))
+        return {
+            "title": meta.get("title", "Past Chat"),
+            "created_at": meta.get("created_at", ""),
+            "messages": read_messages(path),
+            "format": "log",
+            "summary": meta.get("summary", ""),
+            "summary_upto": meta.get("summary_upto", 0),
+            "user_id": meta.get("user_id"),
+        }
+    with open(path, "r") as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        return {
+            "title": data.get("title", "New Chat"),
+            "created_at": data.get("created_at", ""),
+            "messages": data.get("messages", []),
+            "format": "legacy",
+        }
+    return {"title": "Past Chat", "created_at": "", "messages": data, "format": "legacy"}
+
+
+def remove_legacy_files(history_dir, session_id):
+    """Delete old `<session_id>_<title>.json` snapshots once a session has a log."""
+    for old_file in glob.glob(os.path.join(history_dir, f"{session_id}_*.json")):
+        try:
+            os.remove(old_file)
+        except OSError:
+            pass
+
+
+def delete_session(history_dir, entry):
+    """Remove a session's files and its manifest record."""
+    with locked(history_dir):
+        for path in (
+            os.path.join(history_dir, entry["file"]),
+            meta_path(history_dir, entry["id"]),
+        ):
+            if os.path.exists(path):
+                os.remove(path)
+        remove_legacy_files(history_dir, entry["id"])
+        remove_entry(history_dir, entry["id"])
+
+
+def save_session(history_dir, session_id, title, created_at, messages, persisted=None, extra_meta=None):
+    """Persist `messages`, appending only what the log does not have yet.
+
+    `persisted` is the state returned by the previous call for this session.
+    If memory no longer extends what was written (a cleared or edited chat),
+    the log is rewritten atomically instead. `extra_meta` is merged into the
+    sidecar. Returns the new state.
+    """
+    count = 0
+    if (
+        persisted
+        and persisted["session_id"] == session_id
+        and persisted.get("history_dir") == history_dir
+        and 0 < persisted["count"] <= len(messages)
+        and message_fingerprint(messages[persisted["count"] - 1]) == persisted["tail"]
+    ):
+        count = persisted["count"]
+        if count == len(messages):
+            return persisted
+
+    with locked(history_dir):
+        if count:
+            path = append_messages(history_dir, session_id, messages[count:])
+        else:
+            path = rewrite_messages(history_dir, session_id, messages)
+            remove_legacy_files(history_dir, session_id)
+
+        write_meta(history_dir, session_id, dict(
+            extra_meta or {},
+            title=title,
+            created_at=created_at,
+            message_count=len(messages),
+        ))
+        upsert_entry(history_dir, {
+            "id": session_id,
+            "file": os.path.basename(path),
+            "title": title,
+            "created_at": created_at,
+            "mtime": os.path.getmtime(path),
+            "message_count": len(messages),
+        })
+    return {
+        "session_id": session_id,
+        "history_dir": history_dir,
+        "count": len(messages),
+        "tail": message_fingerprint(messages[-1]),
+    }
+
+
+def session_files(history_dir=HISTORY_DIR):
+    """Every session file on disk (logs and legacy snapshots), excluding the manifest."""
+    legacy = [
+        path for path in glob.glob(os.path.join(history_dir, "*.json"))
+        if os.path.basename(path) != MANIFEST_NAME
+    ]
+    return glob.glob(os.path.join(history_dir, "*.jsonl")) + legacy
+
+
+def read_entry(path):
+    """Build a manifest record by reading one session file."""
+    title, created_at, message_count = "Past Conversation", "", 0
+    try:
+        if path.endswith(".jsonl"):
+            meta = read_meta(os.path.dirname(path), session_id_from_path(path))
+            title = meta.get("title", "Past Chat")
+            created_at = meta.get("created_at", "")
+            message_count = meta.get("message_count") or len(read_messages(path))
+        else:
+            with open(path, "r") as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                title = data.get("title", "Past Chat")
+                created_at = data.get("created_at", "")
+                message_count = len(data.get("messages", []))
+            elif isinstance(data, list):
+                message_count = len(data)
+    except (OSError, ValueError):
+        pass
+    return {
+        "id": session_id_from_path(path),
+        "file": os.path.basename(path),
+        "title": title,
+        "created_at": created_at,
+        "mtime": os.path.getmtime(path),
+        "message_count": message_count,
+    }
+
+
+def _write(history_dir, sessions):
+    os.makedirs(history_dir, exist_ok=True)
+    write_json_atomic(manifest_path(history_dir), {"version": 1, "sessions": sessions})
+    _remember(history_dir, sessions)
+
+
+def _version(path):
+    stat = os.stat(path)
+    return stat.st_ino, stat.st_mtime_ns
+
+
+def _remember(history_dir, sessions, version=None):
+    ordered = sorted(sessions, key=lambda sid: sessions[sid]["mtime"], reverse=True)
+    with _lock:
+        _loaded[history_dir] = (version or _version(manifest_path(history_dir)), sessions, ordered)
+
+
+def rebuild_manifest(history_dir=HISTORY_DIR):
+    """Scan every session file once and rewrite the manifest from scratch."""
+    with locked(history_dir):
+        sessions = {}
+        for path in session_files(history_dir):
+            entry = read_entry(path)
+            current = sessions.get(entry["id"])
+            # A log always wins over a legacy snapshot of the same session
+            if (
+                current is None
+                or (entry["file"].endswith(".jsonl") and not current["file"].endswith(".jsonl"))
+                or (entry["file"].endswith(".jsonl") == current["file"].endswith(".jsonl")
+                    and entry["mtime"] > current["mtime"])
+            ):
+                sessions[entry["id"]] = entry
+        _write(history_dir, sessions)
+        return sessions
+
+
+def _load(history_dir):
+    """Return (sessions, ids newest first), rebuilding the manifest if it is missing or unreadable."""
+    path = manifest_path(history_dir)
+    if not os.path.isdir(history_dir):
+        return {}, []
+    try:
+        version = _version(path)
+    except FileNotFoundError:
+        rebuild_manifest(history_dir)
+        return _loaded[history_dir][1:]
+
+    cached = _loaded.get(history_dir)
+    if cached and cached[0] == version:
+        return cached[1:]
+
+    try:
+        with open(path, "r") as f:
+            sessions = json.load(f)["sessions"]
+    except (OSError, ValueError, KeyError):
+        rebuild_manifest(history_dir)
+        return _loaded[history_dir][1:]
+    # Tagged with the version stat'ed before reading, so a concurrent replace is picked up next time
+    _remember(history_dir, sessions, version)
+    return _loaded[history_dir][1:]
+
+
+def upsert_entry(history_dir, entry):
+    """Insert or replace one session's record."""
+    with locked(history_dir):
+        # Re-read under the lock, so another process's update is not lost
+        sessions = dict(_load(history_dir)[0])
+        sessions[entry["id"]] = entry
+        _write(history_dir, sessions)
+
+
+def remove_entry(history_dir, session_id):
+    """Drop a session's record, e.g. after its file was deleted."""
+    with locked(history_dir):
+        sessions = dict(_load(history_dir)[0])
+        if session_id not in sessions:
+            return
+        del sessions[session_id]
+        _write(history_dir, sessions)
+
+
+def list_sessions(history_dir=HISTORY_DIR, offset=0, limit=10):
+    """One page of session records, most recently modified first, plus the total count."""
+    sessions, ordered = _load(history_dir)
+    page = [sessions[sid] for sid in ordered[offset:offset + limit]]
+    return page, len(ordered)
+
+
+def adopt_sessions(source_dir, target_dir, user_id):
+    """Move every session in `source_dir` into `target_dir`, owned by `user_id`; returns the count."""
+    os.makedirs(target_dir, exist_ok=True)
+    moved = 0
+    with locked(source_dir), locked(target_dir):
+        for path in session_files(source_dir):
+            session_id = session_id_from_path(path)
+            if session_path(target_dir, session_id):
+                continue
+            os.replace(path, os.path.join(target_dir, os.path.basename(path)))
+            if path.endswith(".jsonl"):
+                meta = read_meta(source_dir, session_id)
+                write_meta(target_dir, session_id, {**meta, "user_id": user_id})
+                if os.path.exists(meta_path(source_dir, session_id)):
+                    os.remove(meta_path(source_dir, session_id))
+            moved += 1
+        rebuild_manifest(source_dir)
+        rebuild_manifest(target_dir)
+    return moved
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Maintenance for chat_history/.")
+    parser.add_argument("--history-dir", default=HISTORY_DIR)
+    parser.add_argument("--adopt-legacy", metavar="USER_KEY",
+                        help="Move the chats from before per-user storage to this user: "
+                             "'browser:<the part of the page's ?u= token before the dot>' or 'account:<subject>'")
+    args = parser.parse_args()
+    if args.adopt_legacy:
+        target = user_history_dir(args.adopt_legacy, args.history_dir)
+        moved = adopt_sessions(args.history_dir, target, args.adopt_legacy)
+        print(f"moved {moved} sessions to {target}; run `python search_index.py --rebuild` to re-index them")
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""Crisis keyword detection.
+
+All phrases are folded into one compiled regular expression, built as a
+prefix trie so the scan stays a single pass over the message however many
+phrases there are. Matching runs on normalized text (Unicode NFKC, casefold,
+apostrophes dropped, punctuation and whitespace collapsed to single spaces)
+and a phrase must start on a word boundary. It may end in a plain
+inflection (s, es, ed, ing, ness), so "self harm" also catches "self
+harming" and "hopeless" catches "hopelessness". Adjectives ending in
+"less" or "al" may also take "ly" ("hopelessly", "suicidally"); other
+phrases may not, so "death" does not fire on "deathly". Inflections inside a phrase ("killing myself") are listed as
+phrases of their own. `python crisis.py` checks the default lexicon against
+`REGRESSION_CASES`.
+
+Extra phrases, e.g. other languages, can be loaded from a UTF-8 text file
+with one phrase per line (`#` starts a comment). The file named by the
+`SERENITY_CRISIS_KEYWORDS` environment variable, or `crisis_keywords.txt`
+next to the app, is merged into the default lexicon when present.
+"""
+import os
+import re
+import unicodedata
+
+DEFAULT_KEYWORDS = [
+    "suicide", "want to die", "kill myself", "self harm", "self-harm",
+    "end everything", "hopeless", "no point in living", "don't want to live",
+    "better off dead", "death", "hurting myself",
+    "suicidal", "killing myself", "hurt myself", "ending everything",
+]
+KEYWORDS_FILE = os.environ.get(
+    "SERENITY_CRISIS_KEYWORDS",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "crisis_keywords.txt"),
+)
+# Endings a phrase may carry and still match
+INFLECTIONS = ("s", "es", "ed", "ing", "ness")
+# Phrases with these endings are adjectives and may also end in "ly"; on a noun it makes a new word ("deathly")
+ADVERB_STEMS = ("less", "al")
+
+# (text, should it match) pairs run by `python crisis.py`
+REGRESSION_CASES = [
+    ("I have been self-harming again", True),
+    ("I keep self harming", True),
+    ("I self harmed last night", True),
+    ("thinking about suicides", True),
+    ("I feel hopelessness every day", True),
+    ("I feel hopelessly stuck", True),
+    ("I'm suicidally low tonight", True),
+    ("I've been feeling suicidal", True),
+    ("I'm thinking of killing myself", True),
+    ("I want to hurt myself", True),
+    ("I DON'T want to live anymore", True),
+    ("Everything feels HOPELESS.", True),
+    ("I'm deathly tired after exams", False),
+    ("my friends sing in self harmonies", False),
+    ("I feel hopeful today", False),
+    ("the suicidesquad game was fun", False),
+    ("I killed it at the gym today", False),
+]
+
+_APOSTROPHES = re.compile(r"['’‘ʼ`]")
+_SEPARATORS = re.compile(r"[\W_]+")
+
+
+def normalize(text):
+    """Fold case, width and punctuation so equivalent spellings compare equal."""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = _APOSTROPHES.sub("", text)
+    return _SEPARATORS.sub(" ", text).strip()
+
+
+def load_keywords(path):
+    """Read one phrase per line, skipping blanks and `#` comments."""
+    phrases = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                phrases.append(line)
+    return phrases
+
+
+def _trie(phrases):
+    trie = {}
+    for phrase in phrases:
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[""] = {}
+    return trie
+
+
+def _trie_pattern(node):
+    """Turn a character trie into a regex that shares common prefixes."""
+    branches = []
+    can_end = False
+    for char in sorted(node):
+        if char == "":
+            can_end = True
+        else:
+            branches.append(re.escape(char) + _trie_pattern(node[char]))
+    if not branches:
+        return ""
+    if len(branches) == 1 and not can_end:
+        return branches[0]
+    pattern = "(?:" + "|".join(branches) + ")"
+    return pattern + "?" if can_end else pattern
+
+
+class CrisisMatcher:
+    """Word-boundary matcher over a normalized phrase lexicon, allowing inflected endings."""
+
+    def __init__(self, phrases):
+        self.phrases = {normalize(phrase) for phrase in phrases} - {""}
+        adjectives = {phrase for phrase in self.phrases if phrase.endswith(ADVERB_STEMS)}
+        alternatives = []
+        for group, endings in ((adjectives, INFLECTIONS + ("ly",)), (self.phrases - adjectives, INFLECTIONS)):
+            if group:
+                alternatives.append(f"(?:{_trie_pattern(_trie(group))})(?:{'|'.join(endings)})?")
+        body = "|".join(alternatives) or r"(?!x)x"
+        self._regex = re.compile(rf"(?<!\w)(?:{body})(?!\w)")
+
+    def __len__(self):
+        return len(self.phrases)
+
+    def matches(self, text):
+        """True if any phrase (or an inflection of it) occurs as whole words in `text`."""
+        return self._regex.search(normalize(text)) is not None
+
+    def find_all(self, text):
+        """Every phrase found in `text`, in order of appearance."""
+        return self._regex.findall(normalize(text))
+
+
+def build_default_matcher():
+    """Default lexicon plus the optional keywords file."""
+    phrases = list(DEFAULT_KEYWORDS)
+    if os.path.exists(KEYWORDS_FILE):
+        phrases.extend(load_keywords(KEYWORDS_FILE))
+    return CrisisMatcher(phrases)
+
+
+_default_matcher = build_default_matcher()
+
+
+def check_crisis(text):
+    """Check for crisis keywords."""
+    return _default_matcher.matches(text)
+
+
+def regression_failures(matcher=None):
+    """`REGRESSION_CASES` the matcher gets wrong, as (text, expected) pairs."""
+    matcher = matcher or _default_matcher
+    return [(text, expected) for text, expected in REGRESSION_CASES if matcher.matches(text) != expected]
+
+
+if __name__ == "__main__":
+    failures = regression_failures()
+    for text, expected in failures:
+        print(f"{'missed' if expected else 'false alarm'}: {text!r}")
+    print(f"{len(REGRESSION_CASES) - len(failures)}/{len(REGRESSION_CASES)} regression cases pass")
+    raise SystemExit(1 if failures else 0)
@@ -0,0 +1,344 @@
+"""Offline emotion backfill for saved chats and journal entries.
+
+Mood rows only exist for messages typed since mood tracking began. This job
+walks chat_history/ and the journal database, classifies every user message
+and journal entry that has no mood row yet, and writes the results into the
+mood store. Texts are classified a batch at a time: the local lexicon
+classifier scores a whole batch in one pass and, with `--gemini`, only the
+texts it is unsure about are sent to Gemini, many per request, through the
+same `GeminiScheduler` rate limit the app uses. Batches run in a bounded
+worker pool. Each session or entry is marked done in the same transaction
+as its rows, so an interrupted run picks up where it stopped and never
+writes a row twice.
+
+Chat sessions that already have mood rows were tracked live, so they get
+no new rows. Their "neutral" rows are the fallback `get_ai_emotion` records
+when it fails (Gemini never returns it, and the local tier only answers
+when it is confident), so each one is matched to the user message it was
+recorded for, by session and time, and relabelled. Journal entries keep the
+emotion stored with them, except that same fallback, which is classified
+again.
+
+    python emotion_backfill.py
+    python emotion_backfill.py --gemini --workers 4 --batch-size 200
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+
+import chat_store
+import local_emotion
+from emotion_cache import EmotionCache, normalize_text
+from gemini_scheduler import PRIORITY_BACKGROUND, GeminiScheduler
+from mood_store import DEFAULT_DB_PATH as MOOD_DB_PATH, TIMESTAMP_FORMAT, MoodStore
+
+DEFAULT_MODEL = "gemini-flash-latest"
+CHECKPOINT_PREFIX = "backfill:"
+# What get_ai_emotion records when classification fails
+FALLBACK_LABEL = "neutral"
+# A live mood row is written within this long of the message it labels
+FALLBACK_LAG = timedelta(minutes=2)
+
+
+def message_timestamp(created_at, clock):
+    """Mood row timestamp for a chat message: the session's date plus the message's "%I:%M %p" time."""
+    try:
+        started = datetime.strptime(created_at, "%Y-%m-%d %H:%M")
+    except (TypeError, ValueError):
+        return None
+    try:
+        stamp = datetime.combine(started.date(), datetime.strptime(clock, "%I:%M %p").time())
+    except (TypeError, ValueError):
+        return started.strftime(TIMESTAMP_FORMAT)
+    if started - stamp > timedelta(hours=1):
+        # The chat ran past midnight (created_at is written a little after the first message)
+        stamp += timedelta(days=1)
+    return stamp.strftime(TIMESTAMP_FORMAT)
+
+
+def match_fallback_rows(rows, messages):
+    """Pair `(row id, timestamp)` fallback rows with the `(timestamp, text)` user message each was recorded for.
+
+    Both lists are in order. A row belongs to the earliest unmatched message
+    sent at most `FALLBACK_LAG` before it; rows with no such message are left out.
+    """
+    pairs, i = [], 0
+    for row_id, row_stamp in rows:
+        try:
+            recorded = datetime.strptime(row_stamp, TIMESTAMP_FORMAT)
+        except (TypeError, ValueError):
+            continue
+        # Messages sent too long before this row got a real label
+        while i < len(messages) and messages[i][0] < recorded - FALLBACK_LAG:
+            i += 1
+        if i < len(messages) and messages[i][0] <= recorded:
+            pairs.append((row_id, messages[i][1]))
+            i += 1
+    return pairs
+
+
+def chat_items(history_dir, skip_sessions, done, fallback_rows=None):
+    """One work item per session of every user.
+
+    Untracked sessions yield their user messages and timestamps. Sessions in
+    `skip_sessions` only yield the texts for their rows in `fallback_rows`
+    (`MoodStore.session_rows(FALLBACK_LABEL)`), to be relabelled.
+    """
+    fallback_rows = fallback_rows or {}
+    for user_dir in chat_store.history_dirs(history_dir):
+        for path in sorted(chat_store.session_files(user_dir)):
+            session_id = chat_store.session_id_from_path(path)
+            tracked = session_id in skip_sessions
+            if tracked and session_id not in fallback_rows:
+                continue
+            if tracked:
+                # Keyed by the newest fallback row, so fallbacks recorded later get their own pass
+                key = f"{CHECKPOINT_PREFIX}relabel:{session_id}:{fallback_rows[session_id][-1][0]}"
+            else:
+                key = f"{CHECKPOINT_PREFIX}chat:{session_id}"
+            if key in done:
+                continue
+            try:
+                data = chat_store.read_session(path)
+            except (OSError, ValueError):
+                continue
+            fallback = datetime.fromtimestamp(os.path.getmtime(path)).strftime(TIMESTAMP_FORMAT)
+            texts, stamps = [], []
+            for message in data["messages"]:
+                if message.get("role") == "user" and message.get("content"):
+                    texts.append(message["content"])
+                    stamps.append(message_timestamp(data["created_at"], message.get("timestamp")) or fallback)
+            item = {"key": key, "session_id": session_id, "user_id": data.get("user_id")}
+            if tracked:
+                messages = [
+                    (datetime.strptime(stamp, TIMESTAMP_FORMAT), text) for stamp, text in zip(stamps, texts)
+                ]
+                pairs = match_fallback_rows(fallback_rows[session_id], messages)
+                item.update(texts=[text for _, text in pairs], stamps=[], row_ids=[row_id for row_id, _ in pairs])
+            else:
+                item.update(texts=texts, stamps=stamps)
+            yield item
+
+
+def journal_items(journal_store, done):
+    """One work item per journal entry; entries with a real stored emotion need no classification."""
+    for entry in journal_store.iter_entries():
+        key = f"{CHECKPOINT_PREFIX}journal:{entry['id']}"
+        if key in done:
+            continue
+        try:
+            stamp = datetime.fromisoformat(entry["created_at"]).strftime(TIMESTAMP_FORMAT)
+        except (TypeError, ValueError):
+            continue
+        item = {"key": key, "session_id": None, "user_id": entry["user_id"], "stamps": [stamp]}
+        emotion = (entry.get("analysis") or {}).get("emotion")
+        if emotion and emotion != "neutral":
+            item.update(texts=[], labels=[emotion])
+        else:
+            item["texts"] = [entry["text"]]
+        yield item
+
+
+class BatchClassifier:
+    """Local classifier for whole batches, with batched Gemini requests for the unsure texts."""
+
+    def __init__(self, threshold=0.75, client=None, scheduler=None, model=DEFAULT_MODEL,
+                 cache=None, request_size=50):
+        self.threshold = threshold
+        self.client = client
+        self.scheduler = scheduler
+        self.model = model
+        self.cache = cache
+        self.request_size = request_size
+        self.stats = {"texts": 0, "local": 0, "cached": 0, "gemini": 0, "gemini_requests": 0}
+        # Batches are classified on several worker threads at once
+        self._lock = threading.Lock()
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self.stats[key] += n
+
+    def _ask_gemini(self, texts):
+        from google.genai import types
+
+        numbered = "\n".join(f"{i}. {json.dumps(text, ensure_ascii=False)}" for i, text in enumerate(texts, 1))
+        prompt = f"""
+        Analyze the emotion in each of these {len(texts)} numbered texts.
+        For each one choose ONE from: joy, sadness, anger, fear, surprise, love, disgust.
+        Return a JSON array with one result per text, in order: [{{"label": "emotion", "score": 0.95}}, ...]
+
+        {numbered}
+        """
+        res = self.scheduler.call(
+            PRIORITY_BACKGROUND,
+            self.client.models.generate_content,
+            model=self.model,
+            contents=prompt,
+            config=types.GenerateContentConfig(response_mime_type="application/json"),
+        )
+        self._count("gemini_requests")
+        data = json.loads(res.text)
+        if not isinstance(data, list) or len(data) != len(texts):
+            raise ValueError(f"expected {len(texts)} results, got {len(data) if isinstance(data, list) else data!r}")
+        results = []
+        for item in data:
+            label = str(item["label"]).lower()
+            if label not in local_emotion.EMOTIONS:
+                raise ValueError(f"unknown emotion {label!r}")
+            results.append({"label": label, "score": float(item["score"])})
+        return results
+
+    def classify(self, texts):
+        """`{"label", "score"}` per text. Raises if Gemini fails, so the batch is retried on the next run."""
+        results = local_emotion.classify_batch(texts)
+        self._count("texts", len(texts))
+        if self.client is None:
+            self._count("local", len(texts))
+            return results
+        unsure = {}  # normalized text -> indices, so repeated texts are asked about once
+        for i, result in enumerate(results):
+            if result["score"] >= self.threshold:
+                self._count("local")
+                continue
+            cached = self.cache.get(texts[i], self.model) if self.cache else None
+            if cached is not None:
+                results[i] = cached
+                self._count("cached")
+            else:
+                unsure.setdefault(normalize_text(texts[i]), []).append(i)
+        unsure = list(unsure.values())
+        for start in range(0, len(unsure), self.request_size):
+            chunk = unsure[start:start + self.request_size]
+            for indices, result in zip(chunk, self._ask_gemini([texts[indices[0]] for indices in chunk])):
+                for i in indices:
+                    results[i] = result
+                if self.cache:
+                    self.cache.set(texts[indices[0]], self.model, result)
+                self._count("gemini", len(indices))
+        return results
+
+
+def pack(items, batch_size):
+    """Group work items into batches of about `batch_size` texts; an item is never split."""
+    batch, size = [], 0
+    for item in items:
+        batch.append(item)
+        size += len(item["texts"]) or 1
+        if size >= batch_size:
+            yield batch
+            batch, size = [], 0
+    if batch:
+        yield batch
+
+
+def label_batch(classifier, batch):
+    """New mood rows, `(mood, row id)` relabels and checkpoint keys for one batch of work items."""
+    results = iter(classifier.classify([text for item in batch for text in item["texts"]]))
+    rows, relabels = [], []
+    for item in batch:
+        labels = item.get("labels") or [next(results)["label"] for _ in item["texts"]]
+        if "row_ids" in item:
+            relabels.extend(zip(labels, item["row_ids"]))
+        else:
+            rows.extend(
+                (stamp, label, item["session_id"], item["user_id"]) for stamp, label in zip(item["stamps"], labels)
+            )
+    return rows, relabels, [item["key"] for item in batch]
+
+
+def run(store, classifier, items, batch_size=200, workers=4, progress=None):
+    """Classify `items` in a bounded pool and write each finished batch to `store`; returns counters."""
+    stats = {"batches": 0, "items": 0, "rows": 0, "relabelled": 0, "failed_batches": 0}
+
+    def commit(futures):
+        for future in futures:
+            try:
+                rows, relabels, keys = future.result()
+            except Exception as e:
+                stats["failed_batches"] += 1
+                if progress:
+                    progress(f"batch failed, will be retried on the next run: {e}")
+                continue
+            store.import_rows(rows, keys, relabels)
+            stats["batches"] += 1
+            stats["items"] += len(keys)
+            stats["rows"] += len(rows)
+            stats["relabelled"] += len(relabels)
+            if progress:
+                progress(
+                    f"{stats['items']} sessions/entries, {stats['rows']} mood rows written, "
+                    f"{stats['relabelled']} fallback rows relabelled"
+                )
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="emotion-backfill") as pool:
+        pending = set()
+        for batch in pack(items, batch_size):
+            # At most two batches per worker are held in memory
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                commit(done)
+            pending.add(pool.submit(label_batch, classifier, batch))
+        commit(pending)
+    return stats
+
+
+def main():
+    from journal_store import DEFAULT_DB_PATH as JOURNAL_DB_PATH, JournalStore
+
+    parser = argparse.ArgumentParser(description="Classify saved chats and journal entries into the mood store.")
+    parser.add_argument("--history-dir", default=chat_store.HISTORY_DIR)
+    parser.add_argument("--journal-db", default=JOURNAL_DB_PATH)
+    parser.add_argument("--mood-db", default=MOOD_DB_PATH)
+    parser.add_argument("--no-chats", action="store_true")
+    parser.add_argument("--no-journal", action="store_true")
+    parser.add_argument("--batch-size", type=int, default=200, help="Texts per work batch")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--gemini", action="store_true", help="Ask Gemini about texts the local classifier is unsure of")
+    parser.add_argument("--request-size", type=int, default=50, help="Texts per Gemini request")
+    parser.add_argument("--threshold", type=float, default=0.75, help="Local confidence at which Gemini is skipped")
+    parser.add_argument("--rpm", type=int, default=60, help="Gemini requests per minute")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    args = parser.parse_args()
+
+    classifier = BatchClassifier(threshold=args.threshold, request_size=args.request_size, model=args.model)
+    if args.gemini:
+        from gemini_client import make_client
+
+        api_key = os.environ.get("GEMINI_API_KEY")
+        if not api_key:
+            parser.error("--gemini needs GEMINI_API_KEY in the environment")
+        classifier.client = make_client(api_key, base_url=os.environ.get("SERENITY_GEMINI_BASE_URL"))
+        classifier.scheduler = GeminiScheduler(requests_per_minute=args.rpm, burst=max(1, args.rpm // 6),
+                                               max_concurrent=args.workers)
+        classifier.cache = EmotionCache("emotion_cache.db")
+
+    store = MoodStore(args.mood_db)
+    done = store.checkpoints(CHECKPOINT_PREFIX)
+    items = []
+    if not args.no_chats:
+        items.append(chat_items(
+            args.history_dir, store.tracked_sessions(), done, store.session_rows(FALLBACK_LABEL)
+        ))
+    if not args.no_journal:
+        items.append(journal_items(JournalStore(args.journal_db), done))
+
+    started = time.perf_counter()
+    stats = run(
+        store, classifier, (item for source in items for item in source),
+        batch_size=args.batch_size, workers=args.workers, progress=print,
+    )
+    store.close()
+    print(
+        f"backfilled {stats['items']} sessions/entries ({stats['rows']} mood rows, "
+        f"{stats['relabelled']} fallback rows relabelled) in "
+        f"{time.perf_counter() - started:.1f}s; {stats['failed_batches']} batches failed; "
+        f"classifier: {classifier.stats}"
+    )
+
+
+if __name__ == "__main__":
+    main()
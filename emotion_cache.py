@@ -0,0 +1,149 @@
+"""Two-tier cache for emotion classifications: in-process LRU in front of SQLite."""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_DB_PATH = "emotion_cache.db"
+
+
+def normalize_text(text):
+    """Lowercase and collapse whitespace so trivially different inputs share a key."""
+    return " ".join(text.lower().split())
+
+
+def make_key(text, model):
+    """Stable cache key for a (text, model) pair."""
+    raw = f"{model}\x00{normalize_text(text)}".encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()
+
+
+class EmotionCache:
+    """Memoizes `{"label", "score"}` results by normalized text and model name.
+
+    The memory tier is an LRU shared by every session in the process; the disk
+    tier is a small SQLite table that survives restarts. Both tiers honour the
+    same TTL, and the disk tier is trimmed to `max_disk_items` by last access.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH, max_memory_items=1024,
+                 max_disk_items=50000, ttl_seconds=7 * 24 * 3600):
+        self.db_path = db_path
+        self.max_memory_items = max_memory_items
+        self.max_disk_items = max_disk_items
+        self.ttl_seconds = ttl_seconds
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes_since_trim = 0
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS emotion_cache ("
+            " key TEXT PRIMARY KEY, result TEXT NOT NULL,"
+            " created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_emotion_cache_accessed ON emotion_cache (accessed_at)"
+        )
+        self._conn.commit()
+
+    def _expired(self, created_at, now):
+        return self.ttl_seconds is not None and now - created_at > self.ttl_seconds
+
+    def _remember(self, key, result, created_at):
+        self._memory[key] = (result, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def get(self, text, model):
+        """Return the cached result, or None on a miss."""
+        key = make_key(text, model)
+        now = time.time()
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached is not None:
+                result, created_at = cached
+                if not self._expired(created_at, now):
+                    self._memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return dict(result)
+                del self._memory[key]
+
+            row = self._conn.execute(
+                "SELECT result, created_at FROM emotion_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                result, created_at = json.loads(row[0]), row[1]
+                if not self._expired(created_at, now):
+                    self._conn.execute(
+                        "UPDATE emotion_cache SET accessed_at = ? WHERE key = ?", (now, key)
+                    )
+                    self._conn.commit()
+                    self._remember(key, result, created_at)
+                    self.stats["disk_hits"] += 1
+                    return dict(result)
+                self._conn.execute("DELETE FROM emotion_cache WHERE key = ?", (key,))
+                self._conn.commit()
+
+            self.stats["misses"] += 1
+            return None
+
+    def set(self, text, model, result):
+        """Store a classification in both tiers."""
+        key = make_key(text, model)
+        now = time.time()
+        with self._lock:
+            self._remember(key, dict(result), now)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO emotion_cache (key, result, created_at, accessed_at)"
+                " VALUES (?, ?, ?, ?)",
+                (key, json.dumps(result), now, now),
+            )
+            self._writes_since_trim += 1
+            # Trimming needs a COUNT(*), so only do it every so often.
+            if self._writes_since_trim >= 100:
+                self._trim_disk(now)
+            self._conn.commit()
+
+    def _trim_disk(self, now):
+        self._writes_since_trim = 0
+        if self.ttl_seconds is not None:
+            self._conn.execute(
+                "DELETE FROM emotion_cache WHERE created_at < ?", (now - self.ttl_seconds,)
+            )
+        count = self._conn.execute("SELECT COUNT(*) FROM emotion_cache").fetchone()[0]
+        overflow = count - self.max_disk_items
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM emotion_cache WHERE key IN ("
+                " SELECT key FROM emotion_cache ORDER BY accessed_at ASC LIMIT ?)",
+                (overflow,),
+            )
+            self.stats["evictions"] += overflow
+
+    def clear(self):
+        """Drop every cached entry from both tiers."""
+        with self._lock:
+            self._memory.clear()
+            self._conn.execute("DELETE FROM emotion_cache")
+            self._conn.commit()
+
+    def snapshot(self):
+        """Hit/miss counters plus current tier sizes."""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["memory_items"] = len(self._memory)
+            stats["disk_items"] = self._conn.execute(
+                "SELECT COUNT(*) FROM emotion_cache"
+            ).fetchone()[0]
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
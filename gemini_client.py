@@ -0,0 +1,98 @@
+"""Process-wide Gemini client and a pool of live chat objects.
+
+One `genai.Client` (and so one pooled, keep-alive HTTP connection set) is
+shared by every session. `ChatPool` keeps a chat object per session id and
+hands it back on the next turn as long as its recorded history is exactly
+the history the app wants to send; otherwise the chat is rebuilt. The
+per-turn system instruction is passed with each message, so it never forces
+a rebuild. Idle chats are evicted after `idle_seconds`.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import httpx
+from google import genai
+from google.genai import types
+
+
+def make_client(api_key, max_connections=64, keepalive_seconds=120, base_url=None):
+    """Gemini client with an explicitly sized keep-alive connection pool.
+
+    `base_url` points it at another Gemini-compatible endpoint, such as the
+    fake server used by `benchmarks/bench_turns.py`.
+    """
+    limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_connections // 2,
+        keepalive_expiry=keepalive_seconds,
+    )
+    return genai.Client(
+        api_key=api_key,
+        http_options=types.HttpOptions(base_url=base_url, client_args={"limits": limits}),
+    )
+
+
+def history_fingerprint(entry):
+    """Hash of one Gemini-format history entry ({"role", "parts"})."""
+    raw = json.dumps(entry, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha1(raw).hexdigest()
+
+
+class ChatPool:
+    """Live chat objects per session, reused while their history still matches."""
+
+    def __init__(self, client, model, idle_seconds=1800, max_chats=1000):
+        self.client = client
+        self.model = model
+        self.idle_seconds = idle_seconds
+        self.max_chats = max_chats
+        self._chats = OrderedDict()  # session_id -> {"chat", "history", "last_used"}
+        self._lock = threading.Lock()
+        self.stats = {"reused": 0, "created": 0, "evicted": 0}
+
+    def _evict(self, now):
+        while self._chats:
+            session_id, entry = next(iter(self._chats.items()))
+            if len(self._chats) <= self.max_chats and now - entry["last_used"] < self.idle_seconds:
+                break
+            del self._chats[session_id]
+            self.stats["evicted"] += 1
+
+    def acquire(self, session_id, history):
+        """A chat whose history equals `history` (Gemini format, oldest first)."""
+        fingerprints = [history_fingerprint(entry) for entry in history]
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            entry = self._chats.get(session_id)
+            if entry is not None and entry["history"] == fingerprints:
+                entry["last_used"] = now
+                self._chats.move_to_end(session_id)
+                self.stats["reused"] += 1
+                return entry["chat"]
+
+        chat = self.client.chats.create(model=self.model, history=history)
+        with self._lock:
+            self._chats[session_id] = {"chat": chat, "history": fingerprints, "last_used": now}
+            self._chats.move_to_end(session_id)
+            self.stats["created"] += 1
+        return chat
+
+    def record_turn(self, session_id, user_entry, model_entry):
+        """Note the exchange the chat just added to its own history."""
+        with self._lock:
+            entry = self._chats.get(session_id)
+            if entry is not None:
+                entry["history"] += [history_fingerprint(user_entry), history_fingerprint(model_entry)]
+
+    def discard(self, session_id):
+        """Forget a session's chat, e.g. after a failed turn left its history uncertain."""
+        with self._lock:
+            self._chats.pop(session_id, None)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, live=len(self._chats))
@@ -0,0 +1,166 @@
+"""Process-wide scheduler in front of every Gemini call.
+
+All sessions share one token bucket (sized to the API quota) and one pool of
+concurrency slots. Waiting callers are served strictly by priority, then
+arrival, so reply streams go ahead of mood classification, which goes ahead
+of background summaries. Rate-limit and server errors (429/5xx) and
+transport failures are retried with full-jitter exponential backoff; a
+stream is only retried before its first chunk has been delivered.
+"""
+import heapq
+import itertools
+import random
+import threading
+import time
+
+import httpx
+
+PRIORITY_REPLY = 0
+PRIORITY_EMOTION = 1
+PRIORITY_BACKGROUND = 2
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+_END = object()
+
+
+class SchedulerTimeout(Exception):
+    """Raised when a call waited longer than its timeout for a slot."""
+
+
+def is_retryable(exc):
+    """Quota, server and connection errors are worth another attempt."""
+    if isinstance(exc, httpx.TransportError):
+        return True
+    return getattr(exc, "code", None) in RETRYABLE_STATUS
+
+
+class GeminiScheduler:
+    """Token bucket + bounded concurrency + priority queue + retries."""
+
+    def __init__(self, requests_per_minute=60, burst=10, max_concurrent=8,
+                 max_retries=4, base_delay=0.5, max_delay=8.0):
+        self.rate = requests_per_minute / 60.0
+        self.burst = burst
+        self.max_concurrent = max_concurrent
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._tokens = float(burst)
+        self._refilled_at = time.monotonic()
+        self._in_flight = 0
+        self._waiting = []  # heap of (priority, seq)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self.stats = {
+            "calls": 0, "retries": 0, "failures": 0, "timeouts": 0,
+            "max_queue_depth": 0, "wait_seconds": 0.0,
+        }
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    def _acquire(self, priority, timeout):
+        started = time.monotonic()
+        deadline = None if timeout is None else started + timeout
+        with self._cond:
+            ticket = (priority, next(self._seq))
+            heapq.heappush(self._waiting, ticket)
+            self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], len(self._waiting))
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = None
+                    if self._waiting[0] == ticket and self._in_flight < self.max_concurrent:
+                        self._refill(now)
+                        if self._tokens >= 1:
+                            self._tokens -= 1
+                            heapq.heappop(self._waiting)
+                            self._in_flight += 1
+                            self.stats["wait_seconds"] += now - started
+                            self._cond.notify_all()
+                            return
+                        wait = (1 - self._tokens) / self.rate
+                    if deadline is not None:
+                        if now >= deadline:
+                            self.stats["timeouts"] += 1
+                            raise SchedulerTimeout(f"no Gemini slot within {timeout:g}s")
+                        wait = deadline - now if wait is None else min(wait, deadline - now)
+                    self._cond.wait(wait)
+            except BaseException:
+                if ticket in self._waiting:
+                    self._waiting.remove(ticket)
+                    heapq.heapify(self._waiting)
+                    self._cond.notify_all()
+                raise
+
+    def _release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def _count(self, key):
+        # Calls come from many sessions' threads at once
+        with self._cond:
+            self.stats[key] += 1
+
+    def _backoff(self, attempt):
+        self._count("retries")
+        time.sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt)))
+
+    def call(self, priority, func, *args, timeout=None, **kwargs):
+        """Run `func(*args, **kwargs)` in a slot, retrying transient failures."""
+        self._count("calls")
+        for attempt in itertools.count():
+            self._acquire(priority, timeout)
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    self._count("failures")
+                    raise
+            finally:
+                self._release()
+            self._backoff(attempt)
+
+    def stream(self, priority, start, timeout=None):
+        """Iterate the stream returned by `start()`, holding one slot until it ends.
+
+        Failures before the first chunk are retried like `call`; after that
+        they propagate, since part of the reply has already been shown.
+        """
+        self._count("calls")
+        for attempt in itertools.count():
+            self._acquire(priority, timeout)
+            try:
+                iterator = iter(start())
+                first = next(iterator, _END)
+                break
+            except Exception as e:
+                self._release()
+                if attempt >= self.max_retries or not is_retryable(e):
+                    self._count("failures")
+                    raise
+            self._backoff(attempt)
+        try:
+            if first is not _END:
+                yield first
+                yield from iterator
+        finally:
+            self._release()
+
+    def snapshot(self):
+        """Queue depth and counters for monitoring."""
+        with self._cond:
+            stats = dict(self.stats)
+            stats["queue_depth"] = len(self._waiting)
+            stats["queued_by_priority"] = {
+                name: sum(1 for p, _ in self._waiting if p == value)
+                for name, value in (("reply", PRIORITY_REPLY), ("emotion", PRIORITY_EMOTION),
+                                    ("background", PRIORITY_BACKGROUND))
+            }
+            stats["in_flight"] = self._in_flight
+            stats["tokens"] = round(self._tokens, 2)
+        return stats
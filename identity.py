@@ -0,0 +1,67 @@
+"""Who the visitor is, for keying their private chats, moods and journal.
+
+The name typed in the sidebar is only used to greet the user; anyone can
+type any name, so it never selects whose data is shown. Storage is keyed
+by the signed-in account when the deployment has Streamlit authentication
+configured (`st.user`), and otherwise by a random per-browser token kept
+in the page URL (`?u=`). Tokens are signed with a server secret, so the
+app only accepts tokens it issued itself; bookmarking the page keeps the
+same data across visits.
+
+The secret comes from `SERENITY_SECRET`, or is generated once and kept in
+`serenity_secret.key` (readable by the owner only).
+"""
+import hashlib
+import hmac
+import os
+import secrets
+
+TOKEN_PARAM = "u"
+SECRET_PATH = "serenity_secret.key"
+_SIGNATURE_CHARS = 32
+
+
+def load_secret(value=None, path=SECRET_PATH):
+    """The signing secret as bytes: `value` if given, else the key file, created on first use."""
+    if value:
+        return value.encode("utf-8")
+    try:
+        with open(path, "rb") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        pass
+    secret = secrets.token_hex(32).encode("ascii")
+    try:
+        # O_EXCL: if another process created it first, use theirs
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        with open(path, "rb") as f:
+            return f.read().strip()
+    with os.fdopen(fd, "wb") as f:
+        f.write(secret)
+    return secret
+
+
+def _sign(secret, nonce):
+    return hmac.new(secret, nonce.encode("ascii"), hashlib.sha256).hexdigest()[:_SIGNATURE_CHARS]
+
+
+def issue_token(secret):
+    """A new browser token: 128 random bits plus their signature."""
+    nonce = secrets.token_hex(16)
+    return f"{nonce}.{_sign(secret, nonce)}"
+
+
+def browser_key(secret, token):
+    """Storage key for a browser token, or None if the token is malformed or not signed by us."""
+    nonce, _, signature = (token or "").partition(".")
+    if len(nonce) != 32 or not all(c in "0123456789abcdef" for c in nonce):
+        return None
+    if not hmac.compare_digest(signature, _sign(secret, nonce)):
+        return None
+    return f"browser:{nonce}"
+
+
+def account_key(subject):
+    """Storage key for a signed-in account (the identity provider's subject or email)."""
+    return f"account:{subject}"
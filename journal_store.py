@@ -0,0 +1,107 @@
+"""Persistent journal entries on SQLite.
+
+Entries keep the `analysis` computed when they were written, so loading a
+page never re-classifies anything. Pages are read newest first through an
+index on (user_id, created_at), so only the rows on screen are fetched.
+"""
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta
+
+from mood_store import connect
+
+DEFAULT_DB_PATH = "journal.db"
+
+
+class JournalStore:
+    """Journal entries per user, paged by date."""
+
+    def __init__(self, db_path=DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = connect(db_path)
+        self._conn.row_factory = sqlite3.Row
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS journal_entries ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " user_id TEXT, created_at TEXT NOT NULL, date TEXT NOT NULL,"
+                " text TEXT NOT NULL, mood TEXT,"
+                " emotion TEXT, confidence REAL, tone TEXT)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_journal_user_created"
+                " ON journal_entries (user_id, created_at DESC)"
+            )
+
+    def add(self, entry, user_id=None, created_at=None):
+        """Store an entry shaped like the journal tab's dicts; returns its id."""
+        analysis = entry.get("analysis") or {}
+        created_at = created_at or datetime.now().isoformat(timespec="seconds")
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO journal_entries"
+                " (user_id, created_at, date, text, mood, emotion, confidence, tone)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    user_id, created_at, entry["date"], entry["text"], entry.get("mood"),
+                    analysis.get("emotion"), analysis.get("confidence"), analysis.get("tone"),
+                ),
+            )
+            return cursor.lastrowid
+
+    @staticmethod
+    def _to_entry(row):
+        entry = {
+            "id": row["id"],
+            "created_at": row["created_at"],
+            "date": row["date"],
+            "text": row["text"],
+            "mood": row["mood"],
+        }
+        if row["emotion"] is not None:
+            entry["analysis"] = {
+                "emotion": row["emotion"],
+                "confidence": row["confidence"],
+                "tone": row["tone"],
+            }
+        return entry
+
+    def page(self, user_id=None, page=0, page_size=5, day=None):
+        """One page of entries, newest first; `day` ("YYYY-MM-DD") narrows it to one date."""
+        query = "SELECT * FROM journal_entries WHERE user_id IS ?"
+        params = [user_id]
+        if day:
+            next_day = (date.fromisoformat(day) + timedelta(days=1)).isoformat()
+            query += " AND created_at >= ? AND created_at < ?"
+            params += [day, next_day]
+        query += " ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?"
+        params += [page_size, page * page_size]
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [self._to_entry(row) for row in rows]
+
+    def stats(self, user_id=None):
+        """Entry count and how many were analysed as positive, without loading entries."""
+        with self._lock:
+            total, positive = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(tone LIKE '%Positive%'), 0)"
+                " FROM journal_entries WHERE user_id IS ?",
+                (user_id,),
+            ).fetchone()
+        return {"total": total, "positive": positive}
+
+    def iter_entries(self, batch_size=500):
+        """Every entry of every user, oldest first, fetched in batches."""
+        last_id = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT * FROM journal_entries WHERE id > ? ORDER BY id LIMIT ?",
+                    (last_id, batch_size),
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield dict(self._to_entry(row), user_id=row["user_id"])
+            last_id = rows[-1]["id"]
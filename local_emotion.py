@@ -0,0 +1,169 @@
+"""Fast offline emotion classifier used as the first tier before Gemini.
+
+A weighted unigram/bigram lexicon is compiled into a (vocabulary x emotion)
+NumPy matrix; scoring a batch is one matrix product over term counts.
+Words after a negation ("not happy", "don't love") are scored through a
+separate matrix that turns negated positive words into sadness and drops
+negated negative ones. A negation only reaches to the end of its clause
+("no, I'm fine" is not negated), and one followed by "stop" or "help"
+("can't stop crying") cancels out. Results use the same `{"label", "score"}` shape as
+`get_ai_emotion`. The score is the confidence: the winning emotion's share of
+all evidence, damped by a prior so that a single weak word stays uncertain.
+"""
+import re
+
+import numpy as np
+
+from crisis import normalize
+
+EMOTIONS = ["joy", "sadness", "anger", "fear", "surprise", "love", "disgust"]
+
+LEXICON = {
+    "joy": {
+        "happy": 1.0, "glad": 0.9, "great": 0.7, "good": 0.5, "amazing": 0.9, "awesome": 0.9,
+        "excited": 1.0, "wonderful": 0.9, "fantastic": 0.9, "cheerful": 1.0, "joy": 1.0,
+        "joyful": 1.0, "proud": 0.8, "relieved": 0.8, "grateful": 0.8, "thankful": 0.8,
+        "delighted": 1.0, "fun": 0.6, "yay": 1.0, "smile": 0.6, "smiling": 0.7, "laugh": 0.6,
+        "better": 0.5, "calm": 0.5, "peaceful": 0.7, "passed": 0.6, "celebrate": 0.8,
+        "feeling good": 1.0, "so happy": 1.2, "good day": 0.9, "went well": 0.9,
+    },
+    "sadness": {
+        "sad": 1.0, "unhappy": 1.0, "down": 0.6, "depressed": 1.0, "lonely": 1.0, "alone": 0.7,
+        "cry": 0.9, "crying": 1.0, "cried": 0.9, "tears": 0.8, "miss": 0.6, "lost": 0.6,
+        "hurt": 0.7, "empty": 0.8, "tired": 0.5, "exhausted": 0.6, "heartbroken": 1.0,
+        "grief": 1.0, "upset": 0.8, "disappointed": 0.8, "failed": 0.7, "failing": 0.7,
+        "worthless": 1.0, "useless": 0.8, "miserable": 1.0, "gloomy": 0.9, "numb": 0.7,
+        "broke up": 1.0, "let down": 0.9, "feel like crying": 1.2, "feeling low": 1.0,
+    },
+    "anger": {
+        "angry": 1.0, "mad": 0.9, "furious": 1.0, "annoyed": 0.8, "irritated": 0.8,
+        "frustrated": 0.9, "frustrating": 0.8, "hate": 0.9, "rage": 1.0, "pissed": 1.0,
+        "unfair": 0.8, "outraged": 1.0, "resent": 0.9, "sick of": 0.9, "fed up": 1.0,
+        "so annoying": 1.0, "yelled": 0.7, "shouted": 0.7, "argue": 0.6, "fight": 0.6,
+    },
+    "fear": {
+        "scared": 1.0, "afraid": 1.0, "anxious": 1.0, "anxiety": 1.0, "nervous": 0.9,
+        "worried": 0.9, "worry": 0.8, "stressed": 0.9, "stress": 0.8, "panic": 1.0,
+        "panicking": 1.0, "terrified": 1.0, "fear": 1.0, "overwhelmed": 0.9, "dread": 0.9,
+        "frightened": 1.0, "tense": 0.6, "uneasy": 0.7, "exam": 0.4, "exams": 0.4,
+        "deadline": 0.4, "stressed out": 1.1, "freaking out": 1.1, "cant sleep": 0.7,
+    },
+    "surprise": {
+        "surprised": 1.0, "shocked": 0.9, "wow": 0.8, "unexpected": 0.9, "suddenly": 0.5,
+        "cant believe": 0.9, "unbelievable": 0.8, "amazed": 0.8, "astonished": 1.0,
+        "no way": 0.7, "out of nowhere": 0.8,
+    },
+    "love": {
+        "love": 1.0, "loving": 0.9, "loved": 0.9, "adore": 1.0, "crush": 0.8, "care": 0.5,
+        "caring": 0.6, "affection": 0.9, "sweetheart": 0.8, "romantic": 0.8, "girlfriend": 0.5,
+        "boyfriend": 0.5, "partner": 0.4, "in love": 1.2, "miss you": 0.8, "hug": 0.6,
+    },
+    "disgust": {
+        "disgusted": 1.0, "disgusting": 1.0, "gross": 0.9, "eww": 1.0, "nasty": 0.8,
+        "revolting": 1.0, "sickening": 0.9, "repulsive": 1.0, "vile": 0.9, "creepy": 0.6,
+        "makes me sick": 1.1,
+    },
+}
+
+NEGATORS = {
+    "not", "no", "never", "dont", "didnt", "doesnt", "isnt", "wasnt", "arent", "werent",
+    "cant", "cannot", "couldnt", "wont", "wouldnt", "hardly", "barely", "nothing", "nobody",
+}
+NEGATION_WINDOW = 3
+# A negator followed by one of these says the next words do happen ("can't stop crying", "couldn't help laughing")
+NEGATION_CANCELLERS = {"stop", "help", "quit"}
+# Negation never carries past these
+_CLAUSE_BREAKS = re.compile(r"[,.;:!?…—]+|\bbut\b", re.IGNORECASE)
+# Share of a negated positive word's weight that counts as sadness ("not happy")
+NEGATED_POSITIVE_TO_SADNESS = 0.7
+POSITIVE = {"joy", "love"}
+
+
+class LocalEmotionClassifier:
+    """Lexicon classifier with NumPy-vectorized batch scoring."""
+
+    def __init__(self, lexicon=LEXICON, prior=0.5):
+        self.emotions = list(EMOTIONS)
+        self.prior = prior
+        self.vocab = {}
+        rows = []
+        for emotion, terms in lexicon.items():
+            column = self.emotions.index(emotion)
+            for term, weight in terms.items():
+                term = normalize(term)
+                if term not in self.vocab:
+                    self.vocab[term] = len(self.vocab)
+                    rows.append(np.zeros(len(self.emotions)))
+                rows[self.vocab[term]][column] += weight
+        self.weights = np.vstack(rows) if rows else np.zeros((0, len(self.emotions)))
+
+        sadness = self.emotions.index("sadness")
+        positive = [self.emotions.index(e) for e in POSITIVE]
+        self.negated_weights = np.zeros_like(self.weights)
+        self.negated_weights[:, sadness] = self.weights[:, positive].sum(axis=1) * NEGATED_POSITIVE_TO_SADNESS
+
+    def _term_hits(self, text):
+        """Vocabulary indices found in `text`, split into plain and negated hits."""
+        plain, negated = [], []
+        for clause in _CLAUSE_BREAKS.split(text):
+            tokens = normalize(clause).split()
+            negators = [
+                i for i, token in enumerate(tokens)
+                if token in NEGATORS and not (i + 1 < len(tokens) and tokens[i + 1] in NEGATION_CANCELLERS)
+            ]
+            for i, token in enumerate(tokens):
+                is_negated = any(i - NEGATION_WINDOW <= j < i for j in negators)
+                hits = negated if is_negated else plain
+                if token in self.vocab:
+                    hits.append(self.vocab[token])
+                if i + 1 < len(tokens):
+                    bigram = f"{token} {tokens[i + 1]}"
+                    if bigram in self.vocab:
+                        hits.append(self.vocab[bigram])
+        return plain, negated
+
+    def scores(self, texts):
+        """(len(texts) x emotions) matrix of raw evidence."""
+        plain_counts = np.zeros((len(texts), len(self.vocab)))
+        negated_counts = np.zeros((len(texts), len(self.vocab)))
+        for row, text in enumerate(texts):
+            plain, negated = self._term_hits(text)
+            np.add.at(plain_counts[row], plain, 1.0)
+            np.add.at(negated_counts[row], negated, 1.0)
+        return plain_counts @ self.weights + negated_counts @ self.negated_weights
+
+    def classify_batch(self, texts):
+        """Classify many texts in one pass; texts with no evidence come back neutral with score 0."""
+        if not texts:
+            return []
+        evidence = self.scores(texts)
+        best = evidence.argmax(axis=1)
+        top = evidence[np.arange(len(texts)), best]
+        confidence = top / (evidence.sum(axis=1) + self.prior)
+        return [
+            {"label": self.emotions[b], "score": round(float(c), 3)} if t > 0
+            else {"label": "neutral", "score": 0.0}
+            for b, t, c in zip(best, top, confidence)
+        ]
+
+    def classify(self, text):
+        return self.classify_batch([text])[0]
+
+
+_default_classifier = None
+
+
+def get_classifier():
+    """Lazily built shared classifier."""
+    global _default_classifier
+    if _default_classifier is None:
+        _default_classifier = LocalEmotionClassifier()
+    return _default_classifier
+
+
+def classify(text):
+    return get_classifier().classify(text)
+
+
+def classify_batch(texts):
+    return get_classifier().classify_batch(texts)
@@ -1,17 +1,32 @@
-
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 print("🚀 Serenity App Starting...")
-import pandas as pd
-import plotly.express as px
-from google import genai
 from google.genai import types
 from datetime import datetime
 import os
 import time
 import random
-import urllib.parse
+import functools
 import json
-import glob
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from emotion_cache import EmotionCache
+import chat_store
+from crisis import check_crisis
+from mood_store import MoodStore
+from mood_analytics import MoodAnalytics
+import local_emotion
+from journal_store import JournalStore
+import chat_context
+import chat_export
+from gemini_client import ChatPool, make_client
+from gemini_scheduler import GeminiScheduler, PRIORITY_BACKGROUND, PRIORITY_EMOTION, PRIORITY_REPLY
+from metrics import Metrics
+from stream_render import StreamRenderer, render_bubble
+from search_index import SearchIndex
+from write_behind import WriteBehind
+from breathing import breathing_html
+import identity
 
 # --- Page Configuration ---
 st.set_page_config(
@@ -22,231 +37,246 @@ st.set_page_config(
 )
 
 # --- Custom CSS for Styling ---
-st.markdown("""
-<style>
-    /* Import Google Fonts */
-    @import url('https://fonts.googleapis.com/css2?family=Nunito:wght@300;400;600;700&display=swap');
-
-    /* General App Styling */
-    .stApp {
-        background-color: #fdfbf7; /* Soft Beige Background */
-        font-family: 'Nunito', sans-serif;
-    }
+@st.cache_resource
+def load_css():
+    """Markup that applies static/serenity.css.
 
-    h1, h2, h3, h4, h5, h6, .stMarkdown, p, div {
-        font-family: 'Nunito', sans-serif !important;
-        color: #4a4a4a;
-    }
+    With static serving on, a small link the browser caches (the version
+    query changes when the file does); otherwise the stylesheet inlined.
+    """
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "serenity.css")
+    if st.get_option("server.enableStaticServing"):
+        return f'<link rel="stylesheet" href="app/static/serenity.css?v={int(os.path.getmtime(path))}">'
+    with open(path, "r", encoding="utf-8") as f:
+        return f"<style>\n{f.read()}</style>"
 
-    /* Tabs Styling */
-    .stTabs [data-baseweb="tab-list"] {
-        gap: 20px;
-    }
-    .stTabs [data-baseweb="tab"] {
-        height: 50px;
-        white-space: pre-wrap;
-        background-color: #fff;
-        border-radius: 20px;
-        color: #4a4a4a;
-        box-shadow: 0 2px 5px rgba(0,0,0,0.05);
-        padding: 0 20px;
-        font-weight: 600;
-    }
-    .stTabs [aria-selected="true"] {
-        background-color: #e6e6fa !important; /* Lavender */
-        color: #5d4e8c !important;
-        border-bottom: none;
-    }
+st.markdown(load_css(), unsafe_allow_html=True)
 
-    /* Custom Chat Bubbles */
-    .user-bubble {
-        background-color: #e3f2fd;
-        color: #4a4a4a;
-        padding: 12px 18px;
-        border-radius: 20px 20px 0 20px;
-        margin-bottom: 15px;
-        text-align: right;
-        width: fit-content;
-        margin-left: auto;
-        border: 1px solid #d1e7f7;
-        box-shadow: 0 2px 4px rgba(0,0,0,0.05);
-        max-width: 75%;
-    }
-    .bot-bubble {
-        background-color: #fff0f5;
-        color: #4a4a4a;
-        padding: 12px 18px;
-        border-radius: 20px 20px 20px 0;
-        margin-bottom: 15px;
-        width: fit-content;
-        margin-right: auto;
-        border: 1px solid #fce4ec;
-        box-shadow: 0 2px 4px rgba(0,0,0,0.05);
-        max-width: 75%;
-    }
-    .timestamp {
-        font-size: 0.7rem;
-        color: #888;
-        margin-top: 5px;
-        display: block;
-    }
-    
-    /* Game Buttons */
-    .game-btn {
-        height: 100px;
-        width: 100%;
-        font-size: 24px;
-        border-radius: 15px;
-    }
 
-    /* Text Input Styling */
-    .stTextInput > div > div > input, .stTextArea > div > div > textarea {
-        background-color: #ffffff;
-        border-radius: 15px;
-        border: 1px solid #e0e0e0;
-        padding: 10px;
-    }
+# --- API & Model Setup ---
 
-    /* Cards for Journal */
-    .journal-card {
-        background-color: white;
-        padding: 20px;
-        border-radius: 20px;
-        box-shadow: 0 4px 6px rgba(0,0,0,0.05);
-        margin-bottom: 20px;
-        border: 1px solid #f0f0f0;
-    }
-    
-    /* Sidebar */
-    [data-testid="stSidebar"] {
-        background-color: #f7f9fc;
-        border-right: 1px solid #edf2f7;
-    }
-    
-    /* Share Button Style */
-    .share-btn {
-        display: inline-block;
-        padding: 0.5em 1em;
-        color: #ffffff;
-        background-color: #ffb7b2;
-        border-radius: 20px;
-        text-decoration: none;
-        font-weight: bold;
-        text-align: center;
-        margin-top: 10px;
-    }
-    .share-btn:hover {
-        background-color: #ff9e99;
-        color: white;
-    }
-    
-    /* History Button Style */
-    .history-btn {
-        width: 100%;
-        text-align: left;
-        padding: 8px;
-        background: white;
-        border: 1px solid #eee;
-        border-radius: 10px;
-        margin-bottom: 5px;
-        cursor: pointer;
-    }
-    .history-btn:hover {
-        background: #f0f0f0;
-    }
-    
-    /* Mood Card */
-    .mood-card {
-        background: linear-gradient(135deg, #f5f7fa 0%, #c3cfe2 100%);
-        padding: 15px;
-        border-radius: 15px;
-        margin-bottom: 10px;
-        border-left: 5px solid #5d4e8c;
-        box-shadow: 0 4px 15px rgba(0,0,0,0.05);
-    }
-    .mood-stat {
-        font-size: 0.9rem;
-        font-weight: 700;
-        color: #5d4e8c;
-    }
-    
-    /* Crisis Banner */
-    .crisis-banner {
-        background-color: #ffebee;
-        border: 2px solid #ef5350;
-        padding: 20px;
-        border-radius: 15px;
-        color: #c62828;
-        margin-bottom: 20px;
-        animation: pulse 2s infinite;
-    }
-    @keyframes pulse {
-        0% { transform: scale(1); }
-        50% { transform: scale(1.02); }
-        100% { transform: scale(1); }
-    }
+GEMINI_MODEL = "gemini-flash-latest"
 
-    /* Journal Analytics */
-    .journal-ana {
-        background-color: #e8f5e9;
-        padding: 10px;
-        border-radius: 10px;
-        font-size: 0.85rem;
-        margin-top: 10px;
-        border-left: 3px solid #4caf50;
-    }
-</style>
-""", unsafe_allow_html=True)
+# 1. Load Gemini API Key and settings
+@st.cache_resource
+def load_settings():
+    """API key and tuning settings, read once per process from the environment or st.secrets.
 
+    Raises KeyError when no API key is configured; failures are not cached,
+    so adding the key takes effect on the next rerun.
+    """
+    def setting(name, default=None):
+        return os.environ.get(name) or st.secrets.get(name, default)
 
-# --- API & Model Setup ---
+    api_key = st.secrets.get("GEMINI_API_KEY")
+    if not api_key:
+        raise KeyError("GEMINI_API_KEY")
+    return {
+        "api_key": api_key,
+        # Alternative Gemini endpoint, e.g. the local fake server used by the benchmarks
+        "base_url": setting("SERENITY_GEMINI_BASE_URL"),
+        # "parallel" classifies the mood while the reply streams; "serial" waits for the mood first.
+        "turn_mode": setting("SERENITY_TURN_MODE", "parallel"),
+        # Local classifier results at or above this confidence skip Gemini (0 = never ask Gemini, above 1 = always)
+        "emotion_local_threshold": float(setting("SERENITY_EMOTION_LOCAL_THRESHOLD", 0.75)),
+        # Token budget for conversation history sent with each reply (older turns are summarized)
+        "context_tokens": int(setting("SERENITY_CONTEXT_TOKENS", 2000)),
+        # Gemini quota shared by every session in this process
+        "gemini_rpm": int(setting("SERENITY_GEMINI_RPM", 60)),
+        "gemini_concurrency": int(setting("SERENITY_GEMINI_CONCURRENCY", 8)),
+        # Where stage timings are exported (spans.jsonl + metrics.prom); empty keeps them in memory only
+        "metrics_dir": os.environ.get("SERENITY_METRICS_DIR", st.secrets.get("SERENITY_METRICS_DIR", "metrics")),
+        # Streamed replies are redrawn at most this often, or once this many new bytes are waiting
+        "stream_interval_ms": float(setting("SERENITY_STREAM_INTERVAL_MS", 100)),
+        "stream_flush_bytes": int(setting("SERENITY_STREAM_FLUSH_BYTES", 512)),
+        # Signs the per-browser tokens that key private data (generated into serenity_secret.key if unset)
+        "identity_secret": setting("SERENITY_SECRET"),
+        # Show recent latency percentiles in the sidebar
+        "admin_panel": str(setting("SERENITY_ADMIN_PANEL", "")).lower() in ("1", "true", "yes"),
+    }
 
-# 1. Load Gemini API Key
 try:
-    if "GEMINI_API_KEY" in st.secrets:
-        api_key = st.secrets["GEMINI_API_KEY"]
-    else:
-        api_key = st.secrets.get("GEMINI_API_KEY") 
-        if not api_key:
-            st.error("🚨 Gemini API Key not found in st.secrets. Please configure .streamlit/secrets.toml")
-            st.stop()
+    settings = load_settings()
+except KeyError:
+    st.error("🚨 Gemini API Key not found in st.secrets. Please configure .streamlit/secrets.toml")
+    st.stop()
 except FileNotFoundError:
     st.error("🚨 .streamlit/secrets.toml file not found.")
     st.stop()
 
-client = genai.Client(api_key=api_key)
+api_key = settings["api_key"]
+TURN_MODE = settings["turn_mode"]
+EMOTION_LOCAL_THRESHOLD = settings["emotion_local_threshold"]
+CONTEXT_BUDGET_TOKENS = settings["context_tokens"]
+ADMIN_PANEL = settings["admin_panel"]
+
+@st.cache_resource
+def get_client(api_key):
+    """One Gemini client (and HTTP connection pool) for the whole process."""
+    return make_client(api_key, base_url=settings["base_url"])
+
+@st.cache_resource
+def get_chat_pool(api_key):
+    """Live chat objects per session id, reused across turns."""
+    return ChatPool(get_client(api_key), GEMINI_MODEL, idle_seconds=1800)
+
+@st.cache_resource
+def get_scheduler():
+    """Rate limit, concurrency cap and priorities for every Gemini call in the process."""
+    rpm = settings["gemini_rpm"]
+    return GeminiScheduler(requests_per_minute=rpm, burst=max(1, rpm // 6),
+                           max_concurrent=settings["gemini_concurrency"])
+
+@st.cache_resource
+def get_metrics():
+    """Stage timings for every session in the process."""
+    return Metrics(settings["metrics_dir"] or None)
+
+client = get_client(api_key)
+# Resolved once here so worker threads (emotion, summaries) can use them without a script context
+scheduler = get_scheduler()
+metrics = get_metrics()
+
+@st.cache_resource
+def get_emotion_cache():
+    """One classification cache per process, shared by every session."""
+    return EmotionCache(
+        db_path="emotion_cache.db",
+        max_memory_items=1024,
+        max_disk_items=50000,
+        ttl_seconds=7 * 24 * 3600,
+    )
+
+def known_emotion(text, cache, check_cache=True):
+    """(emotion from the cache or a confident local guess, else None; the local guess).
+
+    At a threshold of 0 every local guess counts as confident, even "neutral" with no evidence,
+    so Gemini is never asked.
+    """
+    if check_cache:
+        cached = cache.get(text, GEMINI_MODEL)
+        if cached is not None:
+            return cached, None
+    local = local_emotion.classify(text)
+    return (local if local["score"] >= EMOTION_LOCAL_THRESHOLD else None), local
+
+def get_quick_emotion(text):
+    """Emotion from the cache or a confident local guess, without touching the network; else None."""
+    return known_emotion(text, get_emotion_cache())[0]
 
 # 2. Lightweight AI Emotion Detection (Replaces heavy Transformers/Torch)
-def get_ai_emotion(text):
-    """Detect emotion and confidence using Gemini instead of heavy local models."""
+def get_ai_emotion(text, check_cache=True, cache=None):
+    """Detect emotion and confidence: local lexicon first, Gemini only when it is unsure."""
+    # Worker threads have no script context, so they pass the cache in explicitly
+    cache = cache or get_emotion_cache()
+    known, local = known_emotion(text, cache, check_cache)
+    if known is not None:
+        return known
     try:
         prompt = f"""
         Analyze the emotion in this text: "{text}"
         Choose ONE from: joy, sadness, anger, fear, surprise, love, disgust.
         Return the result in JSON format: {{"label": "emotion", "score": 0.95}}
         """
-        res = client.models.generate_content(
-            model="gemini-flash-latest",
+        res = scheduler.call(
+            PRIORITY_EMOTION,
+            client.models.generate_content,
+            model=GEMINI_MODEL,
             contents=prompt,
-            config=types.GenerateContentConfig(response_mime_type="application/json")
+            config=types.GenerateContentConfig(response_mime_type="application/json"),
+            timeout=10,
         )
         data = json.loads(res.text)
+        data = {"label": str(data["label"]).lower(), "score": float(data["score"])}
+        # Only real classifications are cached; the fallback below never is.
+        cache.set(text, GEMINI_MODEL, data)
         return data
     except Exception as e:
+        # Prefer a low-confidence local guess over a blind "neutral"
+        if local["score"] > 0:
+            return local
         return {"label": "neutral", "score": 1.0}
 
+@st.cache_resource
+def get_turn_executor():
+    """Shared pool for emotion calls that run alongside the reply stream."""
+    return ThreadPoolExecutor(max_workers=8, thread_name_prefix="serenity-emotion")
+
 # --- Helper Functions ---
 
-def save_mood_to_csv(mood):
-    """Save detected mood to a CSV file."""
-    file_path = "mood_log.csv"
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    new_data = pd.DataFrame({"Timestamp": [timestamp], "Mood": [mood]})
-    
-    if not os.path.exists(file_path):
-        new_data.to_csv(file_path, index=False)
-    else:
-        new_data.to_csv(file_path, mode='a', header=False, index=False)
+@st.cache_resource
+def get_mood_store():
+    """Process-wide mood store; folds in the legacy mood_log.csv the first time."""
+    store = MoodStore("mood_log.db", flush_interval=1.0)
+    store.import_csv("mood_log.csv")
+    return store
+
+@st.cache_resource
+def get_mood_analytics():
+    """Shared trend engine; keeps its daily aggregates between reruns and restarts."""
+    return MoodAnalytics("mood_log.db", cache_path="mood_daily.json")
+
+@st.cache_resource
+def get_journal_store():
+    """Process-wide handle on the journal database."""
+    return JournalStore("journal.db")
+
+@st.cache_resource
+def get_search_index():
+    """Full-text index of chats and journal entries, built from existing data on first use."""
+    index = SearchIndex("search_index.db")
+    if index.is_empty():
+        index.rebuild(chat_store.HISTORY_DIR, get_journal_store())
+    return index
+
+def record_flush(seconds, jobs, oldest_wait):
+    """Write-behind batch timings: how long the batch took and how long its oldest save waited."""
+    metrics.observe("write_behind_flush", seconds, jobs=jobs)
+    metrics.observe("write_behind_wait", oldest_wait)
+
+@st.cache_resource
+def get_writer():
+    """Process-wide write-behind queue for chat saves and deletes; drained at exit."""
+    return WriteBehind(on_flush=record_flush)
+
+@st.cache_resource
+def get_identity_secret():
+    return identity.load_secret(settings["identity_secret"])
+
+def resolve_user_key():
+    """This visitor's storage key: their account when signed in, else the signed browser token in the URL."""
+    if st.user.get("is_logged_in"):
+        return identity.account_key(st.user.get("sub") or st.user.get("email"))
+    secret = get_identity_secret()
+    key = identity.browser_key(secret, st.query_params.get(identity.TOKEN_PARAM))
+    if key is None:
+        # First visit (or a token we did not sign): issue one and keep it in the URL
+        token = identity.issue_token(secret)
+        st.query_params[identity.TOKEN_PARAM] = token
+        key = identity.browser_key(secret, token)
+    return key
+
+def current_user_id():
+    """Key for this user's chats, moods and journal; never the display name, which anyone can type."""
+    return st.session_state.user_key
+
+def user_history_dir():
+    """This user's own chat history directory."""
+    return chat_store.user_history_dir(current_user_id())
+
+def rerun_region():
+    """Rerun only the fragment this is called from, or the whole app when the fragment ran as part of it."""
+    ctx = get_script_run_ctx()
+    st.rerun(scope="fragment" if ctx is not None and ctx.fragment_ids_this_run else "app")
+
+def save_mood(mood):
+    """Queue the detected mood for the background writer."""
+    with metrics.span("save_mood", session_id=st.session_state.session_id):
+        get_mood_store().record(
+            mood,
+            session_id=st.session_state.session_id,
+            user_id=current_user_id(),
+        )
         
 import re
 
@@ -261,67 +291,129 @@ def generate_chat_title():
             return title.capitalize()
     return "New Chat"
 
+def current_summary():
+    """Rolling summary state for the active session, reset when the session changed."""
+    state = st.session_state.chat_summary
+    if state["session_id"] != st.session_state.session_id or state["upto"] > len(st.session_state.messages):
+        state = {"session_id": st.session_state.session_id, "text": "", "upto": 0}
+        st.session_state.chat_summary = state
+    return state
+
+def apply_summary_job():
+    """Adopt a background summary update once it has finished."""
+    job = st.session_state.summary_job
+    if job is None or not job["future"].done():
+        return
+    st.session_state.summary_job = None
+    if job["session_id"] != st.session_state.session_id or job["future"].exception() is not None:
+        return
+    st.session_state.chat_summary = {
+        "session_id": job["session_id"],
+        "text": job["future"].result(),
+        "upto": job["upto"],
+    }
+
+def schedule_summary(first_index):
+    """Summarize messages that dropped out of the context window, off the request path."""
+    state = current_summary()
+    if st.session_state.summary_job is not None or not chat_context.needs_summary(state["upto"], first_index):
+        return
+    evicted = st.session_state.messages[state["upto"]:first_index]
+    st.session_state.summary_job = {
+        "session_id": st.session_state.session_id,
+        "upto": first_index,
+        "future": get_turn_executor().submit(
+            scheduler.call, PRIORITY_BACKGROUND,
+            chat_context.summarize, client, GEMINI_MODEL, state["text"], evicted,
+        ),
+    }
+
 def save_chat_session():
-    """Save the current chat session to a JSON file."""
-    if not os.path.exists("chat_history"):
-        os.makedirs("chat_history")
-    
+    """Append the new messages of the current session to its log."""
     if not st.session_state.messages:
         return
 
+    apply_summary_job()
+    summary = current_summary()
+
     if st.session_state.chat_title == "New Chat":
         st.session_state.chat_title = generate_chat_title()
 
-    # Use the timestamp + slugified title as filename
-    safe_title = "".join([c if c.isalnum() else "_" for c in st.session_state.chat_title])
-    filename = f"chat_history/{st.session_state.session_id}_{safe_title}.json"
-    
-    # Clean up old versions of this session if they exist with different titles
-    for old_file in glob.glob(f"chat_history/{st.session_state.session_id}_*.json"):
-        if old_file != filename:
-            try: os.remove(old_file)
-            except: pass
-
-    with open(filename, "w") as f:
-        json.dump({
-            "title": st.session_state.chat_title,
-            "created_at": datetime.now().strftime("%Y-%m-%d %H:%M"),
-            "messages": st.session_state.messages
-        }, f)
+    if st.session_state.chat_created_at.get("session_id") != st.session_state.session_id:
+        st.session_state.chat_created_at = {
+            "session_id": st.session_state.session_id,
+            "value": datetime.now().strftime("%Y-%m-%d %H:%M"),
+        }
+
+    # The disk write happens on the write-behind worker; a newer save of this chat replaces a queued one
+    history_dir = user_history_dir()
+    get_writer().submit(("chat", history_dir, st.session_state.session_id), functools.partial(
+        write_chat_session,
+        st.session_state.persisted,
+        history_dir,
+        st.session_state.session_id,
+        st.session_state.chat_title,
+        st.session_state.chat_created_at["value"],
+        list(st.session_state.messages),
+        {
+            "summary": summary["text"],
+            "summary_upto": summary["upto"],
+            "user_id": current_user_id(),
+        },
+        current_user_id(),
+        get_search_index(),
+    ))
+
+def write_chat_session(persisted, history_dir, session_id, title, created_at, messages, extra_meta, user_id, search_index):
+    """Runs on the write-behind worker: append to the log and the search index; returns the files written."""
+    key = (history_dir, session_id)
+    persisted[key] = chat_store.save_session(
+        history_dir, session_id, title, created_at, messages, persisted.get(key), extra_meta=extra_meta,
+    )
+    # Only the messages the index has not seen yet are added
+    with metrics.span("search_index", session_id=session_id):
+        search_index.index_session(session_id, title, created_at, messages, user_id=user_id)
+    return [
+        chat_store.log_path(history_dir, session_id),
+        chat_store.meta_path(history_dir, session_id),
+        chat_store.manifest_path(history_dir),
+    ]
+
+def delete_chat_session(history_dir, entry, search_index):
+    """Runs on the write-behind worker: remove a chat's files and index rows."""
+    chat_store.delete_session(history_dir, entry)
+    search_index.remove_session(entry["id"])
+    return [chat_store.manifest_path(history_dir)]
 
 def load_chat_session(filename):
-    """Load a chat session from a JSON file."""
-    with open(filename, "r") as f:
-        data = json.load(f)
-        if isinstance(data, dict):
-            st.session_state.messages = data.get("messages", [])
-            st.session_state.chat_title = data.get("title", "New Chat")
-        else:
-            st.session_state.messages = data
-            st.session_state.chat_title = "Past Chat"
+    """Load a chat session from a .jsonl log or a legacy JSON file."""
+    # A save of this chat may still be queued
+    get_writer().flush()
+    data = chat_store.read_session(filename)
+    st.session_state.messages = data["messages"]
+    st.session_state.chat_title = data["title"]
             
     # Extract ID from filename for current session context
-    st.session_state.session_id = os.path.basename(filename).split("_")[0]
-
-def get_chat_history_files():
-    """Get list of chat history files sorted by modification time."""
-    if not os.path.exists("chat_history"):
-        return []
-    files = glob.glob("chat_history/*.json")
-    files.sort(key=os.path.getmtime, reverse=True)
-    return files
-
-def check_crisis(text):
-    """Check for crisis keywords."""
-    crisis_keywords = [
-        "suicide", "want to die", "kill myself", "self harm", "self-harm",
-        "end everything", "hopeless", "no point in living", "don't want to live",
-        "better off dead", "death", "hurting myself"
-    ]
-    for keyword in crisis_keywords:
-        if keyword in text.lower():
-            return True
-    return False
+    st.session_state.session_id = chat_store.session_id_from_path(filename)
+    st.session_state.chat_created_at = {
+        "session_id": st.session_state.session_id,
+        "value": data["created_at"] or datetime.now().strftime("%Y-%m-%d %H:%M"),
+    }
+    st.session_state.chat_summary = {
+        "session_id": st.session_state.session_id,
+        "text": data.get("summary", ""),
+        "upto": data.get("summary_upto", 0),
+    }
+    # Logs can be appended to as-is; legacy files get converted on the next save
+    key = (os.path.dirname(filename), st.session_state.session_id)
+    st.session_state.persisted.pop(key, None)
+    if data["format"] == "log" and data["messages"]:
+        st.session_state.persisted[key] = {
+            "session_id": st.session_state.session_id,
+            "history_dir": os.path.dirname(filename),
+            "count": len(data["messages"]),
+            "tail": chat_store.message_fingerprint(data["messages"][-1]),
+        }
 
 def get_tone(emotion):
     positive = ["joy", "love", "surprise"]
@@ -339,8 +431,77 @@ def get_mood_emoji(mood):
     }
     return mood_emoji.get(mood.lower(), "🌱")
 
+# Number of chat messages rendered at first, and added per "load earlier" click
+CHAT_WINDOW = 30
+
+def record_emotion(result, placeholder):
+    """Log a classification and show it in the mood card slot; returns the label."""
+    emotion = result["label"]
+    confidence = result["score"] * 100
+    tone = get_tone(emotion)
+    st.session_state.mood_history.append(emotion)
+    save_mood(emotion)
+
+    placeholder.markdown(f"""
+    <div class="mood-card">
+        <div class="mood-stat">🧠 Mood Detection Results</div>
+        <div style="font-size: 0.85rem; margin-top: 5px;">
+            <b>Detected Mood:</b> {emotion.capitalize()} {get_mood_emoji(emotion)}<br>
+            <b>Confidence:</b> {confidence:.1f}%<br>
+            <b>Emotional Tone:</b> {tone}
+        </div>
+    </div>
+    """, unsafe_allow_html=True)
+    return emotion
+
+def build_system_instruction(emotion, summary=""):
+    """System prompt for the reply; `emotion` is None while it is still being detected."""
+    current_time = datetime.now().strftime("%A, %b %d, %Y, %I:%M %p")
+    user_name_part = f"The user's name is {st.session_state.user_name}." if st.session_state.user_name else ""
+    if emotion:
+        emotion_part = f"Current detected user emotion: {emotion}."
+    else:
+        emotion_part = "Infer the user's current emotion from their latest message."
+    summary_part = f"Summary of the earlier conversation: {summary}" if summary else ""
+    return f"""
+    You are Serenity, a warm and supportive mental health companion for students.
+    Current date and time: {current_time}.
+    {user_name_part}
+    {emotion_part}
+    {summary_part}
+
+    DYNAMIC RESPONSE RULES:
+    - If user is SAD: Start with "I'm so sorry you're feeling this way..." or "I'm here for you."
+    - If user is ANXIOUS: Start with "Let's take a slow breath together..."
+    - If user is HAPPY: Start with "That's wonderful to hear!"
+    - If user is ANGERED: Be extremely validating and calm.
+
+    GENERAL RULES:
+    - Never mention being an AI or language model.
+    - Speak like a caring human friend.
+    - Validate feelings first.
+    - Keep replies 2–3 sentences.
+    - Offer one gentle suggestion.
+    - Avoid medical advice or diagnosis.
+    - Maintain continuity from the conversation history.
+    """
+
+def record_turn_timing(started, first_token_at, render_stats=None):
+    """Keep per-turn latency (and reply redraw traffic) so serial and parallel modes can be compared."""
+    finished = time.perf_counter()
+    timing = {
+        "mode": TURN_MODE,
+        "ttft": (first_token_at or finished) - started,
+        "total": finished - started,
+    }
+    if render_stats:
+        timing["stream_flushes"] = render_stats["flushes"]
+        timing["stream_bytes"] = render_stats["bytes_sent"]
+    st.session_state.turn_timings = st.session_state.turn_timings[-49:] + [timing]
+    return timing
+
 if "session_id" not in st.session_state:
-    st.session_state.session_id = datetime.now().strftime("%Y%m%d%H%M%S")
+    st.session_state.session_id = chat_store.new_session_id()
 
 if "chat_title" not in st.session_state:
     st.session_state.chat_title = "New Chat"
@@ -350,12 +511,33 @@ if "messages" not in st.session_state:
     
 if "mood_history" not in st.session_state:
     st.session_state.mood_history = []
-if "journal_entries" not in st.session_state:
-    st.session_state.journal_entries = []
+if "chat_summary" not in st.session_state:
+    st.session_state.chat_summary = {"session_id": None, "text": "", "upto": 0}
+if "summary_job" not in st.session_state:
+    st.session_state.summary_job = None
+if "chat_window" not in st.session_state:
+    st.session_state.chat_window = {"session_id": None, "size": CHAT_WINDOW}
+if "journal_page" not in st.session_state:
+    st.session_state.journal_page = 0
+if "breathing" not in st.session_state:
+    st.session_state.breathing = None
 if "bubble_wrap" not in st.session_state:
     st.session_state.bubble_wrap = [True] * 20
 if "user_name" not in st.session_state:
     st.session_state.user_name = None
+if "user_key" not in st.session_state:
+    st.session_state.user_key = resolve_user_key()
+if "turn_timings" not in st.session_state:
+    st.session_state.turn_timings = []
+if "history_page" not in st.session_state:
+    st.session_state.history_page = 0
+if "persisted" not in st.session_state:
+    # (history_dir, session_id) -> what is on disk; updated by the write-behind worker
+    st.session_state.persisted = {}
+if "deleted_sessions" not in st.session_state:
+    st.session_state.deleted_sessions = set()
+if "chat_created_at" not in st.session_state:
+    st.session_state.chat_created_at = {}
 
 # 4. Welcome Message (One-time)
 if len(st.session_state.messages) == 0:
@@ -367,30 +549,21 @@ if len(st.session_state.messages) == 0:
     })
 
 # --- Sidebar ---
-with st.sidebar:
-    st.markdown("<div style='text-align: center; font-size: 60px;'>🧠</div>", unsafe_allow_html=True)
-    
-    # User Profile Section
-    if not st.session_state.user_name:
-        with st.expander("👤 Set Your Name", expanded=True):
-            un = st.text_input("What should Serenity call you?", key="name_input")
-            if st.button("Save Name"):
-                st.session_state.user_name = un
-                st.rerun()
-    else:
-        st.markdown(f"<h3 style='text-align: center;'>Welcome, {st.session_state.user_name}!</h3>", unsafe_allow_html=True)
-        if st.button("Edit Name"):
-            st.session_state.user_name = None
-            st.rerun()
-
+# Each panel is a fragment: its own widgets rerun only that panel, not the whole app
+@st.fragment(key="mood_chart")
+def mood_panel():
+    """Mood pie, recent moods and the long-term trend."""
     st.markdown("<h2 style='text-align: center;'>Mood Tracker</h2>", unsafe_allow_html=True)
     
     if st.session_state.mood_history:
+        # Plotly (and pandas under it) load on the first chart, not at startup
+        import plotly.express as px
+
         # Mood Distribution Chart
-        mood_counts = pd.Series(st.session_state.mood_history).value_counts()
+        mood_counts = Counter(st.session_state.mood_history).most_common()
         fig = px.pie(
-            values=mood_counts.values, 
-            names=mood_counts.index, 
+            values=[count for _, count in mood_counts],
+            names=[mood for mood, _ in mood_counts],
             hole=0.4,
             color_discrete_sequence=px.colors.qualitative.Pastel
         )
@@ -404,13 +577,34 @@ with st.sidebar:
     else:
         st.info("Start chatting to track your moods!")
 
-    st.markdown("---")
-    
-    # NEW: Chat History Section
+    # Long-term trend over the whole mood log; refresh only reads rows added since last time
+    mood_analytics = get_mood_analytics()
+    mood_analytics.refresh()
+    if mood_analytics.day_count(user_id=current_user_id()) >= 2:
+        import plotly.express as px
+
+        mood_trend = mood_analytics.trend(user_id=current_user_id())
+        st.markdown("### 📈 Mood Trend")
+        trend_fig = px.line(
+            x=mood_trend.index,
+            y=mood_trend["rolling_valence"],
+            labels={"x": "", "y": "7-day mood"},
+            color_discrete_sequence=["#5d4e8c"],
+        )
+        trend_fig.update_layout(
+            margin=dict(t=0, b=0, l=0, r=0), height=180, paper_bgcolor='rgba(0,0,0,0)',
+            yaxis=dict(range=[-1.05, 1.05], tickvals=[-1, 0, 1], ticktext=["🌧️", "☁️", "🌻"]),
+        )
+        st.plotly_chart(trend_fig, use_container_width=True)
+
+
+@st.fragment(key="chat_history")
+def history_panel():
+    """New chat, search and the paged list of past conversations."""
     st.markdown("### 📜 Past Conversations")
     if st.button("➕ New Chat"):
         st.session_state.messages = []
-        st.session_state.session_id = datetime.now().strftime("%Y%m%d%H%M%S")
+        st.session_state.session_id = chat_store.new_session_id()
         name_str = f" {st.session_state.user_name}" if st.session_state.user_name else ""
         st.session_state.messages.append({
             "role": "assistant",
@@ -419,82 +613,200 @@ with st.sidebar:
         })
         st.rerun()
 
-    history_files = get_chat_history_files()
-    if history_files:
-        for file in history_files:
-            display_name = "Past Conversation"
+    search_text = st.text_input("🔎 Search chats & journal", key="search_query", placeholder="e.g. exams")
+    if search_text.strip():
+        with metrics.span("search"):
+            search_hits = get_search_index().search(search_text, user_id=current_user_id())
+        for hit in search_hits:
+            if hit["kind"] == "chat":
+                if st.button(f"💭 {hit['title']}", key=f"search_chat_{hit['ref']}", use_container_width=True):
+                    path = chat_store.session_path(user_history_dir(), hit["ref"])
+                    if path:
+                        load_chat_session(path)
+                        st.rerun()
+                    st.warning("That conversation was deleted.")
+                st.caption(hit["snippet"])
+            else:
+                st.markdown(f"📔 **{hit['date']}** — {hit['snippet']}")
+        if not search_hits:
+            st.caption("No matches.")
+        st.markdown("---")
+
+    # Page through the manifest index instead of opening every session file
+    history_page_size = 10
+    with metrics.span("history_scan"):
+        history_entries, history_total = chat_store.list_sessions(
+            user_history_dir(),
+            offset=st.session_state.history_page * history_page_size,
+            limit=history_page_size,
+        )
+    if not history_entries and st.session_state.history_page > 0:
+        st.session_state.history_page = 0
+        rerun_region()
+
+    if history_entries:
+        for entry in history_entries:
+            if entry["id"] in st.session_state.deleted_sessions:
+                continue
+            file = os.path.join(user_history_dir(), entry["file"])
+            display_name = entry.get("title") or "Past Conversation"
             date_info = ""
-            try:
-                with open(file, "r") as f:
-                    data = json.load(f)
-                    if isinstance(data, dict):
-                        display_name = data.get("title", "Past Chat")
-                        ca = data.get("created_at", "")
-                        if ca:
-                            dt = datetime.strptime(ca, "%Y-%m-%d %H:%M")
-                            date_info = dt.strftime("%b %d • %I:%M %p")
-            except:
-                pass
+            ca = entry.get("created_at", "")
+            if ca:
+                try:
+                    dt = datetime.strptime(ca, "%Y-%m-%d %H:%M")
+                    date_info = dt.strftime("%b %d • %I:%M %p")
+                except ValueError:
+                    pass
             
-            # If no stored date, use filename
+            # If no stored date, use the session id
             if not date_info:
                 try:
-                    ts_str = os.path.basename(file).split("_")[0]
-                    date_info = datetime.strptime(ts_str[:8], "%Y%m%d").strftime("%b %d")
-                except:
+                    date_info = datetime.strptime(entry["id"][:8], "%Y%m%d").strftime("%b %d")
+                except ValueError:
                     date_info = "Previous"
 
             # Cleaner Button Label with Delete Option
             col_chat, col_del = st.columns([0.85, 0.15])
             with col_chat:
                 full_label = f"💭 {display_name}\n{date_info}"
-                if st.button(full_label, key=file, use_container_width=True):
+                if st.button(full_label, key=f"chat_{entry['id']}", use_container_width=True):
                     load_chat_session(file)
                     st.rerun()
             with col_del:
                 # Minimalistic trash button
-                if st.button("🗑️", key=f"del_{file}", help="Delete this chat"):
+                if st.button("🗑️", key=f"del_{entry['id']}", help="Delete this chat"):
                     try:
-                        os.remove(file)
-                        # If deleted chat was the active one, clear it
-                        file_base = os.path.basename(file).split("_")[0]
-                        if file_base == st.session_state.session_id:
+                        get_writer().submit(
+                            ("chat", user_history_dir(), entry["id"]),
+                            functools.partial(delete_chat_session, user_history_dir(), entry, get_search_index()),
+                        )
+                        # Hidden right away; the worker removes the files in the background
+                        st.session_state.deleted_sessions.add(entry["id"])
+                        # If deleted chat was the active one, clear it (the chat panel changes too)
+                        if entry["id"] == st.session_state.session_id:
                             st.session_state.messages = []
-                            st.session_state.session_id = datetime.now().strftime("%Y%m%d%H%M%S")
-                        st.rerun()
+                            st.session_state.session_id = chat_store.new_session_id()
+                            st.rerun()
+                        rerun_region()
                     except Exception as e:
                         st.error(f"Error: {e}")
+
+        if history_total > history_page_size:
+            last_page = (history_total - 1) // history_page_size
+            col_newer, col_page, col_older = st.columns([0.3, 0.4, 0.3])
+            with col_newer:
+                if st.button("‹ Newer", disabled=st.session_state.history_page == 0):
+                    st.session_state.history_page -= 1
+                    rerun_region()
+            with col_page:
+                st.caption(f"Page {st.session_state.history_page + 1} of {last_page + 1}")
+            with col_older:
+                if st.button("Older ›", disabled=st.session_state.history_page >= last_page):
+                    st.session_state.history_page += 1
+                    rerun_region()
     else:
         st.caption("No saved chats yet.")
 
-    st.markdown("---")
-    
-    if st.button("🗑️ Clear Current Chat"):
-        st.session_state.messages = []
-        st.rerun()
-    
-    # 5. Export & Share Chat
+
+def archive_chats(writer, history_dir, fmt):
+    """The user's chats as a zip, after writing out saves still waiting in the write-behind queue."""
+    writer.flush()
+    return chat_export.archive_file(history_dir, fmt)
+
+
+@st.fragment(key="chat_export")
+def export_panel():
+    """Export format, download and share buttons for the current chat."""
     st.markdown("### Options")
-    # Convert chat history to string
-    chat_export = ""
-    for msg in st.session_state.messages:
-        chat_export += f"[{msg['role'].upper()}] {msg.get('timestamp','')}: {msg['content']}\n"
-    
+    # Exports are generated only when a download is clicked, not on every rerun
+    export_format = st.selectbox(
+        "Export format",
+        list(chat_export.FORMATS),
+        format_func={"txt": "Text (.txt)", "md": "Markdown (.md)", "json": "JSON (.json)"}.get,
+        key="export_format",
+    )
+    _, export_mime, export_extension = chat_export.FORMATS[export_format]
     col_dl, col_share = st.columns(2)
     with col_dl:
         st.download_button(
             label="⬇ Download",
-            data=chat_export,
-            file_name="serenity_chat.txt",
-            mime="text/plain"
+            data=functools.partial(
+                chat_export.export_session,
+                st.session_state.messages,
+                export_format,
+                st.session_state.chat_title,
+                st.session_state.chat_created_at.get("value"),
+            ),
+            file_name=f"serenity_chat.{export_extension}",
+            mime=export_mime,
         )
     with col_share:
-        # Create a mailto link
+        # Create a mailto link; only the messages that fit in it are read
         subject = "My Chat with Serenity 🌿"
-        body = urllib.parse.quote(chat_export)
-        # Limit body length for mailto compatibility
-        share_link = f"mailto:?subject={subject}&body={body[:1500]}..." 
+        body = chat_export.mailto_body(st.session_state.messages)
+        share_link = f"mailto:?subject={subject}&body={body}"
         st.markdown(f'<a href="{share_link}" target="_blank" class="share-btn">💌 Share</a>', unsafe_allow_html=True)
+    st.download_button(
+        label="📦 All chats (.zip)",
+        data=functools.partial(archive_chats, get_writer(), user_history_dir(), export_format),
+        file_name="serenity_chats.zip",
+        mime="application/zip",
+    )
+
+
+with st.sidebar:
+    st.markdown("<div style='text-align: center; font-size: 60px;'>🧠</div>", unsafe_allow_html=True)
+    
+    # User Profile Section
+    if not st.session_state.user_name:
+        with st.expander("👤 Set Your Name", expanded=True):
+            un = st.text_input("What should Serenity call you?", key="name_input")
+            if st.button("Save Name"):
+                st.session_state.user_name = un
+                st.rerun()
+    else:
+        st.markdown(f"<h3 style='text-align: center;'>Welcome, {st.session_state.user_name}!</h3>", unsafe_allow_html=True)
+        if st.button("Edit Name"):
+            st.session_state.user_name = None
+            st.rerun()
+    if current_user_id().startswith("browser:"):
+        st.caption("🔒 Your chats and journal are tied to this page's link. Bookmark it to find them again.")
+
+    mood_panel()
+
+    st.markdown("---")
+    
+    # NEW: Chat History Section
+    history_panel()
+
+    st.markdown("---")
+    
+    if st.button("🗑️ Clear Current Chat"):
+        st.session_state.messages = []
+        st.rerun()
+    
+    # 5. Export & Share Chat
+    export_panel()
+
+    if st.session_state.turn_timings:
+        last_turn = st.session_state.turn_timings[-1]
+        st.caption(f"⏱️ Last reply started after {last_turn['ttft']:.1f}s ({last_turn['mode']} mode)")
+
+    if ADMIN_PANEL:
+        with st.expander("🛠️ Latency (all sessions)"):
+            stage_rows = metrics.summary()
+            if stage_rows:
+                st.dataframe(stage_rows, hide_index=True, use_container_width=True)
+            else:
+                st.caption("No timings recorded yet.")
+            queue = scheduler.snapshot()
+            st.caption(f"Gemini queue: {queue['queue_depth']} waiting, {queue['in_flight']} in flight, "
+                       f"{queue['retries']} retries")
+            writes = get_writer().snapshot()
+            st.caption(f"Write-behind: {writes['queue_depth']} queued, {writes['written']} written "
+                       f"({writes['coalesced']} coalesced), {writes['errors']} errors, "
+                       f"last flush {writes['last_flush_ms']:.1f} ms")
 
 
 # --- Main Interface ---
@@ -505,23 +817,30 @@ st.markdown("##### *Your safe space for reflection and calm.*")
 tab1, tab2, tab3 = st.tabs(["💬 Chat", "🎮 Stress Relief", "📔 Journal"])
 
 # --- TAB 1: Chat Interface ---
-with tab1:
+@st.fragment(key="chat")
+def chat_panel():
+    """Chat history and input; a turn runs in this fragment without rerunning the sidebar or other tabs."""
     # 2. Add chat scroll container
     chat_container = st.container()
     
     with chat_container:
         st.markdown("<div style='height: 20px;'></div>", unsafe_allow_html=True)
-        # Display Chat History
-        for msg in st.session_state.messages:
-            bubble_class = "user-bubble" if msg["role"] == "user" else "bot-bubble"
-            safe_content = msg["content"].replace("\n", "<br>")
-            
-            st.markdown(f"""
-            <div class="{bubble_class}">
-                {safe_content}
-                <div class="timestamp">{msg.get("timestamp", "")}</div>
-            </div>
-            """, unsafe_allow_html=True)
+        # Display Chat History: only the newest window, as a single element
+        if st.session_state.chat_window["session_id"] != st.session_state.session_id:
+            st.session_state.chat_window = {"session_id": st.session_state.session_id, "size": CHAT_WINDOW}
+        messages = st.session_state.messages
+        hidden = max(0, len(messages) - st.session_state.chat_window["size"])
+        if hidden:
+            if st.button(f"⬆ Load earlier messages ({hidden} more)", key="load_earlier"):
+                st.session_state.chat_window["size"] += CHAT_WINDOW
+                rerun_region()
+        st.markdown(
+            "".join(
+                render_bubble(msg["role"], msg["content"], msg.get("timestamp", ""))
+                for msg in messages[hidden:]
+            ),
+            unsafe_allow_html=True,
+        )
 
     # Chat Input
     if user_input := st.chat_input("How are you feeling today?"):
@@ -564,9 +883,13 @@ with tab1:
                 # 3. Process Response
                 response_text = ""
                 emotion = "neutral" 
+                turn_timing = None
+                turn = metrics.turn("chat", session_id=st.session_state.session_id)
                 
                 # A. Crisis Detection
-                if check_crisis(user_input):
+                with turn.span("crisis"):
+                    is_crisis = check_crisis(user_input)
+                if is_crisis:
                     response_text = """
                     <div class="crisis-banner">
                         <h3>🌿 Please Reach Out — You Matter.</h3>
@@ -590,207 +913,252 @@ with tab1:
                     """, unsafe_allow_html=True)
                     
                 else:
+                    turn_started = time.perf_counter()
+                    first_token_at = None
+                    mood_placeholder = st.empty()
+                    emotion_future = None
+
                     # B. Emotion Detection
-                    with st.spinner("Analyzing Mood..."):
-                        result = get_ai_emotion(user_input)
-                        emotion = result["label"]
-                        confidence = result["score"] * 100
-                        tone = get_tone(emotion)
-                        st.session_state.mood_history.append(emotion)
-                        save_mood_to_csv(emotion)
-
-                    # Display Mood Detection Card
-                    st.markdown(f"""
-                    <div class="mood-card">
-                        <div class="mood-stat">🧠 Mood Detection Results</div>
-                        <div style="font-size: 0.85rem; margin-top: 5px;">
-                            <b>Detected Mood:</b> {emotion.capitalize()} {get_mood_emoji(emotion)}<br>
-                            <b>Confidence:</b> {confidence:.1f}%<br>
-                            <b>Emotional Tone:</b> {tone}
-                        </div>
-                    </div>
-                    """, unsafe_allow_html=True)
+                    # Cached or confidently local results need no spinner and no network
+                    with turn.span("emotion_lookup"):
+                        result = get_quick_emotion(user_input)
+                    if result is None:
+                        if TURN_MODE == "parallel":
+                            # Classify in the background while the reply streams
+                            emotion_future = get_turn_executor().submit(
+                                turn.call, "emotion", get_ai_emotion, user_input, False, get_emotion_cache()
+                            )
+                        else:
+                            with st.spinner("Analyzing Mood..."):
+                                result = turn.call("emotion", get_ai_emotion, user_input, check_cache=False)
+                    if result is not None:
+                        emotion = record_emotion(result, mood_placeholder)
 
                     # C. Generate Response with History
-                    # Prepare history for Gemini
-                    history_for_gemini = []
-                    # System instruction as the first message context
-                    current_time = datetime.now().strftime("%A, %b %d, %Y, %I:%M %p")
-                    user_name_part = f"The user's name is {st.session_state.user_name}." if st.session_state.user_name else ""
-                    system_instruction = f"""
-                    You are Serenity, a warm and supportive mental health companion for students.
-                    Current date and time: {current_time}.
-                    {user_name_part}
-                    Current detected user emotion: {emotion}.
-                    
-                    DYNAMIC RESPONSE RULES:
-                    - If user is SAD: Start with "I'm so sorry you're feeling this way..." or "I'm here for you."
-                    - If user is ANXIOUS: Start with "Let's take a slow breath together..."
-                    - If user is HAPPY: Start with "That's wonderful to hear!"
-                    - If user is ANGERED: Be extremely validating and calm.
-                    
-                    GENERAL RULES:
-                    - Never mention being an AI or language model.
-                    - Speak like a caring human friend.
-                    - Validate feelings first.
-                    - Keep replies 2–3 sentences.
-                    - Offer one gentle suggestion.
-                    - Avoid medical advice or diagnosis.
-                    - Maintain continuity from the conversation history.
-                    """
-                    
-                    # Convert session messages to Gemini format (limit to last 10 for performance)
-                    for msg in st.session_state.messages[-10:]:
-                        role = "model" if msg["role"] == "assistant" else "user"
-                        # Clean up '🌿 ' or other prefixes if any in the stored content
-                        content = msg["content"].replace("🌿 ", "")
-                        history_for_gemini.append({"role": role, "parts": [{"text": content}]})
+                    # Newest turns that fit the token budget; older ones live in the rolling summary
+                    apply_summary_job()
+                    summary = current_summary()
+                    history_for_gemini, first_index = chat_context.build_context(
+                        st.session_state.messages[:-1],  # Exclude the current message which we send next
+                        CONTEXT_BUDGET_TOKENS,
+                        summary["text"],
+                    )
+                    system_instruction = build_system_instruction(
+                        emotion if emotion_future is None else None, summary["text"]
+                    )
 
+                    renderer = None
                     try:
-                        # Use chat session for true real-time conversation memory
-                        chat = client.chats.create(
-                            model="gemini-flash-latest",
-                            config=types.GenerateContentConfig(system_instruction=system_instruction),
-                            history=history_for_gemini[:-1] # Exclude the current message which we send next
-                        )
+                        # Reuse this session's live chat while its history still matches
+                        chat_pool = get_chat_pool(api_key)
+                        with turn.span("chat_create"):
+                            chat = chat_pool.acquire(st.session_state.session_id, history_for_gemini)
                         
-                        response_placeholder = st.empty()
-                        full_text = ""
+                        renderer = StreamRenderer(
+                            st.empty(),
+                            interval=settings["stream_interval_ms"] / 1000,
+                            flush_bytes=settings["stream_flush_bytes"],
+                        )
                         
                         # Send the actual user input
-                        stream = chat.send_message_stream(user_input)
+                        stream = scheduler.stream(
+                            PRIORITY_REPLY,
+                            lambda: chat.send_message_stream(
+                                user_input,
+                                config=types.GenerateContentConfig(system_instruction=system_instruction),
+                            ),
+                            timeout=30,
+                        )
                         
+                        sent_at = time.perf_counter()
                         for chunk in stream:
                             if chunk.text:
-                                text_chunk = chunk.text
-                                full_text += text_chunk
-                                response_placeholder.markdown(f"🌿 {full_text} ...")
+                                if first_token_at is None:
+                                    first_token_at = time.perf_counter()
+                                    turn.observe("first_chunk", first_token_at - sent_at)
+                                renderer.write(chunk.text)
+                            # Merge the mood card in as soon as the classification lands
+                            if emotion_future is not None and emotion_future.done():
+                                emotion = record_emotion(emotion_future.result(), mood_placeholder)
+                                emotion_future = None
+                        turn.observe("stream_end", time.perf_counter() - sent_at)
                         
                         # Set Title from first user message if it's still "New Chat"
                         if st.session_state.chat_title == "New Chat":
                             st.session_state.chat_title = generate_chat_title()
                         
                         # Final Bubble
-                        response_placeholder.markdown(f"""
+                        full_text = renderer.finish(lambda text: f"""
                         <div class="bot-bubble">
-                            {full_text}
+                            {text}
                             <div class="timestamp">{timestamp}</div>
                         </div>
-                        """, unsafe_allow_html=True)
+                        """)
                         
                         response_text = full_text
+                        chat_pool.record_turn(
+                            st.session_state.session_id,
+                            chat_context.to_gemini({"role": "user", "content": user_input}),
+                            chat_context.to_gemini({"role": "assistant", "content": full_text}),
+                        )
+                        schedule_summary(first_index)
                         
                     except Exception as e:
+                        get_chat_pool(api_key).discard(st.session_state.session_id)
                         # Show actual error for debugging
                         st.error(f"Connection Error: {str(e)}")
                         response_text = "I'm having a little trouble connecting right now. Please check your internet or API key."
 
+                    if emotion_future is not None:
+                        emotion = record_emotion(emotion_future.result(), mood_placeholder)
+                    turn_timing = record_turn_timing(turn_started, first_token_at, renderer.stats if renderer else None)
+                    turn.observe("ttft", turn_timing["ttft"])
+                    # Queue and redraw counts go to spans.jsonl with the turn, not to the console
+                    queue = scheduler.snapshot()
+                    turn.observe(
+                        "turn_total", turn_timing["total"], mode=TURN_MODE, gemini_queue=queue["queue_depth"],
+                        in_flight=queue["in_flight"], stream_flushes=turn_timing.get("stream_flushes"),
+                    )
+
                 if response_text:
                     st.session_state.messages.append({"role": "assistant", "content": response_text, "timestamp": timestamp})
+                    save_started = time.perf_counter()
                     save_chat_session()
+                    save_seconds = time.perf_counter() - save_started
+                    turn.observe("save_chat_session", save_seconds)
+                    if turn_timing is not None:
+                        turn_timing["save"] = save_seconds
+                    # Full rerun: the mood chart, history list and export in the sidebar all changed
                     st.rerun()
 
+with tab1:
+    chat_panel()
+
 # --- TAB 2: Stress Relief Games ---
-with tab2:
+# Every game is its own fragment, so playing one reruns neither the other games nor the rest of the app
+@st.fragment(key="breathing")
+def breathing_game():
+    """Box breathing with adjustable timings; the animation itself runs in the browser."""
+    with st.expander("⚙️ Timings"):
+        col_in, col_hold, col_out, col_pause = st.columns(4)
+        breath_timings = {
+            "inhale": col_in.number_input("Inhale (s)", 1, 12, 4, key="breath_inhale"),
+            "hold": col_hold.number_input("Hold (s)", 0, 12, 4, key="breath_hold"),
+            "exhale": col_out.number_input("Exhale (s)", 1, 12, 4, key="breath_exhale"),
+            "pause": col_pause.number_input("Pause (s)", 0, 12, 4, key="breath_pause"),
+        }
+        breath_cycles = st.slider("Cycles", 1, 10, 3, key="breath_cycles")
+    pattern = "-".join(str(breath_timings[p]) for p in ("inhale", "hold", "exhale") if breath_timings[p])
+    st.markdown(f"### {pattern} Box Breathing")
+    st.write("Breathe in, hold, and breathe out in a steady rhythm. Great for immediate anxiety relief.")
+
+    if st.button(f"Start {pattern} Session"):
+        # The animation runs in the browser; the server only renders it once per start
+        st.session_state.breathing = {
+            **breath_timings,
+            "cycles": breath_cycles,
+            "nonce": st.session_state.breathing["nonce"] + 1 if st.session_state.breathing else 1,
+        }
+    if st.session_state.breathing:
+        st.markdown(breathing_html(**st.session_state.breathing), unsafe_allow_html=True)
+        if st.button("✨ I feel calmer"):
+            st.balloons()
+
+
+@st.fragment(key="grounding")
+def grounding_game():
+    """5-4-3-2-1 grounding prompts."""
+    st.markdown("### 5-4-3-2-1 Grounding Technique")
+    st.write("A grounding technique to help you focus on the present moment.")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.info("👀 **5** things you can **SEE**")
+        st.info("✋ **4** things you can **TOUCH**")
+        st.info("👂 **3** things you can **HEAR**")
+    with col2:
+        st.info("👃 **2** things you can **SMELL**")
+        st.info("👅 **1** thing you can **TASTE**")
+    st.write("Take a deep breath once you've acknowledged all five.")
+
+
+@st.fragment(key="bubble_wrap")
+def bubble_wrap_game():
+    """A grid of bubbles; popping one reruns only this grid."""
+    st.markdown("### Pop the Stress Away!")
+    st.write("Click the bubbles to pop them!")
+
+    # Grid layout for bubbles
+    cols = st.columns(5)
+    for i in range(20):
+        with cols[i % 5]:
+            if st.session_state.bubble_wrap[i]:
+                if st.button("🔵", key=f"bubble_{i}"):
+                    st.session_state.bubble_wrap[i] = False
+                    rerun_region()
+            else:
+                st.button("💥", key=f"popped_{i}", disabled=True)
+
+    if st.button("Reset Bubbles"):
+        st.session_state.bubble_wrap = [True] * 20
+        rerun_region()
+
+
+@st.fragment(key="jokes_music")
+def jokes_music_game():
+    """A random joke and links to calming soundscapes."""
+    c1, c2 = st.columns(2)
+    with c1:
+        st.markdown("#### Tell me a Joke")
+        if st.button("😂 Laugh"):
+            jokes = [
+                ("Why did the scarecrow win an award?", "Because he was outstanding in his field!"),
+                ("What do you call a fake noodle?", "An impasta!"),
+                ("Why don't scientists trust atoms?", "Because they make up everything!"),
+                ("How does a penguin build its house?", "Igloos it together!"),
+                ("Why did the math book look sad?", "It had too many problems.")
+            ]
+            j = random.choice(jokes)
+            st.info(f"**Q:** {j[0]}\n\n**A:** {j[1]}")
+
+    with c2:
+        st.markdown("#### Calming Sounds")
+        st.write("Choose a soundscape to focus or relax:")
+        st.markdown("[🎵 Lofi Beats for Study](https://www.youtube.com/watch?v=jfKfPfyJRdk)")
+        st.markdown("[🌊 Ocean Waves](https://www.youtube.com/watch?v=bn9F19Hi1Lk)")
+        st.markdown("[🌧️ Thunderstorm & Rain](https://www.youtube.com/watch?v=mPZkdNFkNps)")
+
+
+GAMES = {
+    "🌬️ Breathing": breathing_game,
+    "🧘 Grounding": grounding_game,
+    "🧼 Bubble Wrap": bubble_wrap_game,
+    "😄 Jokes & Music": jokes_music_game,
+}
+
+
+@st.fragment(key="stress_relief")
+def stress_relief():
+    """Game picker; switching games reruns only this tab."""
     st.header("🎮 Relax & De-stress")
     
-    game_choice = st.radio("Choose a calm activity:", ["🌬️ Breathing", "🧘 Grounding", "🧼 Bubble Wrap", "😄 Jokes & Music"], horizontal=True)
-    
-    if game_choice == "🌬️ Breathing":
-        st.markdown("### 4-4-4 Box Breathing")
-        st.write("Equal parts inhale, hold, and exhale. Great for immediate anxiety relief.")
-        
-        if st.button("Start 4-4-4 Session"):
-            progress_text = st.empty()
-            bar = st.progress(0)
-            
-            for cycle in range(3):
-                # Inhale
-                progress_text.markdown("### 🌸 **Inhale... (4s)**")
-                for i in range(100):
-                    time.sleep(0.04) 
-                    bar.progress(i + 1)
-                
-                # Hold
-                progress_text.markdown("### 😐 **Hold... (4s)**")
-                for i in range(100):
-                    time.sleep(0.04)
-                    bar.progress(100)
-                
-                # Exhale
-                progress_text.markdown("### 🍃 **Exhale... (4s)**")
-                for i in range(100):
-                    time.sleep(0.04)
-                    bar.progress(100 - i)
-                
-                # Pause
-                progress_text.markdown("### ⏸️ **Pause... (4s)**")
-                time.sleep(4)
-            
-            progress_text.markdown("### ✨ **You're doing great. Feel more centered?**")
-            st.balloons()
-            
-    elif game_choice == "🧘 Grounding":
-        st.markdown("### 5-4-3-2-1 Grounding Technique")
-        st.write("A grounding technique to help you focus on the present moment.")
-        
-        col1, col2 = st.columns(2)
-        with col1:
-            st.info("👀 **5** things you can **SEE**")
-            st.info("✋ **4** things you can **TOUCH**")
-            st.info("👂 **3** things you can **HEAR**")
-        with col2:
-            st.info("👃 **2** things you can **SMELL**")
-            st.info("👅 **1** thing you can **TASTE**")
-        st.write("Take a deep breath once you've acknowledged all five.")
-
-    elif game_choice == "🧼 Bubble Wrap":
-        st.markdown("### Pop the Stress Away!")
-        st.write("Click the bubbles to pop them!")
-        
-        # Grid layout for bubbles
-        cols = st.columns(5)
-        for i in range(20):
-            with cols[i % 5]:
-                if st.session_state.bubble_wrap[i]:
-                    if st.button("🔵", key=f"bubble_{i}"):
-                        st.session_state.bubble_wrap[i] = False
-                        st.rerun()
-                else:
-                    st.button("💥", key=f"popped_{i}", disabled=True)
-        
-        if st.button("Reset Bubbles"):
-            st.session_state.bubble_wrap = [True] * 20
-            st.rerun()
+    game_choice = st.radio("Choose a calm activity:", list(GAMES), horizontal=True)
+    GAMES[game_choice]()
 
-    elif game_choice == "😄 Jokes & Music":
-        c1, c2 = st.columns(2)
-        with c1:
-            st.markdown("#### Tell me a Joke")
-            if st.button("😂 Laugh"):
-                jokes = [
-                    ("Why did the scarecrow win an award?", "Because he was outstanding in his field!"),
-                    ("What do you call a fake noodle?", "An impasta!"),
-                    ("Why don't scientists trust atoms?", "Because they make up everything!"),
-                    ("How does a penguin build its house?", "Igloos it together!"),
-                    ("Why did the math book look sad?", "It had too many problems.")
-                ]
-                j = random.choice(jokes)
-                st.info(f"**Q:** {j[0]}\n\n**A:** {j[1]}")
-        
-        with c2:
-            st.markdown("#### Calming Sounds")
-            st.write("Choose a soundscape to focus or relax:")
-            st.markdown("[🎵 Lofi Beats for Study](https://www.youtube.com/watch?v=jfKfPfyJRdk)")
-            st.markdown("[🌊 Ocean Waves](https://www.youtube.com/watch?v=bn9F19Hi1Lk)")
-            st.markdown("[🌧️ Thunderstorm & Rain](https://www.youtube.com/watch?v=mPZkdNFkNps)")
+
+with tab2:
+    stress_relief()
 
 # --- TAB 3: Journal Interface ---
-with tab3:
+@st.fragment(key="journal")
+def journal_panel():
+    """Journal insights, the new entry form and the paged list of past entries."""
     # Academic Gold: Journal Analytics Summary
-    if st.session_state.journal_entries:
-        total = len(st.session_state.journal_entries)
-        pos_count = sum(1 for e in st.session_state.journal_entries if "Positive" in e.get("analysis", {}).get("tone", ""))
+    journal_store = get_journal_store()
+    journal_stats = journal_store.stats(user_id=current_user_id())
+    if journal_stats["total"]:
+        total = journal_stats["total"]
+        pos_count = journal_stats["positive"]
         happiness_index = (pos_count / total) * 100 if total > 0 else 0
         
         st.markdown(f"""
@@ -814,8 +1182,9 @@ with tab3:
             
             if st.button("Save Entry"):
                 if journal_text:
+                    journal_turn = metrics.turn("journal", session_id=st.session_state.session_id)
                     # Run Sentiment Analysis for Academic Gold
-                    res = get_ai_emotion(journal_text)
+                    res = journal_turn.call("emotion", get_ai_emotion, journal_text)
                     j_emotion = res["label"]
                     j_score = res["score"] * 100
                     
@@ -829,17 +1198,27 @@ with tab3:
                             "tone": get_tone(j_emotion)
                         }
                     }
-                    st.session_state.journal_entries.append(entry)
+                    with journal_turn.span("journal_save"):
+                        entry_id = journal_store.add(entry, user_id=current_user_id())
+                        get_search_index().add_journal(entry_id, entry, user_id=current_user_id())
+                    st.session_state.journal_page = 0
                     st.success("Saved to your journal! 📔")
                     time.sleep(1)
-                    st.rerun()
+                    rerun_region()
                 else:
                     st.warning("Please write something first.")
     
     with col2:
         st.markdown("### 📖 Past Entries")
-        if st.session_state.journal_entries:
-            for entry in reversed(st.session_state.journal_entries):
+        # Only the current page is read from disk, newest first
+        journal_page_size = 5
+        page_entries = journal_store.page(
+            user_id=current_user_id(),
+            page=st.session_state.journal_page,
+            page_size=journal_page_size,
+        )
+        if page_entries:
+            for entry in page_entries:
                 ana = entry.get("analysis")
                 ana_html = ""
                 if ana:
@@ -860,5 +1239,26 @@ with tab3:
                     {ana_html}
                 </div>
                 """, unsafe_allow_html=True)
+
+            if journal_stats["total"] > journal_page_size:
+                last_page = (journal_stats["total"] - 1) // journal_page_size
+                col_newer, col_page, col_older = st.columns([0.3, 0.4, 0.3])
+                with col_newer:
+                    if st.button("‹ Newer", key="journal_newer", disabled=st.session_state.journal_page == 0):
+                        st.session_state.journal_page -= 1
+                        rerun_region()
+                with col_page:
+                    st.caption(f"Page {st.session_state.journal_page + 1} of {last_page + 1}")
+                with col_older:
+                    if st.button("Older ›", key="journal_older", disabled=st.session_state.journal_page >= last_page):
+                        st.session_state.journal_page += 1
+                        rerun_region()
+        elif st.session_state.journal_page > 0:
+            st.session_state.journal_page = 0
+            rerun_region()
         else:
-            st.info("Your journal is empty. Start writing to clear your mind.")
\ No newline at end of file
+            st.info("Your journal is empty. Start writing to clear your mind.")
+
+
+with tab3:
+    journal_panel()
@@ -0,0 +1,201 @@
+"""Latency spans and histograms for chat turns and journal saves.
+
+Every timed stage (crisis check, emotion detection, chat creation, first
+chunk, stream end, saves, the sidebar history scan) is recorded twice: as a
+structured log line in `spans.jsonl`, and in a per-stage histogram. A
+background thread appends the buffered log lines and rewrites `metrics.prom`
+(Prometheus text format, cumulative `le` buckets) every `export_interval`
+seconds and at exit. Once `spans.jsonl` reaches `spans_max_bytes` it is
+renamed to `spans.jsonl.1` (older files shift up, the oldest beyond
+`spans_backups` is dropped) and a new one is started. The most recent `window` values per stage are kept in
+memory for the percentiles shown in the sidebar admin panel.
+"""
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+DEFAULT_DIRECTORY = "metrics"
+SPANS_NAME = "spans.jsonl"
+PROMETHEUS_NAME = "metrics.prom"
+SPANS_MAX_BYTES = 10 * 1024 * 1024
+SPANS_BACKUPS = 3
+
+# Seconds; chosen to separate in-memory work, disk writes and network waits
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """Fixed-bucket histogram plus a window of recent values for percentiles."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, window=500):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+        self.recent.append(seconds)
+
+    def percentile(self, q):
+        if not self.recent:
+            return None
+        ordered = sorted(self.recent)
+        return ordered[max(0, min(len(ordered) - 1, round(q / 100 * len(ordered)) - 1))]
+
+
+class Turn:
+    """Spans of one chat turn or journal save, tagged with a shared turn id."""
+
+    def __init__(self, metrics, kind, **fields):
+        self.metrics = metrics
+        self.fields = dict(fields, kind=kind, turn_id=uuid.uuid4().hex[:12])
+
+    def observe(self, stage, seconds, **fields):
+        self.metrics.observe(stage, seconds, **self.fields, **fields)
+
+    def span(self, stage, **fields):
+        return self.metrics.span(stage, **self.fields, **fields)
+
+    def call(self, stage, func, *args, **kwargs):
+        """Run `func` inside a span; usable from worker threads."""
+        with self.span(stage):
+            return func(*args, **kwargs)
+
+
+class Metrics:
+    """Process-wide span recorder; pass directory=None to keep everything in memory."""
+
+    def __init__(self, directory=DEFAULT_DIRECTORY, export_interval=10.0, window=500,
+                 spans_max_bytes=SPANS_MAX_BYTES, spans_backups=SPANS_BACKUPS):
+        self.directory = os.path.abspath(directory) if directory else None
+        self.export_interval = export_interval
+        self.window = window
+        self.spans_max_bytes = spans_max_bytes
+        self.spans_backups = spans_backups
+        self._histograms = {}
+        self._pending = []
+        self._lock = threading.Lock()
+        self._export_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            self._worker = threading.Thread(target=self._run, name="metrics-export", daemon=True)
+            self._worker.start()
+            atexit.register(self.close)
+
+    def turn(self, kind="chat", **fields):
+        return Turn(self, kind, **fields)
+
+    def observe(self, stage, seconds, **fields):
+        """Record one duration for `stage`."""
+        line = {"ts": datetime.now().isoformat(timespec="milliseconds"), "stage": stage,
+                "ms": round(seconds * 1000, 3), **fields}
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = Histogram(window=self.window)
+            histogram.observe(seconds)
+            if self.directory:
+                self._pending.append(line)
+
+    @contextmanager
+    def span(self, stage, **fields):
+        """Time the enclosed block; a failing block is recorded with error=True."""
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.observe(stage, time.perf_counter() - started, error=True, **fields)
+            raise
+        self.observe(stage, time.perf_counter() - started, **fields)
+
+    def summary(self):
+        """Count and recent p50/p95/p99 (ms) per stage, for display."""
+        with self._lock:
+            rows = []
+            for stage, histogram in sorted(self._histograms.items()):
+                row = {"stage": stage, "count": histogram.count}
+                for q in (50, 95, 99):
+                    row[f"p{q}_ms"] = round(histogram.percentile(q) * 1000, 1)
+                rows.append(row)
+        return rows
+
+    def prometheus_text(self):
+        lines = [
+            "# HELP serenity_stage_seconds Time spent in each stage of a chat turn or journal save.",
+            "# TYPE serenity_stage_seconds histogram",
+        ]
+        with self._lock:
+            for stage, histogram in sorted(self._histograms.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'serenity_stage_seconds_bucket{{stage="{stage}",le="{bound:g}"}} {cumulative}')
+                lines.append(f'serenity_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+                lines.append(f'serenity_stage_seconds_sum{{stage="{stage}"}} {histogram.total:.6f}')
+                lines.append(f'serenity_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+    def _rotate_spans(self, path):
+        """Shift spans.jsonl to spans.jsonl.1 (and so on) once it is too big."""
+        try:
+            if os.path.getsize(path) < self.spans_max_bytes:
+                return
+        except FileNotFoundError:
+            return
+        for n in range(self.spans_backups - 1, 0, -1):
+            try:
+                os.replace(f"{path}.{n}", f"{path}.{n + 1}")
+            except FileNotFoundError:
+                pass
+        if self.spans_backups:
+            os.replace(path, f"{path}.1")
+        else:
+            os.remove(path)
+
+    def export(self):
+        """Append buffered span lines and rewrite the Prometheus file."""
+        if not self.directory:
+            return
+        with self._export_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+            if pending:
+                spans_path = os.path.join(self.directory, SPANS_NAME)
+                self._rotate_spans(spans_path)
+                with open(spans_path, "a", encoding="utf-8") as f:
+                    f.write("".join(json.dumps(line, ensure_ascii=False) + "\n" for line in pending))
+            path = os.path.join(self.directory, PROMETHEUS_NAME)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(self.prometheus_text())
+            os.replace(tmp_path, path)
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.export_interval)
+            try:
+                self.export()
+            except OSError:
+                pass
+
+    def close(self):
+        """Stop the exporter and write out what is still buffered."""
+        if self._closed or not self.directory:
+            return
+        self._closed = True
+        self._wake.set()
+        self._worker.join(timeout=5)
+        self.export()
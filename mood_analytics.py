@@ -0,0 +1,175 @@
+"""Incremental mood trend analytics over the mood store.
+
+Rows are never re-scanned: `MoodAnalytics.refresh` reads only the rows added
+since the last refresh (tracked by row id) and folds them into per-user,
+per-day counts. Those counts are cached in a small pre-aggregated JSON file
+together with the last row id (rewritten at most every `save_interval`
+seconds and at exit), so a restart picks up where the last process stopped.
+New rows are grouped by SQLite itself. Trends are computed from the daily
+counts with vectorized pandas/NumPy and downsampled for plotting; pandas is
+only imported once a trend or table is actually requested.
+"""
+import atexit
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+DEFAULT_DB_PATH = "mood_log.db"
+DEFAULT_CACHE_PATH = "mood_daily.json"
+
+# How positive each mood is, used for the trend line
+VALENCE = {
+    "joy": 1.0, "love": 1.0, "surprise": 0.5, "neutral": 0.0,
+    "sadness": -1.0, "fear": -1.0, "anger": -1.0, "disgust": -1.0,
+}
+
+
+class MoodAnalytics:
+    """Running per-day mood counts with cached aggregates."""
+
+    def __init__(self, db_path=DEFAULT_DB_PATH, cache_path=DEFAULT_CACHE_PATH, save_interval=60.0):
+        # Absolute, so the save at exit lands here even if the working directory changed
+        self.db_path = os.path.abspath(db_path)
+        self.cache_path = os.path.abspath(cache_path)
+        self.save_interval = save_interval
+        self.last_id = 0
+        self._saved_id = 0
+        self._saved_at = 0.0
+        # user_id -> day ("YYYY-MM-DD") -> mood -> count
+        self.counts = {}
+        self._lock = threading.Lock()
+        self._trends = {}
+        self._load_cache()
+        atexit.register(self.save)
+
+    def _load_cache(self):
+        try:
+            with open(self.cache_path, "r") as f:
+                cached = json.load(f)
+            self.counts, self.last_id = cached["counts"], cached["last_id"]
+            self._saved_id = self.last_id
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def save(self):
+        """Write the counts and the row id they cover to the cache file, atomically."""
+        with self._lock:
+            if self.last_id == self._saved_id:
+                return
+            tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"last_id": self.last_id, "counts": self.counts}, f)
+            os.replace(tmp_path, self.cache_path)
+            self._saved_id, self._saved_at = self.last_id, time.monotonic()
+
+    def refresh(self):
+        """Fold rows added since the last refresh into the daily counts; returns how many."""
+        if not os.path.exists(self.db_path):
+            return 0
+        with self._lock:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            try:
+                # One read transaction, so MAX(id) and the rows come from the same snapshot
+                conn.execute("BEGIN")
+                max_id = conn.execute("SELECT MAX(id) FROM moods").fetchone()[0]
+                if not max_id or max_id <= self.last_id:
+                    return 0
+                added = 0
+                grouped = conn.execute(
+                    "SELECT COALESCE(user_id, ''), substr(timestamp, 1, 10), mood, COUNT(*)"
+                    " FROM moods WHERE id > ? AND id <= ? GROUP BY 1, 2, 3",
+                    (self.last_id, max_id),
+                )
+                # Only the (user, day, mood) keys present in the new rows are touched
+                for user_id, day, mood, count in grouped:
+                    moods = self.counts.setdefault(user_id, {}).setdefault(day, {})
+                    moods[mood] = moods.get(mood, 0) + count
+                    added += count
+            finally:
+                conn.close()
+
+            self.last_id = max_id
+            self._trends.clear()
+        if time.monotonic() - self._saved_at >= self.save_interval:
+            self.save()
+        return added
+
+    def _users(self, user_id):
+        if user_id is None:
+            return list(self.counts.values())
+        return [self.counts[user_id]] if user_id in self.counts else []
+
+    def day_count(self, user_id=None):
+        """Number of distinct days with moods, without building any frame."""
+        days = set()
+        for user_days in self._users(user_id):
+            days.update(user_days)
+        return len(days)
+
+    def running_totals(self, user_id=None):
+        """Count per mood over the whole log, most frequent first."""
+        import pandas as pd
+
+        totals = {}
+        for days in self._users(user_id):
+            for moods in days.values():
+                for mood, count in moods.items():
+                    totals[mood] = totals.get(mood, 0) + count
+        return pd.Series(totals, dtype="int64").sort_values(ascending=False)
+
+    def daily_counts(self, user_id=None):
+        """Day x mood matrix of counts with every calendar day present."""
+        import pandas as pd
+
+        frames = [pd.DataFrame.from_dict(days, orient="index") for days in self._users(user_id) if days]
+        if not frames:
+            return pd.DataFrame()
+        daily = frames[0] if len(frames) == 1 else pd.concat(frames).groupby(level=0).sum()
+        daily = daily.fillna(0)
+        daily.index = pd.to_datetime(daily.index)
+        return daily.sort_index().asfreq("D", fill_value=0)
+
+    def weekly_counts(self, user_id=None):
+        """Week x mood matrix of counts."""
+        daily = self.daily_counts(user_id)
+        if daily.empty:
+            return daily
+        return daily.resample("W").sum()
+
+    def trend(self, user_id=None, window=7, max_points=120):
+        """Daily totals, mean valence and its rolling-window mean, downsampled to `max_points`."""
+        key = (user_id, window, max_points)
+        cached = self._trends.get(key)
+        if cached is not None:
+            return cached
+
+        import pandas as pd
+
+        daily = self.daily_counts(user_id)
+        if daily.empty:
+            return pd.DataFrame(columns=["total", "weighted", "valence", "rolling_valence"])
+
+        weights = np.array([VALENCE.get(mood, 0.0) for mood in daily.columns])
+        counts = daily.to_numpy(dtype=float)
+        frame = pd.DataFrame(
+            {"total": counts.sum(axis=1), "weighted": counts @ weights},
+            index=daily.index,
+        )
+        rolling_total = frame["total"].rolling(window, min_periods=1).sum()
+        frame["rolling_valence"] = (
+            frame["weighted"].rolling(window, min_periods=1).sum() / rolling_total.replace(0, np.nan)
+        )
+
+        if len(frame) > max_points:
+            step = math.ceil(len(frame) / max_points)
+            frame = frame.resample(f"{step}D").agg(
+                {"total": "sum", "weighted": "sum", "rolling_valence": "last"}
+            )
+        frame["valence"] = frame["weighted"] / frame["total"].replace(0, np.nan)
+        self._trends[key] = frame
+        return frame
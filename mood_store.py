@@ -0,0 +1,210 @@
+"""Buffered mood log backed by SQLite in WAL mode.
+
+`MoodStore.record` only appends to an in-memory buffer; a background thread
+writes the buffer out in one transaction every `flush_interval` seconds, or
+sooner once `max_buffer` rows are waiting. WAL mode plus a busy timeout lets
+several sessions and several server processes share the same database file
+without interleaved or lost rows.
+"""
+import atexit
+import csv
+import io
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+DEFAULT_DB_PATH = "mood_log.db"
+LEGACY_CSV_PATH = "mood_log.csv"
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def connect(db_path):
+    """Open a connection configured for concurrent readers and writers."""
+    conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    return conn
+
+
+class MoodStore:
+    """Mood rows with session and user ids, written in batches."""
+
+    def __init__(self, db_path=DEFAULT_DB_PATH, flush_interval=1.0, max_buffer=256):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self._buffer = []
+        self._buffer_lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self.stats = {"recorded": 0, "flushed": 0, "flushes": 0, "flush_errors": 0}
+
+        self._conn = connect(db_path)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS moods ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " timestamp TEXT NOT NULL, mood TEXT NOT NULL,"
+                " session_id TEXT, user_id TEXT)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_moods_timestamp ON moods (timestamp)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS store_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+            )
+
+        self._worker = threading.Thread(target=self._run, name="mood-store-flush", daemon=True)
+        self._worker.start()
+        atexit.register(self.close)
+
+    def record(self, mood, session_id=None, user_id=None, timestamp=None):
+        """Queue one mood row; the caller never waits on the disk."""
+        timestamp = timestamp or datetime.now().strftime(TIMESTAMP_FORMAT)
+        with self._buffer_lock:
+            self._buffer.append((timestamp, mood, session_id, user_id))
+            self.stats["recorded"] += 1
+            full = len(self._buffer) >= self.max_buffer
+        if full:
+            self._wake.set()
+
+    def _write_rows(self, rows):
+        """Insert rows; runs inside the caller's transaction."""
+        self._conn.executemany(
+            "INSERT INTO moods (timestamp, mood, session_id, user_id) VALUES (?, ?, ?, ?)", rows
+        )
+
+    def flush(self):
+        """Write everything buffered so far; returns the number of rows written."""
+        with self._buffer_lock:
+            rows, self._buffer = self._buffer, []
+        if not rows:
+            return 0
+        with self._db_lock:
+            try:
+                with self._conn:
+                    self._write_rows(rows)
+            except sqlite3.Error:
+                # Put the rows back so the next flush retries them
+                with self._buffer_lock:
+                    self._buffer = rows + self._buffer
+                self.stats["flush_errors"] += 1
+                raise
+        self.stats["flushed"] += len(rows)
+        self.stats["flushes"] += 1
+        return len(rows)
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except sqlite3.Error:
+                pass
+
+    def close(self):
+        """Stop the flusher and write out anything still buffered."""
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        self._worker.join(timeout=5)
+        self.flush()
+
+    def import_csv(self, csv_path=LEGACY_CSV_PATH):
+        """Bulk-load rows from the old mood_log.csv.
+
+        The byte offset already imported is remembered, so calling this again
+        only picks up rows appended since the last import.
+        """
+        if not os.path.exists(csv_path):
+            return 0
+        key = f"csv_offset:{os.path.abspath(csv_path)}"
+        with self._db_lock:
+            row = self._conn.execute("SELECT value FROM store_meta WHERE key = ?", (key,)).fetchone()
+            offset = int(row[0]) if row else 0
+            size = os.path.getsize(csv_path)
+            if size <= offset:
+                return 0
+
+            with open(csv_path, "rb") as f:
+                f.seek(offset)
+                chunk = f.read(size - offset)
+            # Only consume complete lines; a half-written last row waits for next time
+            end = chunk.rfind(b"\n") + 1
+            if end == 0:
+                return 0
+            reader = csv.reader(io.StringIO(chunk[:end].decode("utf-8")))
+            rows = []
+            for record in reader:
+                if len(record) < 2 or record[:2] == ["Timestamp", "Mood"]:
+                    continue
+                rows.append((record[0], record[1], None, None))
+            with self._conn:
+                self._write_rows(rows)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO store_meta (key, value) VALUES (?, ?)",
+                    (key, str(offset + end)),
+                )
+        return len(rows)
+
+    def import_rows(self, rows, checkpoint_keys=(), relabels=()):
+        """Write `(timestamp, mood, session_id, user_id)` rows straight to disk.
+
+        `relabels` are `(mood, row id)` pairs that replace the mood of existing
+        rows. `checkpoint_keys` are marked done in the same transaction, so an
+        interrupted import that checks `checkpoints` never writes a row twice.
+        """
+        with self._db_lock, self._conn:
+            self._write_rows(rows)
+            self._conn.executemany("UPDATE moods SET mood = ? WHERE id = ?", relabels)
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO store_meta (key, value) VALUES (?, '1')",
+                [(key,) for key in checkpoint_keys],
+            )
+        return len(rows)
+
+    def checkpoints(self, prefix):
+        """Checkpoint keys starting with `prefix` written by `import_rows`."""
+        with self._db_lock:
+            rows = self._conn.execute(
+                "SELECT key FROM store_meta WHERE key >= ? AND key < ?", (prefix, prefix + "\uffff")
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def tracked_sessions(self):
+        """Session ids that already have mood rows."""
+        with self._db_lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT session_id FROM moods WHERE session_id IS NOT NULL"
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def session_rows(self, mood):
+        """`{session_id: [(row id, timestamp), ...]}` of the rows labelled `mood`, oldest first."""
+        with self._db_lock:
+            rows = self._conn.execute(
+                "SELECT session_id, id, timestamp FROM moods"
+                " WHERE mood = ? AND session_id IS NOT NULL ORDER BY id",
+                (mood,),
+            ).fetchall()
+        by_session = {}
+        for session_id, row_id, timestamp in rows:
+            by_session.setdefault(session_id, []).append((row_id, timestamp))
+        return by_session
+
+    def count(self):
+        """Rows on disk plus rows still buffered."""
+        with self._db_lock:
+            on_disk = self._conn.execute("SELECT COUNT(*) FROM moods").fetchone()[0]
+        with self._buffer_lock:
+            return on_disk + len(self._buffer)
+
+    def snapshot(self):
+        """Counters for monitoring: rows recorded, flushed, and still buffered."""
+        with self._buffer_lock:
+            stats = dict(self.stats)
+            stats["buffered"] = len(self._buffer)
+        return stats
@@ -0,0 +1,245 @@
+"""Full-text search over saved chats and journal entries (SQLite FTS5).
+
+Every chat message and journal entry is one row of an FTS5 table, so a
+query returns the best matching message with a highlighted snippet. The
+index is kept up to date by the writers themselves: `index_session` is
+called after each chat save and remembers how many messages of a session
+it has seen (plus a fingerprint of the last one), so it only inserts the
+new messages, or re-indexes the session if its log was rewritten.
+`add_journal` is called for each new journal entry. Nothing rescans the
+history directory except `rebuild`, for data written before the index
+existed. Each row carries its user as one indexed token in the `owner`
+column, so a query only walks that user's postings; queries rank (BM25,
+on the body alone) the user's newest `RANK_WINDOW` matches and build
+snippets only for the rows returned. An index from before the `owner`
+column is dropped on open and rebuilt like an empty one.
+
+Rebuild from the command line with:
+
+    python search_index.py --rebuild
+"""
+import argparse
+import hashlib
+import re
+import sqlite3
+import threading
+
+import chat_store
+from chat_context import strip_html
+from mood_store import connect
+
+DEFAULT_DB_PATH = "search_index.db"
+
+# Only this many of the newest matching rows are ranked, so a very common
+# word costs the same as a rare one (BM25 over every match grows linearly)
+RANK_WINDOW = 2000
+
+_WORDS = re.compile(r"\w+", re.UNICODE)
+
+
+def fts_query(text):
+    """Turn free text into an FTS5 query: every word must match, the last one as a prefix."""
+    words = _WORDS.findall(text.lower())
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words[:-1]] + [f'"{words[-1]}"*']
+    return " ".join(terms)
+
+
+def owner_token(user_id):
+    """The single FTS token that stands for a user key (which itself would tokenize into several words)."""
+    return "u" + hashlib.sha256((user_id or "").encode("utf-8")).hexdigest()[:24]
+
+
+class SearchIndex:
+    """Ranked snippet search across chat sessions and journal entries."""
+
+    def __init__(self, db_path=DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = connect(db_path)
+        with self._conn:
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(documents)")]
+            if columns and "owner" not in columns:
+                # user_id was UNINDEXED, so every match scanned all users' rows; start over
+                for table in ("documents", "indexed_sessions", "indexed_journals"):
+                    self._conn.execute(f"DROP TABLE IF EXISTS {table}")
+            self._conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS documents USING fts5("
+                " body, owner, kind UNINDEXED, ref UNINDEXED, position UNINDEXED,"
+                " tokenize = 'unicode61 remove_diacritics 2')"
+            )
+            # Every row of a user has the same owner token; rank on the body only
+            self._conn.execute("INSERT INTO documents (documents, rank) VALUES ('rank', 'bm25(1.0, 0.0)')")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS indexed_sessions ("
+                " session_id TEXT PRIMARY KEY, title TEXT, created_at TEXT,"
+                " count INTEGER NOT NULL, tail TEXT)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS indexed_journals ("
+                " entry_id INTEGER PRIMARY KEY, created_at TEXT, date TEXT)"
+            )
+
+    def is_empty(self):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM documents LIMIT 1").fetchone() is None
+
+    def _delete_session_rows(self, session_id):
+        self._conn.execute("DELETE FROM documents WHERE kind = 'chat' AND ref = ?", (session_id,))
+
+    def index_session(self, session_id, title, created_at, messages, user_id=None):
+        """Bring one session up to date; returns how many messages were (re)indexed."""
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT count, tail FROM indexed_sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            start = 0
+            if row and 0 < row[0] <= len(messages) and chat_store.message_fingerprint(messages[row[0] - 1]) == row[1]:
+                start = row[0]
+            elif row:
+                self._delete_session_rows(session_id)
+            self._conn.executemany(
+                "INSERT INTO documents (body, owner, kind, ref, position) VALUES (?, ?, 'chat', ?, ?)",
+                [
+                    (strip_html(message.get("content", "")), owner_token(user_id), session_id, position)
+                    for position, message in enumerate(messages[start:], start)
+                ],
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO indexed_sessions (session_id, title, created_at, count, tail)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (
+                    session_id, title, created_at, len(messages),
+                    chat_store.message_fingerprint(messages[-1]) if messages else None,
+                ),
+            )
+        return len(messages) - start
+
+    def remove_session(self, session_id):
+        with self._lock, self._conn:
+            self._delete_session_rows(session_id)
+            self._conn.execute("DELETE FROM indexed_sessions WHERE session_id = ?", (session_id,))
+
+    def add_journal(self, entry_id, entry, user_id=None, created_at=None):
+        """Index one journal entry (a dict with "date" and "text")."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM documents WHERE kind = 'journal' AND ref = ?", (str(entry_id),)
+            )
+            self._conn.execute(
+                "INSERT INTO documents (body, owner, kind, ref, position) VALUES (?, ?, 'journal', ?, 0)",
+                (entry["text"], owner_token(user_id), str(entry_id)),
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO indexed_journals (entry_id, created_at, date) VALUES (?, ?, ?)",
+                (entry_id, created_at or entry.get("created_at"), entry["date"]),
+            )
+
+    def search(self, text, user_id=None, limit=10):
+        """Best match per chat session or journal entry, best first.
+
+        Only chats and journal entries of `user_id` match. Each hit is a dict with "kind"
+        ("chat"/"journal"), "ref" (session id or entry id), "title", "date",
+        "position" (message index) and "snippet" (matches in **bold**).
+        """
+        words = fts_query(text)
+        if words is None:
+            return []
+        # The user filter is part of the match, so FTS5 only reads this user's rows, and the
+        # window is taken over them: other users' newer matches cannot push theirs out
+        query = f'owner : "{owner_token(user_id)}" AND body : ({words})'
+        with self._lock:
+            try:
+                floor = self._conn.execute(
+                    "SELECT rowid FROM documents WHERE documents MATCH ? ORDER BY rowid DESC LIMIT 1 OFFSET ?",
+                    (query, RANK_WINDOW - 1),
+                ).fetchone()
+                # Rank first; snippets are only built for the rows actually returned
+                rows = self._conn.execute(
+                    "SELECT rowid, kind, ref, position, rank FROM documents WHERE documents MATCH ? AND rowid >= ?"
+                    " ORDER BY rank LIMIT ?",
+                    # Several messages of one session can match; over-fetch, then keep the best of each
+                    (query, floor[0] if floor else 0, limit * 5),
+                ).fetchall()
+            except sqlite3.OperationalError:
+                return []
+            hits, seen = [], set()
+            for rowid, kind, ref, position, rank in rows:
+                if (kind, ref) in seen:
+                    continue
+                seen.add((kind, ref))
+                snippet = self._conn.execute(
+                    "SELECT snippet(documents, 0, '**', '**', '…', 12) FROM documents"
+                    " WHERE documents MATCH ? AND rowid = ?",
+                    (query, rowid),
+                ).fetchone()[0]
+                if kind == "chat":
+                    info = self._conn.execute(
+                        "SELECT title, created_at FROM indexed_sessions WHERE session_id = ?", (ref,)
+                    ).fetchone() or ("Past Conversation", "")
+                else:
+                    date = self._conn.execute(
+                        "SELECT date FROM indexed_journals WHERE entry_id = ?", (int(ref),)
+                    ).fetchone()
+                    info = ("Journal entry", date[0] if date else "")
+                hits.append({
+                    "kind": kind, "ref": ref, "position": position, "snippet": snippet,
+                    "title": info[0], "date": info[1], "score": -rank,
+                })
+                if len(hits) == limit:
+                    break
+        return hits
+
+    def rebuild(self, history_dir=chat_store.HISTORY_DIR, journal_store=None):
+        """Re-index every user's session files and journal entries from scratch; returns (sessions, entries)."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM documents")
+            self._conn.execute("DELETE FROM indexed_sessions")
+            self._conn.execute("DELETE FROM indexed_journals")
+        sessions = 0
+        for user_dir in chat_store.history_dirs(history_dir):
+            for path in chat_store.session_files(user_dir):
+                try:
+                    data = chat_store.read_session(path)
+                except (OSError, ValueError):
+                    continue
+                self.index_session(
+                    chat_store.session_id_from_path(path), data["title"], data["created_at"], data["messages"],
+                    user_id=data.get("user_id"),
+                )
+                sessions += 1
+        entries = 0
+        if journal_store is not None:
+            for entry in journal_store.iter_entries():
+                self.add_journal(entry["id"], entry, user_id=entry["user_id"], created_at=entry["created_at"])
+                entries += 1
+        with self._lock, self._conn:
+            self._conn.execute("INSERT INTO documents (documents) VALUES ('optimize')")
+        return sessions, entries
+
+
+def main():
+    from journal_store import DEFAULT_DB_PATH as JOURNAL_DB_PATH, JournalStore
+
+    parser = argparse.ArgumentParser(description="Search index for Serenity chats and journals.")
+    parser.add_argument("--rebuild", action="store_true", help="Re-index chat_history/ and the journal")
+    parser.add_argument("--history-dir", default=chat_store.HISTORY_DIR)
+    parser.add_argument("--journal-db", default=JOURNAL_DB_PATH)
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    parser.add_argument("--user", help="Search this user's chats and journal (their key, e.g. browser:<nonce>);"
+                                       " without it, chats saved before per-user storage")
+    parser.add_argument("query", nargs="*", help="Search for these words instead")
+    args = parser.parse_args()
+
+    index = SearchIndex(args.db)
+    if args.rebuild:
+        sessions, entries = index.rebuild(args.history_dir, JournalStore(args.journal_db))
+        print(f"indexed {sessions} sessions and {entries} journal entries into {args.db}")
+    if args.query:
+        for hit in index.search(" ".join(args.query), user_id=args.user, limit=20):
+            print(f"[{hit['kind']} {hit['ref']}] {hit['title']} ({hit['date']}): {hit['snippet']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Throttled rendering of a streamed reply into a Streamlit placeholder.
+
+Re-rendering the whole reply on every chunk sends O(n^2) bytes over the
+websocket for an n-byte reply. `StreamRenderer` keeps the chunks in a list
+and redraws the placeholder at most once per `interval` seconds, or sooner
+once `flush_bytes` of new text are waiting. The first chunk is always drawn
+straight away so time-to-first-token is unchanged, and `finish` always does
+a final draw. `stats` records how many redraws happened and how many bytes
+they sent, next to what per-chunk redrawing would have sent.
+
+`render_bubble` builds the HTML of a finished chat message. It lives here
+rather than in main.py because Streamlit executes main.py afresh on every
+rerun, which would throw its cache away each time.
+"""
+import functools
+import time
+
+
+@functools.lru_cache(maxsize=4096)
+def render_bubble(role, content, timestamp):
+    """Chat bubble HTML; cached by message content so reruns don't rebuild it."""
+    bubble_class = "user-bubble" if role == "user" else "bot-bubble"
+    safe_content = content.replace("\n", "<br>")
+    return f'<div class="{bubble_class}">{safe_content}<div class="timestamp">{timestamp}</div></div>\n'
+
+
+class StreamRenderer:
+    """Buffers reply chunks and redraws a placeholder on a frame budget."""
+
+    def __init__(self, placeholder, interval=0.1, flush_bytes=512, template="🌿 {} ..."):
+        self.placeholder = placeholder
+        self.interval = interval
+        self.flush_bytes = flush_bytes
+        self.template = template
+        self._parts = []
+        self._length = 0  # bytes of text so far
+        self._pending = 0  # bytes not drawn yet
+        self._flushed_at = None
+        self.stats = {"chunks": 0, "flushes": 0, "bytes_sent": 0, "bytes_per_chunk_rendering": 0}
+
+    @property
+    def text(self):
+        if len(self._parts) > 1:
+            # Collapse, so each join only copies what arrived since the last one
+            self._parts = ["".join(self._parts)]
+        return self._parts[0] if self._parts else ""
+
+    def write(self, chunk):
+        """Add one chunk; redraws only when the frame interval or byte threshold is reached."""
+        if not chunk:
+            return
+        size = len(chunk.encode("utf-8"))
+        self._parts.append(chunk)
+        self._length += size
+        self._pending += size
+        self.stats["chunks"] += 1
+        self.stats["bytes_per_chunk_rendering"] += len(self.template.encode("utf-8")) - 2 + self._length
+        now = time.monotonic()
+        if (
+            self._flushed_at is None
+            or now - self._flushed_at >= self.interval
+            or self._pending >= self.flush_bytes
+        ):
+            self.flush()
+
+    def _draw(self, markup, **kwargs):
+        self.placeholder.markdown(markup, **kwargs)
+        self._pending = 0
+        self._flushed_at = time.monotonic()
+        self.stats["flushes"] += 1
+        self.stats["bytes_sent"] += len(markup.encode("utf-8"))
+
+    def flush(self):
+        """Draw the reply so far with the streaming template."""
+        self._draw(self.template.format(self.text))
+
+    def finish(self, render_final=None):
+        """Final draw; returns the full reply text.
+
+        `render_final(text)` returns the finished markup (HTML allowed); without
+        it, any text not yet on screen is drawn with the streaming template.
+        """
+        text = self.text
+        if render_final is not None:
+            markup = render_final(text)
+            self._draw(markup, unsafe_allow_html=True)
+            self.stats["bytes_per_chunk_rendering"] += len(markup.encode("utf-8"))
+        elif self._pending:
+            self.flush()
+        return text
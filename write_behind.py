@@ -0,0 +1,152 @@
+"""Write-behind queue for disk writes that should not hold up a user's turn.
+
+`WriteBehind.submit(key, job)` queues a job and returns at once; one worker
+thread runs the queue in batches. A job submitted while an earlier job with
+the same key is still waiting replaces it, so a burst of saves of one chat
+costs a single write. Jobs do their own atomic write-then-rename and return
+the paths they touched; after each batch every such file and its directory
+is fsynced once, instead of once per write. A job that raises is kept for
+the next batch unless a newer job for its key has arrived. `flush` waits
+until everything submitted so far is written, and `close` (also run at
+exit) drains the queue. `snapshot` reports queue depth and flush latency.
+"""
+import atexit
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+def fsync_paths(paths):
+    """fsync each file and each directory holding one (so renames and unlinks are durable); returns the count."""
+    targets = set()
+    for path in paths:
+        targets.add(path)
+        targets.add(os.path.dirname(path) or ".")
+    synced = 0
+    for target in sorted(targets):
+        try:
+            fd = os.open(target, os.O_RDONLY)
+        except OSError:
+            # Deleted since, or a directory on a platform that cannot open one
+            continue
+        try:
+            os.fsync(fd)
+            synced += 1
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+    return synced
+
+
+class WriteBehind:
+    """Coalescing job queue drained by a background thread."""
+
+    def __init__(self, delay=0.05, retry_delay=1.0, on_flush=None):
+        # How long the worker lets a burst of saves collect before writing them
+        self.delay = delay
+        self.retry_delay = retry_delay
+        # on_flush(seconds, jobs, oldest_wait) is called after every batch
+        self.on_flush = on_flush
+        self._pending = OrderedDict()  # key -> (job, first submitted at)
+        self._cond = threading.Condition()
+        self._writing = 0  # jobs in the batch being written
+        self._closed = False
+        self.stats = {
+            "submitted": 0, "coalesced": 0, "written": 0, "errors": 0, "batches": 0,
+            "fsyncs": 0, "max_queue_depth": 0, "last_flush_ms": 0.0, "max_flush_ms": 0.0,
+        }
+
+        self._worker = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._worker.start()
+        atexit.register(self.close)
+
+    def submit(self, key, job):
+        """Queue `job()` under `key`, replacing a job with the same key that has not run yet."""
+        with self._cond:
+            self.stats["submitted"] += 1
+            if key in self._pending:
+                self.stats["coalesced"] += 1
+                submitted_at = self._pending[key][1]
+            else:
+                submitted_at = time.monotonic()
+            self._pending[key] = (job, submitted_at)
+            self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], len(self._pending))
+            self._cond.notify_all()
+        if self._closed:
+            # Too late for the worker; write it now
+            self._write_batch()
+
+    def _write_batch(self):
+        with self._cond:
+            while self._writing:
+                self._cond.wait()
+            batch, self._pending = list(self._pending.items()), OrderedDict()
+            if not batch:
+                return 0
+            self._writing = len(batch)
+        started = time.perf_counter()
+        paths, failed, synced = set(), [], 0
+        try:
+            for key, (job, submitted_at) in batch:
+                try:
+                    paths.update(job() or ())
+                except Exception:
+                    failed.append((key, job, submitted_at))
+            synced = fsync_paths(paths)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._cond:
+                for key, job, submitted_at in failed:
+                    # A newer job for the same key supersedes the failed one
+                    if key not in self._pending:
+                        self._pending[key] = (job, submitted_at)
+                self._writing = 0
+                self.stats["written"] += len(batch) - len(failed)
+                self.stats["errors"] += len(failed)
+                self.stats["batches"] += 1
+                self.stats["fsyncs"] += synced
+                self.stats["last_flush_ms"] = round(elapsed * 1000, 3)
+                self.stats["max_flush_ms"] = max(self.stats["max_flush_ms"], self.stats["last_flush_ms"])
+                self._cond.notify_all()
+        if self.on_flush is not None:
+            oldest = min(submitted_at for _, (_, submitted_at) in batch)
+            self.on_flush(elapsed, len(batch), time.monotonic() - oldest)
+        return len(batch) - len(failed)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                # Let a burst of saves collect; close() cuts the wait short
+                if self._closed or self._cond.wait_for(lambda: self._closed, self.delay):
+                    return
+            errors = self.stats["errors"]
+            self._write_batch()
+            if self.stats["errors"] > errors:
+                time.sleep(self.retry_delay)
+
+    def flush(self):
+        """Write everything queued so far and wait for it; returns False if some job keeps failing."""
+        self._write_batch()
+        with self._cond:
+            return not self._pending
+
+    def close(self):
+        """Stop the worker and write out anything still queued."""
+        if self._closed:
+            return
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._worker.join(timeout=5)
+        self._write_batch()
+
+    def snapshot(self):
+        """Counters for monitoring, plus the current queue depth."""
+        with self._cond:
+            stats = dict(self.stats)
+            stats["queue_depth"] = len(self._pending) + self._writing
+        return stats